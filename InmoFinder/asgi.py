@@ -9,8 +9,14 @@ https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 
 import os
 
+from django.conf import settings
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'InmoFinder.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Precalienta índice y modelo en el evento lifespan.startup (uvicorn, daphne...)
+from properties.search.warmup import lifespan_app  # noqa: E402
+
+application = lifespan_app(django_application, load_model=getattr(settings, "EMBEDDINGS_WARMUP_MODEL", True))
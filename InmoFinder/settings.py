@@ -187,3 +187,82 @@ else:
 # EMAIL_PORT = 1025
 # EMAIL_USE_TLS = False
 
+
+# Búsqueda semántica: actualizar el índice de embeddings al guardar/borrar
+# propiedades (delta incremental). Desactivar para cargas masivas y luego
+# ejecutar `python manage.py embeddings --build --force`.
+EMBEDDINGS_AUTO_UPDATE = os.environ.get("EMBEDDINGS_AUTO_UPDATE", "True") in ["True", "true", "1"]
+# Compactar el delta en un hilo de fondo al superar el umbral. En False, hay
+# que programar `python manage.py embeddings --compact` (cron).
+EMBEDDINGS_AUTO_COMPACT = os.environ.get("EMBEDDINGS_AUTO_COMPACT", "True") in ["True", "true", "1"]
+# Precisión de la matriz que se recorre en cada búsqueda: float32 | float16 | int8.
+# Ver `python manage.py embeddings --recall-report` para elegirla por despliegue.
+EMBEDDINGS_PRECISION = os.environ.get("EMBEDDINGS_PRECISION", "float32")
+# Abrir la matriz con mmap para compartir el page cache entre workers
+EMBEDDINGS_MMAP = os.environ.get("EMBEDDINGS_MMAP", "True") in ["True", "true", "1"]
+# Backend de vecinos aproximados: auto | exact | ivf. En "auto" se usa IVF
+# cuando el catálogo supera EMBEDDINGS_ANN_MIN_ROWS filas y el índice existe.
+EMBEDDINGS_ANN_BACKEND = os.environ.get("EMBEDDINGS_ANN_BACKEND", "auto")
+EMBEDDINGS_ANN_MIN_ROWS = int(os.environ.get("EMBEDDINGS_ANN_MIN_ROWS", 20000))
+# Listas IVF revisadas por consulta: la perilla recall/latencia
+EMBEDDINGS_IVF_NPROBE = int(os.environ.get("EMBEDDINGS_IVF_NPROBE", 8))
+# Cache de embeddings de consultas: LRU en memoria + tabla SQLite compartida
+# entre workers (None desactiva el nivel en disco)
+EMBEDDINGS_QUERY_CACHE_SIZE = int(os.environ.get("EMBEDDINGS_QUERY_CACHE_SIZE", 2048))
+EMBEDDINGS_QUERY_CACHE_PATH = os.environ.get("EMBEDDINGS_QUERY_CACHE_PATH", "query_embeddings.sqlite3") or None
+# Búsqueda híbrida: fusiona (RRF) el ranking de embeddings con uno léxico BM25
+# para que coincidencias exactas (barrios, códigos) no se pierdan
+EMBEDDINGS_HYBRID = os.environ.get("EMBEDDINGS_HYBRID", "True") in ["True", "true", "1"]
+EMBEDDINGS_RRF_K = int(os.environ.get("EMBEDDINGS_RRF_K", 60))
+# Precalentar también el modelo (además del índice) al arrancar cada worker.
+# Ver gunicorn.conf.py / InmoFinder/asgi.py y el endpoint /properties/ready/
+EMBEDDINGS_WARMUP_MODEL = os.environ.get("EMBEDDINGS_WARMUP_MODEL", "True") in ["True", "true", "1"]
+# Índice versionado: cada build/compactación crea search_index/versions/<versión>/
+# con su manifest.json y se activa reescribiendo search_index/CURRENT. Los
+# workers cargan la versión nueva en la siguiente búsqueda, sin reiniciar.
+EMBEDDINGS_INDEX_DIR = os.environ.get("EMBEDDINGS_INDEX_DIR", "search_index")
+EMBEDDINGS_KEEP_VERSIONS = int(os.environ.get("EMBEDDINGS_KEEP_VERSIONS", 3))
+# Build en streaming (`embeddings --build`): filas por lote/shard y procesos
+# que codifican en paralelo (1 = sin pool, 0 = uno por núcleo). Cada proceso
+# carga su propia copia del modelo y de torch (cientos de MB de RAM), y nunca se
+# usan más procesos que lotes. Un build interrumpido continúa desde
+# search_index/build/checkpoint.json.
+EMBEDDINGS_BUILD_BATCH = int(os.environ.get("EMBEDDINGS_BUILD_BATCH", 1024))
+EMBEDDINGS_BUILD_WORKERS = int(os.environ.get("EMBEDDINGS_BUILD_WORKERS", 1))
+# Servicio de codificación (`python manage.py encoder_service`): un proceso con
+# el modelo cargado que atiende a todos los workers por un socket Unix y junta
+# las consultas concurrentes en micro-lotes. Sin socket (o si no responde)
+# cada worker usa su propio modelo.
+EMBEDDINGS_ENCODER_SOCKET = os.environ.get("EMBEDDINGS_ENCODER_SOCKET") or None
+EMBEDDINGS_ENCODER_TIMEOUT = float(os.environ.get("EMBEDDINGS_ENCODER_TIMEOUT", 2.0))
+EMBEDDINGS_ENCODER_MAX_WAIT_MS = float(os.environ.get("EMBEDDINGS_ENCODER_MAX_WAIT_MS", 5))
+EMBEDDINGS_ENCODER_MAX_BATCH = int(os.environ.get("EMBEDDINGS_ENCODER_MAX_BATCH", 64))
+# Cache de resultados del buscador (lista ordenada de ids por búsqueda+filtros+orden).
+# Las señales de Propiedad/MediaPropiedad la invalidan; con varios workers el
+# alias debe apuntar a una cache compartida (Redis, Memcached, FileBasedCache).
+# TTL 0 la desactiva.
+SEARCH_RESULT_CACHE = os.environ.get("SEARCH_RESULT_CACHE", "default")
+SEARCH_RESULT_CACHE_TTL = int(os.environ.get("SEARCH_RESULT_CACHE_TTL", 300))
+# Personalización: peso del vector de preferencias (favoritos + vistas) en el
+# puntaje del buscador (0 la desactiva) y vida del perfil en la misma cache.
+SEARCH_PERSONALIZATION_WEIGHT = float(os.environ.get("SEARCH_PERSONALIZATION_WEIGHT", 0.3))
+SEARCH_PREFERENCES_TTL = int(os.environ.get("SEARCH_PREFERENCES_TTL", 30 * 24 * 3600))
+# Métricas del buscador: cabecera Server-Timing por etapa en /buscar/ y
+# endpoint Prometheus en /properties/metrics/ (con token, si se define).
+SEARCH_SERVER_TIMING = os.environ.get("SEARCH_SERVER_TIMING", "True") in ["True", "true", "1"]
+SEARCH_METRICS_TOKEN = os.environ.get("SEARCH_METRICS_TOKEN") or None
+# Sugerencias del buscador (/properties/suggest/): el índice de prefijos se
+# reconstruye al cambiar el índice de búsqueda y cada tantos segundos.
+SEARCH_SUGGEST_REFRESH = int(os.environ.get("SEARCH_SUGGEST_REFRESH", 600))
+# Visitantes distintos (usuario o IP) que deben buscar una consulta para que
+# aparezca entre las sugerencias populares.
+SEARCH_SUGGEST_MIN_VISITORS = int(os.environ.get("SEARCH_SUGGEST_MIN_VISITORS", 3))
+# Filtros escritos en el texto del buscador ("2 habitaciones menos de 500
+# millones"): se aplican como filtros y sólo se codifica el resto.
+SEARCH_PARSE_QUERY = os.environ.get("SEARCH_PARSE_QUERY", "True") in ["True", "true", "1"]
+# Listados paginados por keyset (buscador sin texto y dashboards): mostrar un
+# total aproximado ("About N results") con un COUNT cacheado por filtro.
+SEARCH_APPROX_COUNTS = os.environ.get("SEARCH_APPROX_COUNTS", "True") in ["True", "true", "1"]
+# Búsqueda con texto y orden explícito (precio, fecha...): cuántos de los
+# resultados más relevantes se ordenan (la página avisa cuando se llega al tope).
+SEARCH_SORT_CANDIDATES = int(os.environ.get("SEARCH_SORT_CANDIDATES", 500))
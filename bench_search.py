@@ -0,0 +1,419 @@
+"""
+Benchmark del buscador sobre corpus sintéticos de tamaño configurable.
+
+Para cada tamaño genera propiedades sintéticas en una BD de prueba
+desechable, construye el índice con el build real usando un codificador
+sintético (bolsa de palabras con vectores aleatorios fijos, sin descargar
+el modelo) y mide por separado, como p50/p95/p99 en ms:
+
+  - encode:  codificar la consulta (``_codificar_consultas``, sin cache)
+  - score:   similitud contra la base (``_puntuar_base``)
+  - topk:    selección de los k mejores (``_top_vectorial``)
+  - lexical: candidatos BM25 (sólo con ``EMBEDDINGS_HYBRID``)
+  - hydrate: traer de la BD las propiedades del top-k (sin media: la portada
+             está desnormalizada en ``Propiedad``)
+  - view:    la vista ``buscar`` completa (cliente de test, sin cache de resultados)
+  - rank_sql_N / rank_py_N: N propiedades en un orden dado, con el
+    ``ORDER BY CASE WHEN id=...`` de antes frente a ``search/hydrate.py``
+    (``id__in`` y orden en Python), para N = 100 y 1.000
+
+Además reporta el RSS máximo del build y de la fase de búsqueda (cada una en
+su propio proceso, así no se mezclan) y el recall@k del motor configurado
+(precisión/IVF) frente a la búsqueda exacta en float32.
+
+    python bench_search.py --sizes 1000 10000 100000 --json bench.json
+    python bench_search.py --sizes 100000 --precision int8 --ann ivf
+    python bench_search.py --sizes 10000 --json nuevo.json --compare bench.json
+
+``--compare`` imprime la razón nuevo/base por etapa y termina con código 1
+si alguna supera ``--max-ratio`` (para detectar regresiones entre commits).
+"""
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+RANK_SIZES = (100, 1000)
+STAGES = ("encode", "score", "topk", "lexical", "hydrate", "view") + tuple(
+    f"rank_{modo}_{n}" for n in RANK_SIZES for modo in ("sql", "py")
+)
+PERCENTILES = (50, 95, 99)
+
+TIPOS = ["Apartamento", "Casa", "Lote", "Oficina", "Otro"]
+BARRIOS = [
+    "Laureles", "El Poblado", "Envigado", "Belén", "Sabaneta", "Robledo", "La América", "Buenos Aires",
+    "Itagüí", "Bello", "Manrique", "Castilla", "Estadio", "Calasanz", "Conquistadores", "Las Palmas",
+]
+AMENIDADES = [
+    "piscina", "jardín", "terraza", "balcón", "gimnasio", "chimenea", "vigilancia", "ascensor",
+    "parqueadero cubierto", "zona BBQ", "vista a la ciudad", "cocina integral", "estudio", "patio",
+    "salón social", "parque infantil", "cancha", "sauna", "turco", "depósito",
+]
+ADJETIVOS = ["amplio", "iluminado", "remodelado", "moderno", "económico", "tranquilo", "central", "nuevo", "acogedor"]
+
+
+# ---------- CORPUS SINTÉTICO ----------
+class HashingEncoder:
+    """Codificador sintético: suma de un vector aleatorio fijo por palabra.
+
+    Los textos que comparten palabras quedan cerca, así que el ranking y el
+    recall tienen estructura como con el modelo real, pero sin descargarlo.
+    """
+
+    def __init__(self, dim=384):
+        self.dim = dim
+        self._vocab = {}
+        self._rows = []
+
+    def _ids(self, text):
+        from properties.search.bm25 import tokenize
+        ids = []
+        for tok in tokenize(text):
+            idx = self._vocab.get(tok)
+            if idx is None:
+                seed = int.from_bytes(hashlib.blake2b(tok.encode("utf-8"), digest_size=8).digest(), "little")
+                self._rows.append(np.random.default_rng(seed).standard_normal(self.dim).astype(np.float32))
+                idx = self._vocab[tok] = len(self._rows) - 1
+            ids.append(idx)
+        return ids
+
+    def encode(self, texts, convert_to_numpy=True, normalize_embeddings=False, **kwargs):
+        ids = [self._ids(text) for text in texts]
+        vocab = np.vstack(self._rows) if self._rows else np.zeros((0, self.dim), np.float32)
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, row in enumerate(ids):
+            if row:
+                out[i] = vocab[row].sum(axis=0)
+        if normalize_embeddings:
+            norms = np.linalg.norm(out, axis=1, keepdims=True)
+            out /= np.where(norms > 0, norms, 1.0)
+        return out
+
+
+def _propiedades(rng, n):
+    from properties.models import Propiedad
+    for i in range(n):
+        tipo = TIPOS[rng.integers(len(TIPOS))]
+        barrio = BARRIOS[rng.integers(len(BARRIOS))]
+        amenidades = [AMENIDADES[j] for j in rng.choice(len(AMENIDADES), size=rng.integers(1, 6), replace=False)]
+        adjetivo = ADJETIVOS[rng.integers(len(ADJETIVOS))]
+        area = int(rng.integers(30, 400))
+        yield Propiedad(
+            title=f"{tipo} {adjetivo} en {barrio}", location=f"{barrio}, Medellín", property_type=tipo,
+            description=f"{tipo} {adjetivo} con {', '.join(amenidades)}.", amenities=amenidades,
+            area_m2=area, area_privada_m2=area, rooms=int(rng.integers(1, 6)), bathrooms=int(rng.integers(1, 4)),
+            parking_spaces=int(rng.integers(0, 3)), floor=int(rng.integers(1, 30)), estrato=int(rng.integers(1, 7)),
+            price_cop=int(rng.integers(80, 3000)) * 1_000_000, pets_allowed=bool(rng.integers(2)),
+            furnished=bool(rng.integers(2)), codigo_fincaraiz=f"FR{i:08d}",
+        )
+
+
+def _consultas(rng, n):
+    out = []
+    for i in range(n):
+        tipo = TIPOS[rng.integers(len(TIPOS))].lower()
+        amenidad = AMENIDADES[rng.integers(len(AMENIDADES))]
+        barrio = BARRIOS[rng.integers(len(BARRIOS))]
+        # El sufijo numérico hace única cada consulta: nunca pega en la cache
+        out.append(f"{tipo} con {amenidad} en {barrio} {i}")
+    return out
+
+
+# ---------- MEDICIÓN ----------
+def peak_rss_mb():
+    """RSS máximo del proceso en MB (None donde ``resource`` no existe)."""
+    try:
+        import resource
+    except ImportError:  # pragma: no cover - Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux lo da en KB, macOS en bytes
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def resumen(times_ms):
+    if not times_ms:
+        return None
+    values = np.percentile(times_ms, PERCENTILES)
+    out = {f"p{p}": round(float(v), 3) for p, v in zip(PERCENTILES, values)}
+    out.update(mean=round(float(np.mean(times_ms)), 3), n=len(times_ms))
+    return out
+
+
+class Timer:
+    def __init__(self):
+        self.times = {stage: [] for stage in STAGES}
+
+    @contextlib.contextmanager
+    def __call__(self, stage):
+        start = time.perf_counter()
+        yield
+        self.times[stage].append(1000.0 * (time.perf_counter() - start))
+
+
+# ---------- FASES (cada una en su propio proceso) ----------
+def _setup(workdir, args):
+    """Django con BD e índice desechables dentro de ``workdir``."""
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "InmoFinder.settings")
+    import django
+    django.setup()
+    from django.db import connection
+    from django.test.utils import override_settings, setup_test_environment
+    from properties.management.commands import embeddings as emb
+
+    setup_test_environment()
+    if connection.vendor == "sqlite":
+        connection.settings_dict.setdefault("TEST", {})["NAME"] = os.path.join(workdir, "bench.sqlite3")
+    override_settings(
+        EMBEDDINGS_INDEX_DIR=os.path.join(workdir, "index"),
+        EMBEDDINGS_QUERY_CACHE_PATH=os.path.join(workdir, "queries.sqlite3"),
+        EMBEDDINGS_ENCODER_SOCKET=None,
+        EMBEDDINGS_PRECISION=args.precision,
+        EMBEDDINGS_ANN_BACKEND=args.ann,
+        EMBEDDINGS_HYBRID=not args.no_hybrid,
+        SEARCH_RESULT_CACHE_TTL=0,
+    ).enable()
+    emb.DELTA_PATH = os.path.join(workdir, "delta.npz")
+    emb.LEGACY_PATHS = (os.path.join(workdir, "legacy.npy"), os.path.join(workdir, "legacy.joblib"))
+    if not args.model:
+        emb._model = HashingEncoder(args.dim)
+    return connection, emb
+
+
+def fase_build(workdir, n, args):
+    connection, emb = _setup(workdir, args)
+    from properties.models import Propiedad
+
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=False)
+    rng = np.random.default_rng(args.seed)
+    start = time.perf_counter()
+    batch = []
+    for prop in _propiedades(rng, n):
+        batch.append(prop)
+        if len(batch) >= 5000:
+            Propiedad.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        Propiedad.objects.bulk_create(batch)
+    db_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        # Con --ann ivf el build entrena también el índice IVF
+        emb.load_or_generate_embeddings(force=True, resume=False, reuse=False)
+    seconds = time.perf_counter() - start
+    return {
+        "db_seconds": round(db_seconds, 2), "seconds": round(seconds, 2),
+        "rows_per_sec": round(n / seconds, 1) if seconds else None, "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def fase_search(workdir, n, args):
+    connection, emb = _setup(workdir, args)
+    from django.db.models import Case, IntegerField, When
+    from django.test import Client
+    from django.urls import reverse
+    from properties.models import Propiedad
+    from properties.search import hydrate
+
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=True)
+    rng = np.random.default_rng(args.seed + 1)
+    k = args.top_k
+
+    start = time.perf_counter()
+    emb._asegurar_indice()
+    load_seconds = time.perf_counter() - start
+    hibrido = emb._bm25 is not None and emb._hibrido()
+    client = Client()
+    all_ids = np.asarray(emb._ids_cache)
+
+    timer = Timer()
+    queries = _consultas(rng, args.queries + args.warmup)
+    for i, query in enumerate(queries):
+        medir = timer if i >= args.warmup else Timer()  # las primeras sólo calientan
+        with medir("encode"):
+            query_vec = emb._codificar_consultas([query])
+        base_mask, delta_mask = emb._mascaras(None)
+        with medir("score"):
+            rows, sims = emb._puntuar_base(query_vec, base_mask)[0]
+        with medir("topk"):
+            hits = emb._top_vectorial(sims, rows, len(sims), k)
+        if hibrido:
+            with medir("lexical"):
+                emb._top_lexico(query, max(k, emb.HYBRID_CANDIDATES), base_mask, delta_mask)
+        ids = [pk for pk, _ in hits]
+        with medir("hydrate"):
+            hydrate.hydrate(ids)
+        for size in RANK_SIZES:
+            if size > len(all_ids):
+                continue
+            ranked = [int(pk) for pk in rng.choice(all_ids, size, replace=False)]
+            with medir(f"rank_sql_{size}"):
+                whens = [When(id=pk, then=pos) for pos, pk in enumerate(ranked)]
+                list(Propiedad.objects.filter(id__in=ranked).order_by(Case(*whens, output_field=IntegerField())))
+            with medir(f"rank_py_{size}"):
+                hydrate.hydrate(ranked)
+        with medir("view"):
+            response = client.get(reverse("buscar"), {"search": f"{query} vista"})
+        if response.status_code != 200:
+            raise RuntimeError(f"La vista respondió {response.status_code} para {query!r}")
+    rss = peak_rss_mb()  # antes del recall, que lee la matriz completa en float32
+
+    return {
+        "load_seconds": round(load_seconds, 3),
+        "stages": {stage: resumen(times) for stage, times in timer.times.items() if times},
+        "peak_rss_mb": rss,
+        "index_mb": round(emb._store.nbytes / (1024 * 1024), 1),
+        "recall": recall(emb, rng, k, args.recall_queries),
+    }
+
+
+def recall(emb, rng, k, n_queries):
+    """recall@k del motor configurado frente al coseno exacto en float32."""
+    exact = np.load(emb._ruta(emb.EMBED_PATH), mmap_mode="r")
+    query_vecs = emb._codificar_consultas(_consultas(rng, n_queries))
+    k = min(k, len(exact))
+    sims = np.empty((len(query_vecs), len(exact)), dtype=np.float32)
+    for start in range(0, len(exact), 65536):  # por bloques: acota la memoria temporal
+        sims[:, start:start + 65536] = query_vecs @ np.asarray(exact[start:start + 65536], dtype=np.float32).T
+    from properties.search.store import top_k
+    esperados = top_k(sims, k)
+    hits = 0
+    for fila, obtenidos in zip(esperados, emb._rankear(query_vecs, k)):
+        esperado = {emb._ids_cache[j] for j in fila}
+        hits += len(esperado & {hit["id"] for hit in obtenidos})
+    return {"k": k, "queries": len(query_vecs), "recall": round(hits / float(k * len(query_vecs)), 4)}
+
+
+# ---------- ORQUESTACIÓN ----------
+def _hijo(phase, workdir, n, args):
+    """Ejecuta una fase en un proceso nuevo y devuelve su JSON."""
+    out = os.path.join(workdir, f"{phase}.json")
+    cmd = [sys.executable, os.path.abspath(__file__), "--phase", phase, "--workdir", workdir,
+           "--sizes", str(n), "--json", out] + _flags(args)
+    subprocess.run(cmd, check=True)
+    with open(out, "r", encoding="utf-8") as fh:
+        return json.load(fh)
+
+
+def _flags(args):
+    flags = ["--dim", str(args.dim), "--top-k", str(args.top_k), "--queries", str(args.queries),
+             "--warmup", str(args.warmup), "--recall-queries", str(args.recall_queries), "--seed", str(args.seed),
+             "--precision", args.precision, "--ann", args.ann]
+    if args.no_hybrid:
+        flags.append("--no-hybrid")
+    if args.model:
+        flags.append("--model")
+    return flags
+
+
+def _meta(args):
+    def git(*cmd):
+        try:
+            return subprocess.run(["git", *cmd], capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+    return {
+        "commit": git("rev-parse", "HEAD"), "dirty": bool(git("status", "--porcelain", "--untracked-files=no")),
+        "date": datetime.now(timezone.utc).isoformat(), "python": platform.python_version(),
+        "numpy": np.__version__, "platform": platform.platform(), "cpus": os.cpu_count(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("phase", "workdir", "json", "compare")},
+    }
+
+
+def imprimir(run):
+    print(f"\n{run['rows']:,} propiedades — build {run['build']['seconds']}s "
+          f"({run['build']['rows_per_sec']} filas/s, RSS máx. {run['build']['peak_rss_mb']} MB)")
+    search = run["search"]
+    print(f"  {'etapa':<13} | {'p50':>9} | {'p95':>9} | {'p99':>9}  (ms)")
+    for stage, stats in search["stages"].items():
+        print(f"  {stage:<13} | {stats['p50']:>9.3f} | {stats['p95']:>9.3f} | {stats['p99']:>9.3f}")
+    r = search["recall"]
+    print(f"  recall@{r['k']}: {r['recall']:.4f} | índice {search['index_mb']} MB | "
+          f"RSS máx. búsqueda {search['peak_rss_mb']} MB")
+
+
+def comparar(actual, base, max_ratio):
+    """Imprime nuevo/base (p50 y p95) por tamaño y etapa. Devuelve las regresiones."""
+    previos = {run["rows"]: run for run in base.get("runs", [])}
+    regresiones = []
+    print(f"\nComparación con {base.get('meta', {}).get('commit') or 'base'} (nuevo/base):")
+    for run in actual["runs"]:
+        previo = previos.get(run["rows"])
+        if previo is None:
+            continue
+        for stage, stats in run["search"]["stages"].items():
+            old = previo["search"]["stages"].get(stage)
+            if not old:
+                continue
+            ratios = {p: stats[p] / old[p] if old[p] else None for p in ("p50", "p95")}
+            marca = ""
+            if any(r is not None and r > max_ratio for r in ratios.values()):
+                marca = "  <-- regresión"
+                regresiones.append((run["rows"], stage))
+            print(f"  {run['rows']:>9,} {stage:<13} p50 x{ratios['p50'] or 0:.2f}  p95 x{ratios['p95'] or 0:.2f}{marca}")
+        delta = run["search"]["recall"]["recall"] - previo["search"]["recall"]["recall"]
+        print(f"  {run['rows']:>9,} {'recall':<13} {delta:+.4f}")
+    return regresiones
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--dim", type=int, default=384, help="Dimensión del codificador sintético")
+    parser.add_argument("--top-k", type=int, default=100)
+    parser.add_argument("--queries", type=int, default=200, help="Consultas medidas por tamaño")
+    parser.add_argument("--warmup", type=int, default=5, help="Consultas de calentamiento (no se miden)")
+    parser.add_argument("--recall-queries", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--precision", default="float32", choices=["float32", "float16", "int8"])
+    parser.add_argument("--ann", default="exact", choices=["exact", "ivf", "auto"])
+    parser.add_argument("--no-hybrid", action="store_true", help="Sólo ranking vectorial (sin BM25 ni RRF)")
+    parser.add_argument("--model", action="store_true", help="Usar el modelo real en vez del codificador sintético")
+    parser.add_argument("--json", type=str, help="Archivo donde guardar los resultados")
+    parser.add_argument("--compare", type=str, help="JSON de una corrida anterior para comparar")
+    parser.add_argument("--max-ratio", type=float, default=1.2, help="Razón nuevo/base que cuenta como regresión")
+    parser.add_argument("--phase", choices=["build", "search"], help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.phase:
+        fase = fase_build if args.phase == "build" else fase_search
+        result = fase(args.workdir, args.sizes[0], args)
+        with open(args.json, "w", encoding="utf-8") as fh:
+            json.dump(result, fh)
+        return
+
+    report = {"meta": _meta(args), "runs": []}
+    for n in args.sizes:
+        workdir = tempfile.mkdtemp(prefix=f"bench-{n}-")
+        try:
+            run = {"rows": n, "build": _hijo("build", workdir, n, args), "search": _hijo("search", workdir, n, args)}
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+        report["runs"].append(run)
+        imprimir(run)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2, ensure_ascii=False)
+        print(f"\nResultados en {args.json}")
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as fh:
+            if comparar(report, json.load(fh), args.max_ratio):
+                sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
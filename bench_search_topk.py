@@ -0,0 +1,69 @@
+"""
+Micro-benchmark del camino caliente de la búsqueda (puntaje + top-k).
+
+Compara, sobre matrices sintéticas de 384 dimensiones (las de all-MiniLM-L6-v2):
+  - antes:   cosine_similarity de sklearn (re-normaliza la matriz en cada
+             consulta) + np.argsort completo de las N filas.
+  - después: matriz ya normalizada en el build → un producto matriz-vector
+             + np.argpartition y orden sólo de los k ganadores.
+
+No necesita Django ni el modelo. Ejecutar:
+    python bench_search_topk.py [--sizes 10000 100000 1000000] [--top-k 100]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from properties.search.store import normalize_rows, top_k
+
+try:
+    from sklearn.metrics.pairwise import cosine_similarity
+except ImportError:  # sin sklearn se reproduce lo mismo que hace internamente
+    def cosine_similarity(a, b):
+        return normalize_rows(a) @ normalize_rows(b).T
+
+
+def antes(matrix, query, k):
+    sims = cosine_similarity(query, matrix).flatten()
+    return np.argsort(-sims)[:k]
+
+
+def despues(normalized, query, k):
+    sims = normalized @ normalize_rows(query)[0]
+    return top_k(sims, k)
+
+
+def medir(fn, *args, repeats=20):
+    fn(*args)  # calentamiento
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn(*args)
+        times.append(time.perf_counter() - start)
+    return 1000.0 * float(np.median(times))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--top-k", type=int, default=100)
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'filas':>10} | {'antes (ms)':>10} | {'después (ms)':>12} | {'mejora':>7}")
+    for n in args.sizes:
+        matrix = rng.standard_normal((n, args.dim), dtype=np.float32)
+        normalized = normalize_rows(matrix)
+        query = rng.standard_normal((1, args.dim), dtype=np.float32)
+        t_antes = medir(antes, matrix, query, args.top_k, repeats=args.repeats)
+        t_despues = medir(despues, normalized, query, args.top_k, repeats=args.repeats)
+        assert set(antes(matrix, query, args.top_k)) == set(despues(normalized, query, args.top_k))
+        print(f"{n:>10,} | {t_antes:>10.2f} | {t_despues:>12.2f} | {t_antes / t_despues:>6.1f}x")
+        del matrix, normalized
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+"""
+Configuración de gunicorn para producción.
+
+    gunicorn InmoFinder.wsgi            # lee este archivo automáticamente
+    gunicorn --preload InmoFinder.wsgi  # índice cargado una vez en el master
+
+Con ``--preload`` (o ``GUNICORN_PRELOAD=1``) el índice de embeddings se carga
+en el master antes de crear los workers, que lo heredan copy-on-write. El
+modelo se carga siempre en cada worker, ya con Django cargado
+(``post_worker_init``, justo después del fork y antes de aceptar peticiones):
+torch no es seguro entre fork y sus hilos internos.
+
+Con ``EMBEDDINGS_ENCODER_SOCKET`` y ``manage.py encoder_service`` corriendo,
+los workers no cargan el modelo: codifican a través de ese servicio.
+"""
+import os
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("GUNICORN_WORKERS", 2))
+preload_app = os.environ.get("GUNICORN_PRELOAD", "False") in ["True", "true", "1"]
+# Cargar el modelo en el worker puede tardar más que el timeout por defecto (30 s)
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 120))
+
+
+def when_ready(server):
+    # Corre en el master antes del primer fork; sin preload Django aún no está cargado
+    if server.cfg.preload_app:
+        from properties.search.warmup import warmup
+        info = warmup(load_model=False)
+        server.log.info("Índice precargado en el master: %s", info)
+
+
+def post_worker_init(worker):
+    from properties.search.warmup import warmup
+    info = warmup(load_model=True)
+    worker.log.info("Worker %s: búsqueda %s", worker.pid, info["state"])
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Propiedad, MediaPropiedad
+from .models import Barrio, Municipio, Propiedad, MediaPropiedad
 
 
 class MediaPropiedadInline(admin.TabularInline):
@@ -10,7 +10,8 @@ class MediaPropiedadInline(admin.TabularInline):
 
 @admin.register(Propiedad)
 class PropiedadAdmin(admin.ModelAdmin):
-    list_display  = ("id", "title", "location", "price_cop", "price_m2_display")
+    list_display  = ("id", "title", "location", "barrio", "municipio", "price_cop", "price_m2_display")
+    list_filter   = ("municipio",)
     search_fields = ("title", "location")
     inlines       = [MediaPropiedadInline]
     # Si quieres mantenerlo como solo lectura en el detalle:
@@ -23,3 +24,17 @@ class MediaPropiedadAdmin(admin.ModelAdmin):
     list_filter   = ("tipo",)        # <-- tupla
     search_fields = ("propiedad__title", "url", "archivo")
     ordering      = ("-id",)         # <-- tupla
+
+
+@admin.register(Barrio)
+class BarrioAdmin(admin.ModelAdmin):
+    list_display  = ("nombre", "comuna", "municipio")
+    list_filter   = ("municipio",)
+    search_fields = ("nombre",)
+    ordering      = ("municipio", "nombre")
+
+
+@admin.register(Municipio)
+class MunicipioAdmin(admin.ModelAdmin):
+    list_display  = ("nombre", "slug")
+    ordering      = ("nombre",)
@@ -9,15 +9,20 @@ class PropertiesConfig(AppConfig):
         """
         Pre-cargar embeddings en memoria al iniciar el servidor.
         Esto evita la latencia en la primera búsqueda.
+        También registra las señales que mantienen el índice incremental.
         """
-        # Solo ejecutar en el proceso principal (no en runserver reloader)
+        from . import signals  # noqa: F401
+
+        # Solo ejecutar en el proceso principal (no en runserver reloader).
+        # En producción lo hacen los hooks de gunicorn.conf.py / asgi.py.
         import os
         if os.environ.get('RUN_MAIN') == 'true' or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
-            try:
-                from properties.management.commands.embeddings import _load_embeddings_to_cache
-                print("🔄 Pre-cargando embeddings en memoria...")
-                _load_embeddings_to_cache()
-                print("✅ Embeddings cargados y listos para búsqueda rápida")
-            except Exception as e:
-                print(f"⚠️ No se pudieron pre-cargar embeddings: {e}")
+            from django.conf import settings
+            from properties.search.warmup import warmup
+            print("🔄 Pre-cargando embeddings y modelo en memoria...")
+            info = warmup(load_model=getattr(settings, "EMBEDDINGS_WARMUP_MODEL", True))
+            if info["state"] == "ready":
+                print(f"✅ Búsqueda lista en {info['seconds']}s")
+            else:
+                print(f"⚠️ Precalentamiento incompleto: {info['error']}")
                 print("   (La búsqueda funcionará con fallback o cargará embeddings en el primer uso)")
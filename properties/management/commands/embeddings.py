@@ -1,120 +1,1126 @@
+import json
+import logging
 import os
+import threading
+import time
+from datetime import datetime, timezone
+
 import numpy as np
 import joblib
-from sklearn.metrics.pairwise import cosine_similarity
-from sentence_transformers import SentenceTransformer
 
+from django.conf import settings
 from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max
+from django.utils.dateparse import parse_datetime
 from properties.models import Propiedad
+from properties.search import manifest
+from properties.search.metrics import span
+from properties.search.encoder_service import EncoderClient
+from properties.search.delta import DeltaIndex, file_lock
+from properties.search.ann import IVFIndex, ivf_path, nprobe_report
+from properties.search.attributes import AttributeStore, attrs_path, row_attrs
+from properties.search.build import (
+    Checkpoint, PreviousVectors, default_workers, encode_batches, hashes_path, iter_batches, text_hash,
+)
+from properties.search.knn import KNNTable, knn_path
+from properties.search.bm25 import BM25Index, bm25_path, reciprocal_rank_fusion
+from properties.search.query_cache import QueryEmbeddingCache
+from properties.search.store import VectorStore, normalize_rows, recall_report, top_k as _top_k, write_variant
+
+logger = logging.getLogger(__name__)
 
 # ---------- CONFIG ----------
 EMBED_MODEL_NAME = 'all-MiniLM-L6-v2'
-EMBED_PATH = 'property_embeddings.npy'
+INDEX_DIR = 'search_index'  # versiones del índice (ver properties/search/manifest.py)
+EMBED_PATH = 'property_embeddings.npy'  # nombres de archivo dentro de cada versión
 ID_PATH = 'property_ids.joblib'
+LEGACY_PATHS = (EMBED_PATH, ID_PATH)  # índice sin versionar de builds anteriores (raíz del proyecto)
+KEEP_VERSIONS = 3
+DELTA_PATH = 'property_embeddings_delta.npz'
+QUERY_CACHE_PATH = 'query_embeddings.sqlite3'
 TOP_K = 5
+COMPACT_THRESHOLD = 500  # cambios en el delta antes de compactar en la base (en segundo plano)
+ANN_MIN_ROWS = 20000  # por debajo de esto la fuerza bruta es suficientemente rápida
+IVF_NPROBE = 8  # listas IVF a revisar por consulta (más = mejor recall, más lento)
+BUILD_BATCH = 1024  # filas por lote/shard en --build
+BUILD_WORKERS = 1   # procesos que codifican en --build (cada uno con su modelo)
+BUILD_DIR = 'build'  # checkpoint y shards del build en curso (dentro de INDEX_DIR)
+# Columnas que necesita el build (texto, atributos y BM25) leídas con .values()
+BUILD_FIELDS = (
+    'id', 'title', 'location', 'property_type', 'condition', 'description', 'amenities', 'rooms',
+    'bathrooms', 'area_m2', 'estrato', 'furnished', 'pets_allowed', 'codigo_fincaraiz', 'price_cop',
+    'parking_spaces', 'barrio_id', 'municipio_id',
+)
+HYBRID_CANDIDATES = 100  # candidatos de cada lista (vectorial y BM25) que entran a la fusión
+RRF_K = 60
+KNN_K = 12  # vecinos guardados por propiedad en la tabla de similares
+SIMILARES = 8  # similares que muestra la página de detalle
+RECOMENDADAS = 8  # recomendaciones que muestra el home
+ENCODER_RETRY_SECONDS = 30  # tras un fallo del servicio de codificación, usar el modelo local este tiempo
+ENCODER_MAX_TRANSIENT = 3  # timeouts seguidos del servicio antes de dejar de usarlo
 
 _model = None  # cache para el modelo
-_embeddings_cache = None  # cache para embeddings en memoria
+_query_cache = None  # QueryEmbeddingCache (LRU en memoria + SQLite)
+_encoder_client = None  # EncoderClient del servicio de codificación (si está configurado)
+_encoder_down_until = 0.0  # hasta cuándo no reintentar el servicio (time.monotonic)
+_encoder_transient = 0  # fallos transitorios seguidos del servicio
+_compactando = threading.Event()  # hay una compactación en segundo plano en este proceso
+_embeddings_cache = None  # cache para embeddings en memoria (mmap)
+_store = None  # VectorStore con la precisión configurada
+_ann = None  # IVFIndex activo (None = búsqueda exacta)
+_attrs = None  # AttributeStore alineado con las filas de la base
+_bm25 = None  # BM25Index alineado con las filas de la base
+_bm25_db = None  # (marca, BM25Index) construido desde la BD cuando no hay índice en disco
 _ids_cache = None  # cache para IDs en memoria
+_ids_array = None  # los mismos IDs como np.ndarray (para máscaras vectorizadas)
+_version = None  # versión del índice cargada en memoria
+_knn = None  # (versión, KNNTable) de la tabla de similares
+_delta = None  # DeltaIndex con los cambios posteriores al último build
+_delta_mtime = None
+_alive_mask = None  # filas de la base que no han sido borradas ni reemplazadas
 
 
 def _get_model():
     global _model
     if _model is None:
+        # Import perezoso: cargar torch sólo cuando realmente se necesita
+        from sentence_transformers import SentenceTransformer
         _model = SentenceTransformer(EMBED_MODEL_NAME)
     return _model
 
 
+def _get_query_cache():
+    global _query_cache
+    if _query_cache is None:
+        _query_cache = QueryEmbeddingCache(
+            EMBED_MODEL_NAME,
+            path=getattr(settings, "EMBEDDINGS_QUERY_CACHE_PATH", QUERY_CACHE_PATH),
+            maxsize=getattr(settings, "EMBEDDINGS_QUERY_CACHE_SIZE", 2048),
+        )
+    return _query_cache
+
+
+def _get_encoder_client():
+    """Cliente del servicio de codificación, o None si no hay socket configurado."""
+    global _encoder_client
+    path = getattr(settings, "EMBEDDINGS_ENCODER_SOCKET", None)
+    if not path:
+        return None
+    if _encoder_client is None or _encoder_client.path != path:
+        _encoder_client = EncoderClient(path, timeout=getattr(settings, "EMBEDDINGS_ENCODER_TIMEOUT", 2.0))
+    return _encoder_client
+
+
+def _codificar(texts):
+    """Embeddings normalizados (n, d) de ``texts``.
+
+    Usa el servicio de codificación (``manage.py encoder_service``) si está
+    configurado y responde; si no, el modelo cargado en este proceso. Si el
+    servicio no está (socket inexistente, conexión rechazada, error) no se
+    reintenta durante ``ENCODER_RETRY_SECONDS``; un timeout aislado (p. ej. en
+    una ráfaga) sólo resuelve esa consulta en local, y recién
+    ``ENCODER_MAX_TRANSIENT`` timeouts seguidos lo dan por caído.
+    """
+    global _encoder_down_until, _encoder_transient
+    client = _get_encoder_client()
+    if client is not None and time.monotonic() >= _encoder_down_until:
+        try:
+            vecs = client.encode(texts)
+            _encoder_transient = 0
+            return vecs
+        except (OSError, ValueError, RuntimeError) as e:
+            transitorio = isinstance(e, (TimeoutError, BlockingIOError, InterruptedError))
+            _encoder_transient = _encoder_transient + 1 if transitorio else ENCODER_MAX_TRANSIENT
+            if _encoder_transient >= ENCODER_MAX_TRANSIENT:
+                _encoder_down_until = time.monotonic() + ENCODER_RETRY_SECONDS
+                _encoder_transient = 0
+            logger.warning("Servicio de codificación no disponible (%s); usando el modelo local.", e)
+    return _get_model().encode(list(texts), convert_to_numpy=True, normalize_embeddings=True)
+
+
+def _calentar_codificador():
+    """Deja listo el codificador de este proceso: "service" si responde el servicio, si no "local".
+
+    Con el servicio activo el worker no carga el modelo en memoria.
+    """
+    client = _get_encoder_client()
+    if client is not None:
+        try:
+            client.ping()
+            return "service"
+        except (OSError, ValueError, RuntimeError) as e:
+            logger.warning("Servicio de codificación no disponible (%s); cargando el modelo local.", e)
+    _get_model().encode(["apartamento en medellin"], convert_to_numpy=True, normalize_embeddings=True)
+    return "local"
+
+
+def _codificar_consultas(texts):
+    """Embeddings normalizados (n, d) de consultas, pasando por la cache.
+
+    El modelo sólo se ejecuta para las consultas que no estén en cache.
+    """
+    with span("encode"):
+        return normalize_rows(_get_query_cache().get_many(texts, _codificar))
+
+
+def _precision():
+    return getattr(settings, "EMBEDDINGS_PRECISION", "float32")
+
+
+def _use_mmap():
+    return getattr(settings, "EMBEDDINGS_MMAP", True)
+
+
+def _ann_backend():
+    """'auto' (IVF si el catálogo es grande y hay índice), 'exact' o 'ivf'."""
+    return getattr(settings, "EMBEDDINGS_ANN_BACKEND", "auto")
+
+
+def _ann_min_rows():
+    return getattr(settings, "EMBEDDINGS_ANN_MIN_ROWS", ANN_MIN_ROWS)
+
+
+def _nprobe():
+    return getattr(settings, "EMBEDDINGS_IVF_NPROBE", IVF_NPROBE)
+
+
+def _usar_ann(n_rows):
+    backend = _ann_backend()
+    return backend == "ivf" or (backend == "auto" and n_rows >= _ann_min_rows())
+
+
+def _index_dir():
+    return getattr(settings, "EMBEDDINGS_INDEX_DIR", INDEX_DIR)
+
+
+def _keep_versions():
+    return getattr(settings, "EMBEDDINGS_KEEP_VERSIONS", KEEP_VERSIONS)
+
+
+def _build_batch():
+    return getattr(settings, "EMBEDDINGS_BUILD_BATCH", BUILD_BATCH)
+
+
+def _build_workers(lotes=None):
+    """Procesos para codificar en --build (1 = en este proceso, sin pool).
+
+    Cada proceso carga su propia copia del modelo, así que nunca hay más que
+    lotes por codificar.
+    """
+    workers = getattr(settings, "EMBEDDINGS_BUILD_WORKERS", BUILD_WORKERS) or default_workers()
+    return max(1, min(workers, lotes)) if lotes is not None else workers
+
+
+def _build_dir():
+    return os.path.join(_index_dir(), BUILD_DIR)
+
+
+def _version_activa():
+    return manifest.current_version(_index_dir())
+
+
+def _ruta(nombre, version=None):
+    """Ruta de ``nombre`` dentro de la versión ``version`` (por defecto la activa)."""
+    return os.path.join(manifest.version_dir(_index_dir(), version or _version_activa()), nombre)
+
+
+def _cargar_ann(n_rows, version=None):
+    """Carga el índice IVF si aplica; si falta o no coincide con la base, usa fuerza bruta."""
+    if not _usar_ann(n_rows):
+        return None
+    path = ivf_path(_ruta(EMBED_PATH, version))
+    if not os.path.exists(path):
+        logger.warning("No hay índice IVF en %s; usando búsqueda exacta.", path)
+        return None
+    index = IVFIndex.load(path)
+    if index.n_rows != n_rows:
+        logger.warning("El índice IVF no coincide con la base (%s != %s filas); usando búsqueda exacta.",
+                       index.n_rows, n_rows)
+        return None
+    return index
+
+
+def _hibrido():
+    return getattr(settings, "EMBEDDINGS_HYBRID", True)
+
+
+def _rrf_k():
+    return getattr(settings, "EMBEDDINGS_RRF_K", RRF_K)
+
+
+def _cargar_atributos(property_ids, version=None):
+    """Atributos filtrables de la base; si faltan o no están alineados, se
+    reconstruyen desde la BD (una sola consulta) y se guardan."""
+    path = attrs_path(_ruta(EMBED_PATH, version))
+    if os.path.exists(path):
+        try:
+            attrs = AttributeStore.load(path)
+        except KeyError:  # guardado antes de agregar una columna
+            attrs = None
+        if attrs is not None and len(attrs) == len(property_ids):
+            return attrs
+    attrs = AttributeStore.from_db(property_ids)
+    attrs.save(path)
+    return attrs
+
+
+def _cargar_bm25(property_ids, version=None):
+    """Índice BM25 de la base; si falta o no está alineado, se reconstruye desde la BD."""
+    path = bm25_path(_ruta(EMBED_PATH, version))
+    if os.path.exists(path):
+        index = BM25Index.load(path)
+        if index.ids == list(property_ids):
+            return index
+    index = BM25Index.build(property_ids, _textos_lexicos_db(property_ids))
+    index.save(path)
+    return index
+
+
+def _mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+
+def _refresh_delta(force=False):
+    """Recarga el delta si cambió en disco (p. ej. lo escribió otro worker)."""
+    global _delta, _delta_mtime, _alive_mask
+    mtime = _mtime(DELTA_PATH)
+    if not force and _delta is not None and mtime == _delta_mtime:
+        return
+    _delta = DeltaIndex(DELTA_PATH).load()
+    _delta_mtime = mtime
+    hidden = _delta.hidden_ids()
+    if hidden and _ids_array is not None:
+        _alive_mask = ~np.isin(_ids_array, np.fromiter(hidden, dtype=np.int64))
+    else:
+        _alive_mask = None
+
+
 def _load_embeddings_to_cache():
-    """Carga embeddings y IDs en memoria (cache global) si aún no están cargados."""
-    global _embeddings_cache, _ids_cache
-    if _embeddings_cache is None or _ids_cache is None:
-        if os.path.exists(EMBED_PATH) and os.path.exists(ID_PATH):
-            _embeddings_cache = np.load(EMBED_PATH)
-            _ids_cache = joblib.load(ID_PATH)
-        else:
+    """Carga embeddings y IDs en memoria (cache global) si aún no están cargados.
+
+    También detecta si se activó otra versión del índice (build, compactación
+    o bundle importado, quizá por otro proceso) o si el delta cambió desde la
+    última carga, y recarga lo necesario sin reiniciar el servidor.
+    """
+    version = _version_activa()
+    if _embeddings_cache is None or _ids_cache is None or version is None or version != _version:
+        if version is None:
             # Si no existen, intentar generarlos
-            _ids_cache, _embeddings_cache = load_or_generate_embeddings(force=False)
+            load_or_generate_embeddings(force=False)
+            version = _version_activa()
+        _abrir_version(version)
+        _refresh_delta(force=True)
+    else:
+        _refresh_delta()
     return _ids_cache, _embeddings_cache
 
 
+def _abrir_version(version):
+    """Carga en memoria la versión ``version`` tras validar su manifest."""
+    global _embeddings_cache, _ids_cache, _ids_array, _version, _store, _ann, _attrs, _bm25
+    info = manifest.read_manifest(manifest.version_dir(_index_dir(), version)) or {}
+    if info.get("model", EMBED_MODEL_NAME) != EMBED_MODEL_NAME:
+        raise CommandError(
+            f"El índice {version} se generó con {info['model']} y no con {EMBED_MODEL_NAME}; "
+            "ejecuta `embeddings --build --force`."
+        )
+    # Con mmap el page cache del SO se comparte entre workers (una sola copia)
+    store = VectorStore.open(_ruta(EMBED_PATH, version), _precision(), mmap=_use_mmap())
+    if info.get("dim") not in (None, store.data.shape[1]):
+        raise CommandError(f"El índice {version} declara dim={info['dim']} pero tiene {store.data.shape[1]}.")
+    if not store.unit_norm:
+        logger.warning("Embeddings sin normalizar (build antiguo); ejecuta `embeddings --build --force`.")
+    ids = joblib.load(_ruta(ID_PATH, version))
+    _store, _embeddings_cache = store, store.data
+    _ids_cache = ids
+    _ids_array = np.asarray(ids, dtype=np.int64)
+    _ann = _cargar_ann(len(store), version)
+    _attrs = _cargar_atributos(ids, version)
+    _bm25 = _cargar_bm25(ids, version)
+    _version = version
+    logger.info("Índice de búsqueda %s cargado (%s filas).", version, len(ids))
+
+
+def _campos(prop):
+    """``get(nombre)`` sobre una instancia de Propiedad o un dict de ``.values()``."""
+    return prop.get if isinstance(prop, dict) else (lambda name: getattr(prop, name, None))
+
+
+def _texto_propiedad(prop):
+    """Texto representativo de una propiedad (lo que se codifica con el modelo)."""
+    get = _campos(prop)
+    text_parts = [
+        get("title") or "",
+        get("location") or "",
+        get("property_type") or "",
+        get("condition") or "",
+        get("description") or "",
+        ", ".join(get("amenities") or []),
+        f"{get('rooms')} habitaciones, {get('bathrooms')} baños, {get('area_m2')} m², Estrato {get('estrato') or ''}",
+        "Amoblado" if get("furnished") else "",
+        "Se permiten mascotas" if get("pets_allowed") else "",
+    ]
+    return " ".join(str(x) for x in text_parts if x)
+
+
+def _texto_lexico(prop):
+    """Texto para BM25: el mismo del embedding más el código de FincaRaíz."""
+    return f"{_texto_propiedad(prop)} {_campos(prop)('codigo_fincaraiz') or ''}".strip()
+
+
+def _textos_lexicos_db(property_ids):
+    """Textos léxicos de ``property_ids`` (mismo orden) recorriendo la tabla una vez."""
+    rows = Propiedad.objects.values(*BUILD_FIELDS).iterator(chunk_size=_build_batch())
+    by_id = {row["id"]: _texto_lexico(row) for row in rows}
+    return [by_id.get(pk, "") for pk in property_ids]
+
+
+def _marca_bd(property_ids=None):
+    """``updated_at`` máximo (ISO 8601) de las propiedades, o de ``property_ids``."""
+    qs = Propiedad.objects.all()
+    if property_ids is not None:
+        qs = qs.filter(id__in=list(property_ids))
+    marca = qs.aggregate(m=Max("updated_at"))["m"]
+    return marca.isoformat() if marca else None
+
+
 # ---------- GENERADOR DE EMBEDDINGS ----------
-def load_or_generate_embeddings(force: bool = False):
+def load_or_generate_embeddings(force: bool = False, resume: bool = True, reuse: bool = True):
     """Carga o genera embeddings para todas las propiedades en la BD.
 
-    Si force=True, vuelve a generarlos aunque existan en disco.
+    Si force=True, vuelve a generarlos aunque existan en disco; aun así, las
+    propiedades cuyo texto no cambió reutilizan el vector de la versión activa
+    salvo reuse=False. Si un build anterior quedó a medias, continúa desde su
+    checkpoint salvo resume=False.
     """
-    if (not force) and os.path.exists(EMBED_PATH) and os.path.exists(ID_PATH):
-        print("Cargando embeddings desde cache...")
-        embeddings = np.load(EMBED_PATH)
-        property_ids = joblib.load(ID_PATH)
-        return property_ids, embeddings
+    if not force:
+        version = _version_activa()
+        if version is not None:
+            print("Cargando embeddings desde cache...")
+            return joblib.load(_ruta(ID_PATH, version)), np.load(_ruta(EMBED_PATH, version), mmap_mode="r")
+        if all(os.path.exists(path) for path in LEGACY_PATHS):
+            return _versionar_legacy()
 
     print("Generando embeddings desde la base de datos...")
-
-    # 1. Obtener todas las propiedades
-    propiedades = Propiedad.objects.all()
-    if not propiedades.exists():
+    if not Propiedad.objects.exists():
         raise CommandError("No hay propiedades en la base de datos.")
 
-    # 2. Crear textos representativos
-    corpus = []
-    property_ids = []
-
-    for prop in propiedades:
-        text_parts = [
-            prop.title or "",
-            prop.location or "",
-            prop.property_type or "",
-            prop.condition or "",
-            prop.description or "",
-            ", ".join(prop.amenities or []),
-            f"{prop.rooms} habitaciones, {prop.bathrooms} baños, {prop.area_m2} m², Estrato {prop.estrato or ''}",
-            "Amoblado" if prop.furnished else "",
-            "Se permiten mascotas" if prop.pets_allowed else "",
-        ]
-        texto_final = " ".join(str(x) for x in text_parts if x)
-        corpus.append(texto_final)
-        property_ids.append(prop.id)  # type: ignore
-
-    # 3. Generar embeddings
-    model = _get_model()
-    embeddings = model.encode(corpus, show_progress_bar=True, convert_to_numpy=True)
-
-    # 4. Guardar resultados
-    np.save(EMBED_PATH, embeddings)
-    joblib.dump(property_ids, ID_PATH)
-    print(f"Embeddings generados y guardados ({len(property_ids)} propiedades).")
+    os.makedirs(_index_dir(), exist_ok=True)
+    with file_lock(_build_dir()):
+        checkpoint = Checkpoint(_build_dir())
+        # Marca de agua antes de leer: lo modificado durante el build cuenta como pendiente.
+        # Al reanudar se conserva la del primer intento.
+        if checkpoint.start(EMBED_MODEL_NAME, resume=resume, db_watermark=_marca_bd(), batch_size=_build_batch()):
+            print(f"Reanudando build interrumpido ({checkpoint.rows} filas ya codificadas)...")
+        marca = checkpoint.state.get("db_watermark")
+
+        # 1. Leer las propiedades en lotes (dicts de .values(), en orden de id) y codificarlas
+        qs = Propiedad.objects.order_by("id")
+        if checkpoint.last_id is not None:
+            qs = qs.filter(id__gt=checkpoint.last_id)
+        batches = (_lote_build(rows) for rows in iter_batches(qs, BUILD_FIELDS, _build_batch()))
+        lotes = -(-qs.count() // _build_batch())
+        stats = encode_batches(
+            batches, checkpoint, _codificar_corpus, EMBED_MODEL_NAME, workers=_build_workers(lotes),
+            previous=_vectores_previos() if reuse else None,
+        )
+        if stats["rows"]:
+            print(f"Procesadas {stats['rows']} filas en {stats['seconds']:.1f}s ({stats['rows_per_sec']:.0f} filas/s, "
+                  f"{stats['reused']} sin cambios reutilizadas).")
+
+        # 2. Juntar los shards; lo borrado mientras el build estaba interrumpido se descarta
+        property_ids, embeddings, hashes, attr_rows, lexical = checkpoint.read()
+        existentes = set(Propiedad.objects.values_list("id", flat=True))
+        keep = [i for i, pk in enumerate(property_ids) if pk in existentes]
+        if len(keep) != len(property_ids):
+            property_ids = [property_ids[i] for i in keep]
+            embeddings = embeddings[keep]
+            hashes = hashes[keep]
+            attr_rows = [attr_rows[i] for i in keep]
+            lexical = [lexical[i] for i in keep]
+
+        # 3. Guardar resultados (el build completo ya incluye todo lo que había en el delta)
+        ivf = IVFIndex.build(embeddings) if _usar_ann(len(property_ids)) else None
+        with file_lock(DELTA_PATH):
+            version = _publicar(property_ids, embeddings, ivf=ivf, attrs=AttributeStore.from_rows(attr_rows),
+                                bm25=BM25Index.build(property_ids, lexical), hashes=hashes,
+                                source="build", db_watermark=marca, reused=stats["reused"])
+            DeltaIndex(DELTA_PATH).clear()
+        checkpoint.clear()
+    print(f"Embeddings generados y guardados ({len(property_ids)} propiedades, versión {version}).")
 
     return property_ids, embeddings
 
 
+def _lote_build(rows):
+    """(ids, textos, huellas, atributos, textos BM25) de un lote de dicts de ``.values()``."""
+    textos = [_texto_propiedad(row) for row in rows]
+    return (
+        [row["id"] for row in rows], textos, [text_hash(t) for t in textos],
+        [row_attrs(row) for row in rows], [_texto_lexico(row) for row in rows],
+    )
+
+
+def _vectores_previos():
+    """Vectores de la versión activa reutilizables en un rebuild, o None.
+
+    Sólo si la versión se generó con el mismo modelo y tiene huellas por fila;
+    el delta pendiente no se usa (esas filas tienen huella desconocida).
+    """
+    version = _version_activa()
+    if version is None:
+        return None
+    info = manifest.read_manifest(manifest.version_dir(_index_dir(), version)) or {}
+    if info.get("model") != EMBED_MODEL_NAME:
+        return None
+    return PreviousVectors.load(joblib.load(_ruta(ID_PATH, version)), _ruta(EMBED_PATH, version))
+
+
+def _codificar_corpus(texts):
+    """Embeddings normalizados de un lote del corpus, en este proceso (sin pool)."""
+    return _get_model().encode(texts, convert_to_numpy=True, normalize_embeddings=True)
+
+
+def _versionar_legacy():
+    """Publica como primera versión los archivos sueltos de builds anteriores (sin recodificar)."""
+    embed_path, id_path = LEGACY_PATHS
+    print("Versionando embeddings existentes...")
+    property_ids = joblib.load(id_path)
+    embeddings = np.load(embed_path)
+    with file_lock(DELTA_PATH):
+        if _version_activa() is None:  # otro proceso pudo adelantarse
+            _publicar(property_ids, embeddings, attrs=AttributeStore.from_db(property_ids),
+                      bm25=BM25Index.build(property_ids, _textos_lexicos_db(property_ids)),
+                      source="legacy", db_watermark=None)
+    return property_ids, embeddings
+
+
+def _publicar(property_ids, embeddings, ivf=None, attrs=None, bm25=None, hashes=None, **meta):
+    """Escribe una versión nueva y completa del índice y la activa atómicamente.
+
+    Los lectores ven la versión anterior o la nueva, nunca una mezcla.
+    Devuelve el nombre de la versión.
+    """
+    root = _index_dir()
+    previous = _version_activa()
+    name, path = manifest.new_version(root)
+    embed_path = os.path.join(path, EMBED_PATH)
+    joblib.dump(list(property_ids), os.path.join(path, ID_PATH))
+    if attrs is not None:
+        attrs.save(attrs_path(embed_path))
+    if bm25 is not None:
+        bm25.save(bm25_path(embed_path))
+    if ivf is not None:
+        ivf.save(ivf_path(embed_path))
+    if hashes is not None:
+        np.save(hashes_path(embed_path), np.asarray(hashes, dtype=np.uint64))
+    # La tabla de similares es cara de recalcular: se conserva la anterior
+    # (indexada por id) hasta el próximo `--knn`
+    knn_previa = knn_path(_ruta(EMBED_PATH, previous)) if previous else None
+    if knn_previa and os.path.exists(knn_previa):
+        manifest.link_or_copy(knn_previa, knn_path(embed_path))
+    # Guardar normalizado: en búsqueda el coseno queda en un solo producto punto
+    embeddings = normalize_rows(embeddings)
+    np.save(embed_path, embeddings)
+    # Variante cuantizada que usarán los workers (las demás se generan al abrirlas)
+    write_variant(embed_path, embeddings, _precision())
+    manifest.write_manifest(
+        path, version=name, previous=previous, model=EMBED_MODEL_NAME, dim=int(embeddings.shape[1]),
+        rows=len(property_ids), built_at=datetime.now(timezone.utc).isoformat(), **meta,
+    )
+    manifest.publish(root, name, _keep_versions())
+    return name
+
+
+# ---------- ACTUALIZACIÓN INCREMENTAL ----------
+def _indice_existe():
+    return _version_activa() is not None
+
+
+def _compactar(delta):
+    """Fusiona el delta en una versión nueva. Debe llamarse con el lock del delta tomado."""
+    version = _version_activa()
+    base_ids = joblib.load(_ruta(ID_PATH, version))
+    base = np.load(_ruta(EMBED_PATH, version), mmap_mode="r")
+    base_attrs = _cargar_atributos(base_ids, version)
+    ids, vecs, attrs = delta.merge_into(base_ids, base, base_attrs)
+    del base
+    # Con un IVF existente basta reasignar filas a los centroides ya entrenados
+    ivf = None
+    path = ivf_path(_ruta(EMBED_PATH, version))
+    if os.path.exists(path):
+        ivf = IVFIndex.from_centroids(vecs, IVFIndex.load(path).centroids)
+    # Las estadísticas de BM25 (idf, largo medio) se recalculan sobre el corpus fusionado
+    bm25 = BM25Index.build(ids, _textos_lexicos_db(ids))
+    # Lo que estaba en el delta llega hasta el updated_at de esas filas
+    previa = (manifest.read_manifest(manifest.version_dir(_index_dir(), version)) or {}).get("db_watermark")
+    marcas = [m for m in (previa, _marca_bd(delta.ids) if len(delta) else None) if m]
+    _publicar(ids, vecs, ivf=ivf, attrs=attrs, bm25=bm25, hashes=_huellas_compactadas(version, base_ids, ids, delta),
+              source="compact",
+              db_watermark=max(marcas, key=parse_datetime) if marcas else None)
+    delta.clear()
+    return len(ids)
+
+
+def _huellas_compactadas(version, base_ids, ids, delta):
+    """Huellas de la base para ``ids`` tras fusionar el delta (0 en las filas del delta)."""
+    path = hashes_path(_ruta(EMBED_PATH, version))
+    if not os.path.exists(path):
+        return None
+    base = np.load(path)
+    if len(base) != len(base_ids):
+        return None
+    pos = {pk: i for i, pk in enumerate(base_ids)}
+    nuevos = set(delta.ids)
+    return np.asarray([0 if pk in nuevos else base[pos[pk]] for pk in ids], dtype=np.uint64)
+
+
+def _derivar_version(fname, save, source, **meta):
+    """Versión nueva igual a la activa (hard links) más el archivo ``fname``.
+
+    ``save(ruta)`` escribe el archivo nuevo. Debe llamarse con el lock del
+    delta tomado. Devuelve el nombre de la versión.
+    """
+    root = _index_dir()
+    version = _version_activa()
+    origen = manifest.version_dir(root, version)
+    name, path = manifest.new_version(root)
+    for existente in os.listdir(origen):
+        if existente not in (manifest.MANIFEST, fname) and not existente.endswith((".tmp", ".lock")):
+            manifest.link_or_copy(os.path.join(origen, existente), os.path.join(path, existente))
+    save(os.path.join(path, fname))
+    info = manifest.read_manifest(origen) or {}
+    info.pop("files", None)
+    info.update(version=name, previous=version, source=source,
+                built_at=datetime.now(timezone.utc).isoformat(), **meta)
+    manifest.write_manifest(path, **info)
+    manifest.publish(root, name, _keep_versions())
+    return name
+
+
+def construir_indice_ann(nlist=None):
+    """Entrena el índice IVF a partir del archivo de embeddings existente."""
+    if not _indice_existe():
+        raise CommandError("No hay embeddings base. Ejecuta con --build primero.")
+    with file_lock(DELTA_PATH):
+        index = IVFIndex.build(np.load(_ruta(EMBED_PATH), mmap_mode="r"), nlist=nlist)
+        # Versión nueva que reutiliza todos los archivos salvo el IVF
+        _derivar_version(os.path.basename(ivf_path(EMBED_PATH)), index.save, "ivf", nlist=index.nlist)
+    return index
+
+
+def construir_tabla_knn(k=KNN_K):
+    """Calcula los ``k`` vecinos de cada propiedad desde la matriz de la versión activa.
+
+    Por bloques (ver ``properties/search/knn.py``), sin el modelo. Las filas
+    del delta entran en la tabla en la próxima compactación o build + ``--knn``.
+    """
+    if not _indice_existe():
+        raise CommandError("No hay embeddings base. Ejecuta con --build primero.")
+    with file_lock(DELTA_PATH):
+        table = KNNTable.build(joblib.load(_ruta(ID_PATH)), np.load(_ruta(EMBED_PATH), mmap_mode="r"), k=k)
+        _derivar_version(os.path.basename(knn_path(EMBED_PATH)), table.save, "knn", knn_k=table.k)
+    return table
+
+
+def propiedades_similares(prop_id, limit=SIMILARES):
+    """Ids de las propiedades más parecidas a ``prop_id`` según la tabla kNN.
+
+    Sólo lee la tabla precalculada de la versión activa (sin modelo ni
+    recorrido de la matriz); [] si la versión no tiene tabla o la propiedad
+    todavía no está en ella.
+    """
+    global _knn
+    version = _version_activa()
+    if version is None:
+        return []
+    if _knn is None or _knn[0] != version:
+        path = knn_path(_ruta(EMBED_PATH, version))
+        _knn = (version, KNNTable.load(path) if os.path.exists(path) else None)
+    table = _knn[1]
+    return table.similar(prop_id, limit) if table is not None else []
+
+
+def vectores_propiedades(prop_ids):
+    """{id: vector normalizado} guardado de cada propiedad indexada de ``prop_ids``.
+
+    Lee la fila del delta o de la base (sin el modelo); las propiedades que
+    no están indexadas (o fueron borradas) se omiten. Sin índice devuelve {}
+    en lugar de generarlo.
+    """
+    if not _indice_existe():
+        return {}
+    _asegurar_indice()
+    wanted = {int(pk) for pk in prop_ids}
+    out = {}
+    delta = _delta
+    if delta is not None and len(delta):
+        for row, pk in enumerate(delta.ids):
+            if pk in wanted:
+                out[int(pk)] = np.asarray(delta.vecs[row], dtype=np.float32)
+    rest = np.fromiter((pk for pk in wanted if pk not in out), dtype=np.int64)
+    if len(rest):
+        rows = np.flatnonzero(np.isin(_ids_array, rest))
+        if _alive_mask is not None:
+            rows = rows[_alive_mask[rows]]
+        for row, vec in zip(rows, normalize_rows(_store.rows(rows))):
+            out[int(_ids_array[row])] = vec
+    return out
+
+
+def _peso_personal():
+    return getattr(settings, "SEARCH_PERSONALIZATION_WEIGHT", 0.3)
+
+
+def _personalizar(query_vecs, preferencia):
+    """Desplaza las consultas hacia el vector de preferencias del usuario.
+
+    Con ``q`` y ``p`` unitarios, cos(q + w·p, x) es proporcional a
+    cos(q, x) + w·cos(p, x) para toda ``x``: el ranking resultante es el de
+    la mezcla de ambos puntajes y cuesta lo mismo que una búsqueda normal.
+    """
+    peso = _peso_personal()
+    if preferencia is None or peso <= 0:
+        return query_vecs
+    return normalize_rows(query_vecs + peso * np.asarray(preferencia, dtype=np.float32))
+
+
+def recomendar_propiedades(preferencia, limit=RECOMENDADAS, excluir=()):
+    """Propiedades más cercanas a un vector de preferencias (sin el modelo).
+
+    ``excluir`` son ids ya vistos o favoritos que no se recomiendan.
+    Devuelve [{"id", "score"}] como ``buscar_propiedades``.
+    """
+    _asegurar_indice()
+    excluir = {int(pk) for pk in excluir}
+    query = normalize_rows(np.asarray(preferencia, dtype=np.float32)[None, :])
+    hits = _rankear(query, limit + len(excluir))[0]
+    return [hit for hit in hits if hit["id"] not in excluir][:limit]
+
+
+def metricas_indice():
+    """Tamaño del índice cargado en este proceso y stats de la cache de consultas.
+
+    No carga nada: un worker que todavía no buscó informa ``loaded=False``.
+    """
+    store, delta = _store, _delta
+    return {
+        "loaded": store is not None,
+        "version": _version,
+        "rows": len(_ids_cache) if _ids_cache is not None else None,
+        "delta_rows": len(delta) if delta is not None else None,
+        "tombstones": len(delta.tombstones) if delta is not None else None,
+        "bytes": store.nbytes if store is not None else None,
+        "precision": store.precision if store is not None else None,
+        "query_cache": _query_cache.stats() if _query_cache is not None else None,
+    }
+
+
+def estado_indice():
+    """Manifest de la versión activa y cuánto se ha desviado la BD desde entonces.
+
+    ``pending`` cuenta las propiedades modificadas después de la marca de
+    agua que tampoco están en el delta; ``stale`` es True si hay alguna o si
+    el número de filas no coincide con el de la BD (p. ej. borrados con
+    ``EMBEDDINGS_AUTO_UPDATE`` desactivado).
+    """
+    version = _version_activa()
+    if version is None:
+        return None
+    info = manifest.read_manifest(manifest.version_dir(_index_dir(), version)) or {}
+    delta = DeltaIndex(DELTA_PATH).load()
+    base_ids = joblib.load(_ruta(ID_PATH, version))
+    indexed = (set(base_ids) - delta.tombstones) | set(delta.ids)
+    marca = parse_datetime(info["db_watermark"]) if info.get("db_watermark") else None
+    pending = None
+    if marca is not None:
+        pending = Propiedad.objects.filter(updated_at__gt=marca).exclude(id__in=delta.ids).count()
+    db_rows = Propiedad.objects.count()
+    info.pop("files", None)
+    info.update(
+        delta_rows=len(delta), tombstones=len(delta.tombstones), indexed_rows=len(indexed),
+        db_rows=db_rows, pending=pending, stale=bool(pending) or db_rows != len(indexed),
+    )
+    return info
+
+
+def compactar_indice():
+    """Compacta el delta pendiente en la matriz base. Devuelve el nº de filas."""
+    if not _indice_existe():
+        raise CommandError("No hay embeddings base. Ejecuta con --build primero.")
+    with file_lock(DELTA_PATH):
+        total = _compactar(DeltaIndex(DELTA_PATH).load())
+    _load_embeddings_to_cache()
+    return total
+
+
+def compactar_si_hace_falta():
+    """Compacta si el delta llegó a ``COMPACT_THRESHOLD``. Devuelve el nº de filas o None.
+
+    El tamaño se revisa otra vez bajo el lock: otro proceso pudo haber
+    compactado mientras tanto.
+    """
+    with file_lock(DELTA_PATH):
+        delta = DeltaIndex(DELTA_PATH).load()
+        if delta.size < COMPACT_THRESHOLD:
+            return None
+        return _compactar(delta)
+
+
+def _compactar_en_hilo():
+    from django.db import connection
+    try:
+        total = compactar_si_hace_falta()
+        if total is not None:
+            logger.info("Delta compactado en segundo plano (%s propiedades).", total)
+    except Exception:
+        logger.exception("Falló la compactación del delta en segundo plano")
+    finally:
+        connection.close()  # la conexión de este hilo no la cierra nadie más
+        _compactando.clear()
+
+
+def _compactar_en_segundo_plano():
+    """Lanza la compactación en un hilo (una a la vez por proceso).
+
+    Las búsquedas toman la versión nueva al activarse (ver
+    ``_load_embeddings_to_cache``). Con ``EMBEDDINGS_AUTO_COMPACT`` en False
+    no se lanza: se compacta con ``manage.py embeddings --compact`` (cron).
+    """
+    if not getattr(settings, "EMBEDDINGS_AUTO_COMPACT", True) or _compactando.is_set():
+        return False
+    _compactando.set()
+    threading.Thread(target=_compactar_en_hilo, name="embeddings-compact", daemon=True).start()
+    return True
+
+
+def _aplicar_delta(cambio):
+    """Aplica ``cambio(delta)`` bajo lock y lo guarda.
+
+    Si el delta creció demasiado la compactación corre fuera de la petición
+    que lo guardó: reescribir la base (con IVF, atributos y BM25) no se paga
+    al guardar una propiedad.
+    """
+    with file_lock(DELTA_PATH):
+        delta = DeltaIndex(DELTA_PATH).load()
+        cambio(delta)
+        delta.save()
+        grande = delta.size >= COMPACT_THRESHOLD
+    if grande:
+        _compactar_en_segundo_plano()
+    if _embeddings_cache is not None:
+        _load_embeddings_to_cache()
+
+
+def actualizar_embedding_propiedad(prop):
+    """Codifica una sola propiedad y la registra en el delta.
+
+    Si todavía no existe un índice base no hace nada: el próximo ``--build``
+    la incluirá. Devuelve True si la propiedad quedó indexada.
+    """
+    if not _indice_existe():
+        return False
+    vec = _codificar([_texto_propiedad(prop)])[0]
+    attrs = row_attrs(prop)
+    text = _texto_lexico(prop)
+    _aplicar_delta(lambda delta: delta.upsert(prop.pk, vec, attrs=attrs, text=text))
+    return True
+
+
+def eliminar_embedding_propiedad(prop_id):
+    """Marca una propiedad borrada para que deje de aparecer en la búsqueda."""
+    if not _indice_existe():
+        return False
+    _aplicar_delta(lambda delta: delta.delete(prop_id))
+    return True
+
+
 # ---------- BÚSQUEDA ----------
-def buscar_propiedades(query_text, top_k=TOP_K):
-    """Busca propiedades similares a una consulta textual usando embeddings cacheados."""
-    # Cargar embeddings desde cache (en memoria)
-    property_ids, embeddings = _load_embeddings_to_cache()
-    
-    if property_ids is None or embeddings is None:
-        raise CommandError("No hay embeddings disponibles. Ejecuta con --build para generarlos.")
+def _mascaras(filters=None):
+    """Máscaras booleanas (base, delta) de filas elegibles, o None si todas lo son.
+
+    Combina las filas ocultas por el delta con ``filters``. Filtros soportados:
+      - ``ids``: restringe la búsqueda a ese conjunto de ids.
+      - los del buscador (``precio_min``, ``rooms``, ``tipo``, ``mascotas``...),
+        evaluados sobre el almacén columnar de atributos (ver ``attributes.py``).
+    """
+    base_mask = _alive_mask
+    delta = _delta
+    delta_mask = None
+    has_delta = delta is not None and len(delta)
+    attr_mask = _attrs.mask(filters) if _attrs is not None else None
+    if attr_mask is not None:
+        base_mask = attr_mask if base_mask is None else (base_mask & attr_mask)
+        if has_delta:
+            delta_mask = delta.attribute_store().mask(filters)
+    ids = (filters or {}).get("ids")
+    if ids is not None:
+        allowed = np.fromiter((int(pk) for pk in ids), dtype=np.int64)
+        in_base = np.isin(_ids_array, allowed)
+        base_mask = in_base if base_mask is None else (base_mask & in_base)
+        if has_delta:
+            in_delta = np.isin(np.asarray(delta.ids, dtype=np.int64), allowed)
+            delta_mask = in_delta if delta_mask is None else (delta_mask & in_delta)
+    return base_mask, delta_mask
 
-    model = _get_model()
-    query_vec = model.encode([query_text], convert_to_numpy=True)
 
-    # Calcular similitud coseno
-    sims = cosine_similarity(query_vec, embeddings).flatten()
-    top_idx = np.argsort(-sims)[:top_k]
+def _puntuar_base(query_vecs, base_mask=None, nprobe=None, k=None):
+    """Similitud coseno contra la base. Devuelve una lista de (filas, sims) por consulta.
+
+    Con IVF sólo se puntúan las filas candidatas de cada consulta (``filas``
+    indica cuáles); en búsqueda exacta todas las consultas se puntúan con un
+    único producto matriz-matriz, ``filas`` es None y ``sims`` cubre toda la
+    base. Las filas excluidas por ``base_mask`` quedan en -inf.
+
+    Con IVF y ``base_mask``, para que un filtro selectivo no deje la página
+    corta: si quedan menos filas elegibles que las que recorrería el sondeo se
+    puntúan exactamente esas; si no, ``nprobe`` se duplica hasta que haya
+    ``k`` candidatas elegibles (o se recorran todas las listas).
+    """
+    if _ann is not None:
+        nprobe = nprobe or _nprobe()
+        elegibles = None
+        if base_mask is not None:
+            n_elegibles = int(np.count_nonzero(base_mask))
+            if n_elegibles <= _ann.n_rows * min(nprobe, _ann.nlist) / _ann.nlist:
+                elegibles = np.flatnonzero(base_mask)
+        out = []
+        for query_vec in query_vecs:
+            if elegibles is not None:
+                out.append((elegibles, _store.cosine(query_vec, rows=elegibles)[0]))
+                continue
+            probe = nprobe
+            while True:
+                rows = _ann.candidates(query_vec, probe)
+                ok = base_mask[rows] if base_mask is not None else None
+                if ok is None or not k or probe >= _ann.nlist or int(np.count_nonzero(ok)) >= k:
+                    break
+                probe *= 2
+            sims = _store.cosine(query_vec, rows=rows)[0]
+            if ok is not None:
+                sims[~ok] = -np.inf
+            out.append((rows, sims))
+        return out
+    # Similitud coseno directamente sobre la variante (float32/float16/int8)
+    sims = _store.cosine(query_vecs)
+    if base_mask is not None:
+        sims[:, ~base_mask] = -np.inf
+    return [(None, row) for row in sims]
+
+
+def _top_vectorial(sims, rows, n_base, k):
+    """[(id, score)] de los ``k`` mejores de una fila de similitudes base+delta."""
+    hits = []
+    for idx in _top_k(sims, k):
+        if not np.isfinite(sims[idx]):
+            break
+        if idx < n_base:
+            prop_id = _ids_cache[rows[idx] if rows is not None else idx]
+        else:
+            prop_id = _delta.ids[idx - n_base]
+        hits.append((prop_id, float(sims[idx])))
+    return hits
+
+
+def _top_lexico(query_text, k, base_mask=None, delta_mask=None):
+    """[(id, score BM25)] de los ``k`` mejores entre base y delta (sólo con coincidencias)."""
+    docs, scores = _bm25.search(query_text, k, mask=base_mask)
+    hits = [(_bm25.ids[d], float(s)) for d, s in zip(docs, scores)]
+    delta = _delta
+    if delta is not None and len(delta):
+        delta_scores = _bm25.score_texts(query_text, delta.texts)
+        if delta_mask is not None:
+            delta_scores[~delta_mask] = 0.0
+        hits += [(pk, float(s)) for pk, s in zip(delta.ids, delta_scores) if s > 0]
+        hits.sort(key=lambda hit: hit[1], reverse=True)
+    return hits[:k]
+
+
+def _rankear(query_vecs, top_k, filters=None, query_texts=None):
+    """Top-k de ids/scores para cada fila de ``query_vecs`` (ya normalizadas).
+
+    Con ``query_texts`` y ``EMBEDDINGS_HYBRID`` activo, los candidatos
+    vectoriales se fusionan con los de BM25 mediante Reciprocal Rank Fusion;
+    en ese caso ``score`` es el puntaje RRF y no una similitud coseno.
+    """
+    resultados, hibrido = _rankear_crudo(query_vecs, top_k, filters, query_texts)
+    digits = 4 if hibrido else 3
+    return [[{"id": pk, "score": round(score, digits)} for pk, score in hits] for hits in resultados]
+
+
+def _rankear_crudo(query_vecs, top_k, filters=None, query_texts=None):
+    """Como ``_rankear`` pero con listas de (id, score) sin redondear.
+
+    Devuelve (resultados, hibrido).
+    """
+    delta = _delta
+    with span("mask"):
+        base_mask, delta_mask = _mascaras(filters)
+    with span("score"):
+        delta_sims = None
+        if delta is not None and len(delta):
+            # Vectores del delta ya normalizados: coseno = producto punto
+            delta_sims = query_vecs @ delta.vecs.T
+            if delta_mask is not None:
+                delta_sims[:, ~delta_mask] = -np.inf
+        hibrido = query_texts is not None and _bm25 is not None and _hibrido()
+        depth = max(top_k, HYBRID_CANDIDATES) if hibrido else top_k
+        puntuadas = _puntuar_base(query_vecs, base_mask, k=depth)
 
     resultados = []
-    for idx in top_idx:
-        prop_id = property_ids[idx]
+    for i, (rows, sims) in enumerate(puntuadas):
         # No traer el objeto completo aquí, solo devolver el ID y score
         # La vista se encargará de filtrar y traer los objetos necesarios
-        resultados.append({
-            "id": prop_id,
-            "score": round(float(sims[idx]), 3),
-        })
-    return resultados
+        with span("topk"):
+            n_base = len(sims)
+            if delta_sims is not None:
+                sims = np.concatenate([sims, delta_sims[i]])
+            vectorial = _top_vectorial(sims, rows, n_base, depth)
+        if not hibrido:
+            resultados.append(vectorial)
+            continue
+        with span("lexical"):
+            lexico = _top_lexico(query_texts[i], depth, base_mask, delta_mask)
+        with span("fusion"):
+            resultados.append(reciprocal_rank_fusion(
+                [[pk for pk, _ in vectorial], [pk for pk, _ in lexico]], k=_rrf_k(), limit=top_k,
+            ))
+    return resultados, hibrido
+
+
+def _asegurar_indice():
+    property_ids, embeddings = _load_embeddings_to_cache()
+    if property_ids is None or embeddings is None:
+        raise CommandError("No hay embeddings disponibles. Ejecuta con --build para generarlos.")
+
+
+def buscar_propiedades(query_text, top_k=TOP_K, filters=None, preferencia=None):
+    """Busca propiedades similares a una consulta textual usando embeddings cacheados.
+
+    ``preferencia`` (vector de ``search/preferences.py``) personaliza el
+    ranking; ver ``_personalizar``.
+    """
+    # Cargar embeddings desde cache (en memoria)
+    _asegurar_indice()
+    query_vec = _personalizar(_codificar_consultas([query_text]), preferencia)
+    return _rankear(query_vec, top_k, filters, query_texts=[query_text])[0]
+
+
+def buscar_propiedades_pagina(query_text, limit=TOP_K, cursor=None, filters=None, preferencia=None):
+    """Una página del ranking completo, sin el tope de ``top_k``.
+
+    El ranking es fijo para una consulta, sea cual sea la página:
+
+      - en modo híbrido empieza por la fusión RRF de los ``HYBRID_CANDIDATES``
+        mejores de cada lista (vectorial y BM25), siempre con esa misma
+        profundidad, y sigue con el resto de las filas en orden vectorial;
+      - la parte vectorial se recorre en orden (similitud desc, id asc).
+
+    ``cursor`` es opaco: ``("h", posición)`` dentro de la fusión o
+    ``("v", similitud, id)`` del último resultado vectorial (None = primera
+    página; ``("v",)`` = inicio de la parte vectorial). El puntaje RRF de una fila depende de la profundidad de las
+    listas, así que no sirve de clave entre páginas; la similitud sí.
+
+    La ventana vectorial empieza en ``HYBRID_CANDIDATES`` y se amplía (x4)
+    sólo cuando no alcanza para llenar la página. ``score`` es el puntaje RRF
+    en la parte fusionada y la similitud coseno en el resto.
+    ``preferencia`` personaliza el ranking como en ``buscar_propiedades``.
+    Devuelve (resultados, cursor siguiente o None si no hay más).
+    """
+    _asegurar_indice()
+    query_vec = _personalizar(_codificar_consultas([query_text]), preferencia)
+    cursor = tuple(cursor) if cursor else None
+    if cursor is not None and cursor[0] not in ("h", "v"):
+        cursor = ("v",) + cursor  # token de la forma anterior (similitud, id)
+
+    page, fusionados = [], set()
+    if _bm25 is not None and _hibrido():
+        cabeza = _rankear_crudo(query_vec, HYBRID_CANDIDATES, filters, query_texts=[query_text])[0][0]
+        fusionados = {pk for pk, _ in cabeza}
+        if cursor is None or cursor[0] == "h":
+            pos = int(cursor[1]) if cursor is not None else 0
+            page = cabeza[pos:pos + limit]
+            if len(cabeza) > pos + limit:
+                return _pagina(page), ("h", pos + limit)
+            cursor = None  # la parte vectorial, desde su inicio
+
+    faltan = limit - len(page)
+    total = len(_ids_cache) + (len(_delta) if _delta is not None else 0)
+    window = min(max(HYBRID_CANDIDATES, 2 * limit), max(total, 1))
+    while True:
+        hits = _rankear_crudo(query_vec, window, filters)[0][0]
+        agotado = len(hits) < window or window >= total
+        hits.sort(key=lambda hit: (-hit[1], hit[0]))
+        resto = [(pk, s) for pk, s in hits if pk not in fusionados]
+        if cursor is not None and len(cursor) == 3:
+            _, score, last_id = cursor
+            resto = [(pk, s) for pk, s in resto if s < score or (s == score and pk > last_id)]
+        if len(resto) > faltan or agotado:
+            break
+        window = min(window * 4, total)
+    cola = resto[:faltan]
+    page = page + cola
+    siguiente = None
+    if len(resto) > faltan:
+        # ("v",): la fusión llenó la página justo; sigue la parte vectorial desde su inicio
+        siguiente = ("v", cola[-1][1], cola[-1][0]) if cola else ("v",)
+    return _pagina(page), siguiente
+
+
+def _pagina(hits):
+    return [{"id": pk, "score": round(score, 4)} for pk, score in hits]
+
+
+def buscar_propiedades_batch(queries, top_k=TOP_K, filters=None):
+    """Como ``buscar_propiedades`` pero para muchas consultas a la vez.
+
+    Todas se codifican en un solo ``model.encode`` (sólo las que no estén en
+    cache) y se puntúan con un producto matriz-matriz. Devuelve una lista de
+    resultados por consulta, en el mismo orden y formato que ``buscar_propiedades``.
+    """
+    queries = list(queries)
+    if not queries:
+        return []
+    _asegurar_indice()
+    return _rankear(_codificar_consultas(queries), top_k, filters, query_texts=queries)
+
+
+def buscar_lexico(query_text, top_k=TOP_K, filters=None):
+    """Búsqueda sólo con BM25, sin cargar el modelo.
+
+    Respaldo con ranking para cuando el modelo no está disponible. Usa el
+    índice en disco (más el delta) si existe; si no, uno construido desde la
+    BD que se reconstruye cuando cambian las propiedades.
+    """
+    if _indice_existe():
+        _asegurar_indice()
+        base_mask, delta_mask = _mascaras(filters)
+        hits = _top_lexico(query_text, top_k, base_mask, delta_mask)
+    else:
+        index = _bm25_desde_db()
+        mask = None
+        if filters:
+            mask = AttributeStore.from_db(index.ids).mask(filters)
+            if filters.get("ids") is not None:
+                allowed = np.fromiter((int(pk) for pk in filters["ids"]), dtype=np.int64)
+                in_ids = np.isin(np.asarray(index.ids, dtype=np.int64), allowed)
+                mask = in_ids if mask is None else (mask & in_ids)
+        docs, scores = index.search(query_text, top_k, mask=mask)
+        hits = [(index.ids[d], float(s)) for d, s in zip(docs, scores)]
+    return [{"id": pk, "score": round(score, 3)} for pk, score in hits]
+
+
+def _bm25_desde_db():
+    global _bm25_db
+    qs = Propiedad.objects.all()
+    marca = (qs.count(), qs.aggregate(m=Max("updated_at"))["m"])
+    if _bm25_db is None or _bm25_db[0] != marca:
+        ids = list(qs.order_by("id").values_list("id", flat=True))
+        _bm25_db = (marca, BM25Index.build(ids, _textos_lexicos_db(ids)))
+    return _bm25_db[1]
 
 
 class Command(BaseCommand):
@@ -123,21 +1129,76 @@ class Command(BaseCommand):
     def add_arguments(self, parser):
         parser.add_argument("--build", action="store_true", help="Genera (o recarga) los embeddings")
         parser.add_argument("--force", action="store_true", help="Fuerza regenerar, ignorando cache")
+        parser.add_argument(
+            "--no-resume", action="store_true",
+            help="Descarta el checkpoint de un --build interrumpido y empieza de cero",
+        )
+        parser.add_argument(
+            "--no-reuse", action="store_true",
+            help="Recodifica todas las propiedades aunque su texto no haya cambiado",
+        )
+        parser.add_argument("--compact", action="store_true", help="Fusiona el delta incremental en la base")
+        parser.add_argument(
+            "--knn", action="store_true",
+            help="Precalcula la tabla de propiedades similares (vecinos más cercanos) de la versión activa",
+        )
+        parser.add_argument("--knn-k", type=int, default=KNN_K, help="Vecinos por propiedad en la tabla de similares")
+        parser.add_argument("--nlist", type=int, default=None, help="Listas del índice IVF (por defecto ~4·sqrt(N))")
+        parser.add_argument(
+            "--recall-report", action="store_true",
+            help="Compara recall@top-k, memoria y latencia de float16/int8 frente a float32",
+        )
         parser.add_argument("--query", type=str, help="Texto a buscar entre propiedades")
+        parser.add_argument(
+            "--queries-file", type=str,
+            help="Archivo con una consulta por línea; se resuelven en lote y se escriben como JSONL",
+        )
+        parser.add_argument("--output", type=str, help="Archivo JSONL de salida para --queries-file (por defecto stdout)")
         parser.add_argument("--top-k", type=int, default=TOP_K, help="Número de resultados a devolver")
+        parser.add_argument("--status", action="store_true", help="Muestra el manifest de la versión activa y si está desactualizada")
+        parser.add_argument("--export-bundle", type=str, help="Empaqueta la versión activa en un .tar.gz para otros nodos")
+        parser.add_argument("--import-bundle", type=str, help="Importa un .tar.gz de --export-bundle, lo verifica y lo activa")
 
     def handle(self, *args, **options):
         do_build = bool(options.get("build"))
         force = bool(options.get("force"))
         query = options.get("query")
         top_k = int(options.get("top_k") or TOP_K)
+        do_compact = bool(options.get("compact"))
+
+        import_bundle = options.get("import_bundle")
+        if import_bundle:
+            try:
+                version = manifest.import_bundle(_index_dir(), import_bundle, keep=_keep_versions())
+            except (OSError, ValueError) as e:
+                raise CommandError(f"No se pudo importar {import_bundle}: {e}")
+            self.stdout.write(self.style.SUCCESS(f"✅ Versión {version} importada y activa."))
 
         if do_build:
-            load_or_generate_embeddings(force=force)
+            property_ids, _ = load_or_generate_embeddings(
+                force=force, resume=not options.get("no_resume"), reuse=not options.get("no_reuse"),
+            )
             self.stdout.write(self.style.SUCCESS("✅ Embeddings listos."))
+            nlist = options.get("nlist")
+            if _usar_ann(len(property_ids)) or nlist:
+                index = construir_indice_ann(nlist=nlist)
+                self.stdout.write(self.style.SUCCESS(
+                    f"✅ Índice IVF listo ({index.nlist} listas, nprobe={_nprobe()})."
+                ))
+
+        if do_compact:
+            total = compactar_indice()
+            self.stdout.write(self.style.SUCCESS(f"✅ Índice compactado ({total} propiedades)."))
+
+        do_knn = bool(options.get("knn"))
+        if do_knn:
+            table = construir_tabla_knn(k=int(options.get("knn_k") or KNN_K))
+            self.stdout.write(self.style.SUCCESS(
+                f"✅ Tabla de similares lista ({len(table.ids)} propiedades, {table.k} vecinos c/u)."
+            ))
 
         if query:
-            if not os.path.exists(EMBED_PATH) or not os.path.exists(ID_PATH):
+            if not _indice_existe():
                 self.stdout.write("No hay embeddings en cache; generando primero...")
                 load_or_generate_embeddings(force=force)
             results = buscar_propiedades(query, top_k=top_k)
@@ -153,7 +1214,64 @@ class Command(BaseCommand):
                     self.stdout.write(f"🏠 ID {r['id']} no encontrado | score={r['score']}")
 
 
-        if not do_build and not query:
+        queries_file = options.get("queries_file")
+        if queries_file:
+            self._buscar_desde_archivo(queries_file, options.get("output"), top_k)
+
+        do_report = bool(options.get("recall_report"))
+        if do_report:
+            if not _indice_existe():
+                raise CommandError("No hay embeddings base. Ejecuta con --build primero.")
+            self.stdout.write(f"\nRecall@{top_k} frente a float32 exacto:")
+            for row in recall_report(_ruta(EMBED_PATH), k=top_k):
+                self.stdout.write(
+                    f"  {row['precision']:<8} recall={row['recall']:.3f} | "
+                    f"{row['mb']:.1f} MB | {row['ms_per_query']:.2f} ms/consulta"
+                )
+            if os.path.exists(ivf_path(_ruta(EMBED_PATH))):
+                store = VectorStore.open(_ruta(EMBED_PATH), _precision())
+                index = IVFIndex.load(ivf_path(_ruta(EMBED_PATH)))
+                self.stdout.write(f"\nIVF ({index.nlist} listas, {_precision()}) frente a búsqueda exacta:")
+                for row in nprobe_report(store, index, k=top_k):
+                    self.stdout.write(
+                        f"  nprobe={row['nprobe']:<3} recall={row['recall']:.3f} | "
+                        f"{row['scanned']:.0f} filas | {row['ms_per_query']:.2f} ms/consulta"
+                    )
+
+        export_bundle = options.get("export_bundle")
+        if export_bundle:
+            try:
+                version = manifest.export_bundle(_index_dir(), export_bundle)
+            except FileNotFoundError as e:
+                raise CommandError(str(e))
+            self.stdout.write(self.style.SUCCESS(f"✅ Versión {version} exportada → {export_bundle}"))
+
+        do_status = bool(options.get("status"))
+        if do_status:
+            info = estado_indice()
+            if info is None:
+                raise CommandError("No hay embeddings base. Ejecuta con --build primero.")
+            self.stdout.write(json.dumps(info, indent=2, ensure_ascii=False))
+
+        if not any([do_build, query, do_compact, do_knn, do_report, queries_file, do_status, export_bundle, import_bundle]):
             self.stdout.write(
-                "Uso: python manage.py embeddings --build | --query 'texto' [--top-k 5] [--force]"
+                "Uso: python manage.py embeddings --build [--no-resume] [--no-reuse] | --compact | --knn [--knn-k 12] | --recall-report | --status | "
+                "--export-bundle v.tar.gz | --import-bundle v.tar.gz | "
+                "--query 'texto' | --queries-file consultas.txt [--output r.jsonl] [--top-k 5] [--force]"
             )
+
+    def _buscar_desde_archivo(self, path, output, top_k):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                queries = [line.strip() for line in f if line.strip()]
+        except OSError as e:
+            raise CommandError(f"No se pudo leer {path}: {e}")
+        results = buscar_propiedades_batch(queries, top_k=top_k)
+        out = open(output, "w", encoding="utf-8") if output else self.stdout
+        try:
+            for query, hits in zip(queries, results):
+                out.write(json.dumps({"query": query, "results": hits}, ensure_ascii=False) + "\n")
+        finally:
+            if output:
+                out.close()
+                self.stdout.write(self.style.SUCCESS(f"✅ {len(queries)} consultas resueltas → {output}"))
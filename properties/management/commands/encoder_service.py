@@ -0,0 +1,59 @@
+import logging
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from properties.management.commands import embeddings as emb
+from properties.search.encoder_service import EncoderServer, MicroBatcher
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Servicio local que mantiene el modelo cargado y codifica consultas en micro-lotes (socket Unix)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--socket", type=str, default=None,
+            help="Ruta del socket Unix (por defecto EMBEDDINGS_ENCODER_SOCKET)",
+        )
+        parser.add_argument(
+            "--max-wait-ms", type=float, default=None,
+            help="Espera máxima para juntar pedidos en un lote (por defecto EMBEDDINGS_ENCODER_MAX_WAIT_MS)",
+        )
+        parser.add_argument(
+            "--max-batch", type=int, default=None,
+            help="Textos máximos por lote (por defecto EMBEDDINGS_ENCODER_MAX_BATCH)",
+        )
+
+    def handle(self, *args, **options):
+        if EncoderServer is None:
+            raise CommandError("El servicio de codificación necesita sockets Unix (no disponible en esta plataforma).")
+        path = options.get("socket") or getattr(settings, "EMBEDDINGS_ENCODER_SOCKET", None)
+        if not path:
+            raise CommandError("Indica --socket o configura EMBEDDINGS_ENCODER_SOCKET.")
+        max_wait_ms = options.get("max_wait_ms")
+        if max_wait_ms is None:
+            max_wait_ms = getattr(settings, "EMBEDDINGS_ENCODER_MAX_WAIT_MS", 5)
+        max_batch = options.get("max_batch") or getattr(settings, "EMBEDDINGS_ENCODER_MAX_BATCH", 64)
+
+        self.stdout.write(f"Cargando {emb.EMBED_MODEL_NAME}...")
+        model = emb._get_model()
+        model.encode(["apartamento en medellin"], convert_to_numpy=True, normalize_embeddings=True)
+
+        def encode(texts):
+            return model.encode(texts, convert_to_numpy=True, normalize_embeddings=True)
+
+        batcher = MicroBatcher(encode, max_batch=max_batch, max_wait=max_wait_ms / 1000.0).start()
+        server = EncoderServer(path, batcher, emb.EMBED_MODEL_NAME)
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Codificador escuchando en {path} (lotes de hasta {max_batch}, espera {max_wait_ms} ms)."
+        ))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            logger.info("Codificador detenido: %s", batcher.stats)
+            self.stdout.write(f"Codificador detenido ({batcher.stats['requests']} pedidos en {batcher.stats['batches']} lotes).")
@@ -5,6 +5,7 @@ from django.core.management.base import BaseCommand
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from properties.models import Propiedad, MediaPropiedad
+from properties.search import gazetteer
 
 # Datos base
 tipos = ["Piso", "Casa", "Chalet", "Ático", "Dúplex", "Estudio", "Loft"]
@@ -24,11 +25,8 @@ imagenes_demo = [
 videos_demo = [
     "properties/muestra.mp4",
 ]
-barrios = [
-    "El Poblado", "Laureles", "Envigado", "Bello",
-    "Sabaneta", "Itagüí", "Robledo", "Belén",
-    "Castilla", "San Javier", "La América", "Buenos Aires"
-]
+# (barrio, municipio) del nomenclátor de búsqueda
+barrios = [(lugar.nombre, lugar.municipio) for lugar in gazetteer.barrios()]
 
 
 class Command(BaseCommand):
@@ -60,7 +58,8 @@ class Command(BaseCommand):
 
         # 🏡 Crear propiedades
         for _ in range(n):
-            nombre = f"{random.choice(tipos)} en {random.choice(barrios)}"
+            barrio, municipio = random.choice(barrios)
+            nombre = f"{random.choice(tipos)} en {barrio}"
             area = Decimal(random.randint(35, 250))
             precio_m2 = Decimal(random.randint(250000, 6000000))
             precio_total = precio_m2 * area
@@ -77,7 +76,7 @@ class Command(BaseCommand):
                 rooms=habitaciones,
                 bathrooms=banos,
                 parking_spaces=parqueaderos,
-                location="Medellín, Colombia",
+                location=f"{barrio}, {municipio}",
                 property_type=random.choice(tipos),
                 amenities=random.sample(zonas_comunes_opciones, k=random.randint(1, 3)),
                 pets_allowed=bool(random.getrandbits(1))
@@ -0,0 +1,59 @@
+from itertools import groupby
+
+from django.core.management.base import BaseCommand
+
+from properties.models import MediaPropiedad, Propiedad
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcula la portada desnormalizada (portada_media / portada_url) de todas las propiedades. "
+        "Las señales de MediaPropiedad la mantienen al día; esto es para el backfill o tras cargas masivas."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            dest="batch_size",
+            default=1000,
+            help="Propiedades por lote (por defecto: 1000)",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            dest="dry_run",
+            help="No guarda cambios: sólo muestra cuántas portadas cambiarían",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = max(1, options.get("batch_size") or 1000)
+        dry_run = options.get("dry_run")
+        revisadas = cambiadas = 0
+        ultimo_id = 0
+        while True:
+            # Lotes por id (keyset): una consulta de propiedades y una de su media por lote
+            lote = list(
+                Propiedad.objects.filter(id__gt=ultimo_id).order_by("id")
+                .only("id", "portada_media", "portada_url")[:batch_size]
+            )
+            if not lote:
+                break
+            ultimo_id = lote[-1].id
+            medias = MediaPropiedad.objects.filter(propiedad_id__in=[p.id for p in lote]).order_by("propiedad_id", "id")
+            por_propiedad = {pk: list(grupo) for pk, grupo in groupby(medias, key=lambda m: m.propiedad_id)}
+
+            cambios = []
+            for propiedad in lote:
+                media = MediaPropiedad.elegir_portada(por_propiedad.get(propiedad.id, []))
+                media_id, url = (media.pk, media.media_url) if media else (None, "")
+                if (media_id, url) != (propiedad.portada_media_id, propiedad.portada_url):
+                    propiedad.portada_media_id, propiedad.portada_url = media_id, url
+                    cambios.append(propiedad)
+            if cambios and not dry_run:
+                Propiedad.objects.bulk_update(cambios, ["portada_media", "portada_url"])
+            revisadas += len(lote)
+            cambiadas += len(cambios)
+
+        verbo = "cambiarían" if dry_run else "actualizadas"
+        self.stdout.write(self.style.SUCCESS(f"✅ {revisadas} propiedades revisadas, {cambiadas} portadas {verbo}."))
@@ -0,0 +1,20 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("properties", "0002_alter_propiedad_created_at"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ConsultaBusqueda",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("texto", models.CharField(max_length=255, unique=True)),
+                ("veces", models.PositiveIntegerField(default=0)),
+                ("ultima", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,76 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def asignar_ubicaciones(apps, schema_editor):
+    """Barrio/municipio de las propiedades existentes desde su ``location``."""
+    from properties.search import gazetteer
+
+    Propiedad = apps.get_model("properties", "Propiedad")
+    Municipio = apps.get_model("properties", "Municipio")
+    Barrio = apps.get_model("properties", "Barrio")
+    municipios, barrios = {}, {}
+    for prop in Propiedad.objects.only("id", "location").iterator(chunk_size=2000):
+        barrio, municipio = gazetteer.resolve_location(prop.location)
+        if municipio is None:
+            continue
+        if municipio.slug not in municipios:
+            municipios[municipio.slug] = Municipio.objects.get_or_create(
+                slug=municipio.slug, defaults={"nombre": municipio.nombre},
+            )[0]
+        prop.municipio = municipios[municipio.slug]
+        if barrio is not None:
+            if barrio.slug not in barrios:
+                barrios[barrio.slug] = Barrio.objects.get_or_create(
+                    slug=barrio.slug,
+                    defaults={"nombre": barrio.nombre, "comuna": barrio.comuna, "municipio": prop.municipio},
+                )[0]
+            prop.barrio = barrios[barrio.slug]
+        prop.save(update_fields=["barrio", "municipio"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("properties", "0003_consultabusqueda"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Municipio",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("nombre", models.CharField(max_length=100)),
+                ("slug", models.SlugField(max_length=100, unique=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="Barrio",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("nombre", models.CharField(max_length=100)),
+                ("slug", models.SlugField(max_length=120, unique=True)),
+                ("comuna", models.CharField(blank=True, max_length=100, null=True)),
+                ("municipio", models.ForeignKey(
+                    on_delete=django.db.models.deletion.CASCADE, related_name="barrios", to="properties.municipio",
+                )),
+            ],
+        ),
+        migrations.AddField(
+            model_name="propiedad",
+            name="barrio",
+            field=models.ForeignKey(
+                blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL,
+                related_name="propiedades", to="properties.barrio",
+            ),
+        ),
+        migrations.AddField(
+            model_name="propiedad",
+            name="municipio",
+            field=models.ForeignKey(
+                blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL,
+                related_name="propiedades", to="properties.municipio",
+            ),
+        ),
+        migrations.RunPython(asignar_ubicaciones, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("properties", "0004_barrio_municipio"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="propiedad",
+            index=models.Index(fields=["price_cop", "id"], name="propiedad_precio_id_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="propiedad",
+            index=models.Index(fields=["area_m2", "id"], name="propiedad_area_id_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="propiedad",
+            index=models.Index(fields=["created_at", "id"], name="propiedad_creado_id_idx"),
+        ),
+    ]
@@ -0,0 +1,25 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("properties", "0005_propiedad_keyset_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="propiedad",
+            name="portada_media",
+            field=models.ForeignKey(
+                blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL,
+                related_name="+", to="properties.mediapropiedad",
+            ),
+        ),
+        migrations.AddField(
+            model_name="propiedad",
+            name="portada_url",
+            field=models.CharField(blank=True, default="", editable=False, max_length=500),
+        ),
+    ]
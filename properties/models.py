@@ -5,8 +5,40 @@ from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
 from django.db import models
 
+from .search import gazetteer
+
 User = get_user_model()
 
+class Municipio(models.Model):
+    """Municipio normalizado (ver ``search/gazetteer.py``)."""
+    nombre = models.CharField(max_length=100)
+    slug = models.SlugField(max_length=100, unique=True)
+
+    def __str__(self):
+        return self.nombre
+
+    @classmethod
+    def desde_lugar(cls, lugar):
+        return cls.objects.get_or_create(slug=lugar.slug, defaults={"nombre": lugar.nombre})[0]
+
+
+class Barrio(models.Model):
+    """Barrio normalizado del nomenclátor; ``propiedades`` da el conteo por barrio."""
+    nombre = models.CharField(max_length=100)
+    slug = models.SlugField(max_length=120, unique=True)
+    comuna = models.CharField(max_length=100, blank=True, null=True)
+    municipio = models.ForeignKey(Municipio, related_name='barrios', on_delete=models.CASCADE)
+
+    def __str__(self):
+        return f"{self.nombre}, {self.municipio}"
+
+    @classmethod
+    def desde_lugar(cls, lugar, municipio):
+        return cls.objects.get_or_create(
+            slug=lugar.slug, defaults={"nombre": lugar.nombre, "comuna": lugar.comuna, "municipio": municipio},
+        )[0]
+
+
 class Propiedad(models.Model):
     # Relación con el propietario (owner)
     owner = models.ForeignKey(User, related_name='propiedades', on_delete=models.CASCADE, null=True, blank=True)
@@ -15,6 +47,9 @@ class Propiedad(models.Model):
     title = models.CharField(max_length=255, null=True, blank=True)
     description = models.TextField(blank=True, null=True)
     location = models.CharField(max_length=255)
+    # Normalizados desde ``location`` al guardar (ver ``asignar_ubicacion``)
+    barrio = models.ForeignKey(Barrio, related_name='propiedades', on_delete=models.SET_NULL, null=True, blank=True)
+    municipio = models.ForeignKey(Municipio, related_name='propiedades', on_delete=models.SET_NULL, null=True, blank=True)
     property_type = models.CharField(max_length=50, choices=[
         ('Apartamento', 'Apartamento'),
         ('Casa', 'Casa'),
@@ -51,13 +86,100 @@ class Propiedad(models.Model):
     pets_allowed = models.BooleanField(default=False)
     furnished = models.BooleanField(default=False)
 
+    # Portada desnormalizada para las tarjetas: la mantienen las señales de
+    # ``MediaPropiedad`` (ver ``actualizar_portada``) y ``manage.py portadas``
+    portada_media = models.ForeignKey(
+        'MediaPropiedad', related_name='+', on_delete=models.SET_NULL, null=True, blank=True, editable=False,
+    )
+    portada_url = models.CharField(max_length=500, blank=True, default='', editable=False)
+
     # Fechas
     created_at = models.DateTimeField(auto_now_add=True, null=True, blank=True)
     updated_at = models.DateTimeField(auto_now=True, null=True, blank=True)
 
+    class Meta:
+        # Paginación por keyset (search/keyset.py): cada orden busca por (columna, id)
+        indexes = [
+            models.Index(fields=["price_cop", "id"], name="propiedad_precio_id_idx"),
+            models.Index(fields=["area_m2", "id"], name="propiedad_area_id_idx"),
+            models.Index(fields=["created_at", "id"], name="propiedad_creado_id_idx"),
+        ]
+
     def __str__(self):
         return f"{self.title} - {self.location}"
 
+    def asignar_ubicacion(self):
+        """Barrio y municipio normalizados a partir de ``location``."""
+        barrio, municipio = gazetteer.resolve_location(self.location)
+        self.municipio = Municipio.desde_lugar(municipio) if municipio else None
+        self.barrio = Barrio.desde_lugar(barrio, self.municipio) if barrio else None
+
+    CAMPOS_PORTADA = ("portada_media", "portada_url")
+
+    @property
+    def portada(self):
+        """URL de la portada para las tarjetas (o None), sin consultar la media."""
+        return self.portada_url or None
+
+    def actualizar_portada(self):
+        """Recalcula la portada desde la media actual. Devuelve True si cambió."""
+        media = MediaPropiedad.elegir_portada(self.media.order_by('id'))
+        media_id, url = (media.pk, media.media_url) if media else (None, '')
+        if (media_id, url) == (self.portada_media_id, self.portada_url):
+            return False
+        self.portada_media_id, self.portada_url = media_id, url
+        # update() y no save(): cambiar la portada no re-indexa ni re-normaliza la ubicación
+        Propiedad.objects.filter(pk=self.pk).update(portada_media_id=media_id, portada_url=url)
+        return True
+
+    # Valores leídos de la BD, para saber en ``save()`` qué cambió en la instancia
+    _CAMPOS_VIGILADOS = ("location", "portada_media_id", "portada_url")
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        cargados = dict(zip(field_names, values))
+        instance._cargado = {k: cargados[k] for k in cls._CAMPOS_VIGILADOS if k in cargados}
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        self._marcar_cargado(fields)
+
+    def _marcar_cargado(self, fields=None):
+        deferred = self.get_deferred_fields()
+        cargado = getattr(self, "_cargado", {})
+        for attname in self._CAMPOS_VIGILADOS:
+            if attname not in deferred and (fields is None or attname in fields or attname.removesuffix("_id") in fields):
+                cargado[attname] = getattr(self, attname)
+        self._cargado = cargado
+
+    def _sin_cambios(self, attname):
+        """True si ``attname`` conserva el valor con que se leyó de la BD."""
+        cargado = getattr(self, "_cargado", {})
+        return attname in cargado and getattr(self, attname) == cargado[attname]
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get("update_fields")
+        nueva = self._state.adding or kwargs.get("force_insert")
+        campos = update_fields if update_fields is not None else {
+            f.attname for f in self._meta.concrete_fields if f.attname not in self.get_deferred_fields()
+        }
+        # Barrio y municipio sólo se resuelven de nuevo si ``location`` cambió
+        if "location" in campos and (nueva or not self._sin_cambios("location")):
+            self.asignar_ubicacion()
+            if update_fields is not None:
+                kwargs["update_fields"] = {*update_fields, "barrio", "municipio"}
+        # La portada la escriben las señales de la media: una instancia cargada
+        # antes de subir o borrar fotos no debe pisarla con la que leyó
+        if not nueva and {"portada_media", "portada_media_id", "portada_url"} & set(campos) \
+                and self._sin_cambios("portada_media_id") and self._sin_cambios("portada_url"):
+            actual = Propiedad.objects.filter(pk=self.pk).values_list("portada_media_id", "portada_url").first()
+            if actual is not None:
+                self.portada_media_id, self.portada_url = actual
+        super().save(*args, **kwargs)
+        self._marcar_cargado(kwargs.get("update_fields"))
+
     @property
     def price_m2(self):
         """Computed price per square meter (COP per m2).
@@ -186,6 +308,13 @@ class MediaPropiedad(models.Model):
 
         super().save(*args, **kwargs)
 
+    @staticmethod
+    def elegir_portada(medias):
+        """La media de portada: la primera imagen o, si no hay, la primera con URL."""
+        medias = [m for m in medias if m.media_url]
+        imagenes = [m for m in medias if m.tipo != 'video']
+        return (imagenes or medias or [None])[0]
+
     @property
     def media_url(self) -> str:
         """URL pública del recurso (archivo o remota)."""
@@ -232,4 +361,13 @@ class Favorite(models.Model):
         unique_together = ('user', 'propiedad')
 
     def __str__(self):
-        return f"{self.user.username} ❤️ {self.propiedad.title}"
\ No newline at end of file
+        return f"{self.user.username} ❤️ {self.propiedad.title}"
+
+class ConsultaBusqueda(models.Model):
+    """Consultas hechas en el buscador (normalizadas) y cuántas veces; alimentan las sugerencias."""
+    texto = models.CharField(max_length=255, unique=True)
+    veces = models.PositiveIntegerField(default=0)
+    ultima = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.texto} ({self.veces})"
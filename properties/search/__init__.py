@@ -0,0 +1,5 @@
+"""Componentes del motor de búsqueda semántica de propiedades.
+
+El punto de entrada sigue siendo ``properties.management.commands.embeddings``;
+aquí viven las piezas auxiliares (índice incremental, almacenamiento, etc.).
+"""
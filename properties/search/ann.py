@@ -0,0 +1,163 @@
+"""
+Índices de vecinos aproximados (ANN) para la búsqueda semántica.
+
+Backends disponibles:
+
+  - ``exact``: recorre todas las filas (fuerza bruta). Es lo correcto para
+    catálogos pequeños y sirve de referencia para medir recall.
+  - ``ivf``:   IVF-flat. Un k-means esférico agrupa las filas en ``nlist``
+    listas; cada consulta sólo puntúa las ``nprobe`` listas cuyos centroides
+    están más cerca. ``nprobe`` es la perilla recall/latencia.
+
+El índice IVF se guarda junto a la base (``property_embeddings.ivf.npz``) y
+guarda índices de fila, así que funciona con cualquier variante del
+``VectorStore`` (float32, float16, int8).
+"""
+import os
+import time
+
+import numpy as np
+
+from .store import BLOCK_ROWS, normalize_rows as _normalize, top_k
+
+TRAIN_SAMPLE = 100_000  # filas máximas para entrenar el k-means
+ASSIGN_MAX_SIMS = 4 * 1024 * 1024  # similitudes temporales por bloque al asignar (16 MB en float32)
+
+
+def ivf_path(embed_path):
+    stem, _ = os.path.splitext(embed_path)
+    return f"{stem}.ivf.npz"
+
+
+def default_nlist(n_rows):
+    """Heurística habitual: ~4·sqrt(N) listas."""
+    return max(1, min(n_rows, int(4 * np.sqrt(n_rows))))
+
+
+def _assign(data, centroids):
+    """Lista (centroide más cercano) de cada fila, recorriendo por bloques.
+
+    El bloque se achica con el número de centroides para que la matriz
+    bloque × nlist no pase de ``ASSIGN_MAX_SIMS`` valores.
+    """
+    labels = np.empty(data.shape[0], dtype=np.int32)
+    rows = max(1, min(BLOCK_ROWS, ASSIGN_MAX_SIMS // max(1, centroids.shape[0])))
+    for start in range(0, data.shape[0], rows):
+        block = _normalize(data[start:start + rows])
+        labels[start:start + block.shape[0]] = np.argmax(block @ centroids.T, axis=1)
+    return labels
+
+
+def kmeans(vecs, k, iters=20, seed=0):
+    """k-means esférico (similitud coseno) sobre ``vecs``. Devuelve los centroides.
+
+    La asignación recorre ``vecs`` por bloques (``_assign``): con 100.000
+    filas y miles de listas la matriz completa de similitudes ocuparía GB.
+    ``k`` no puede superar el número de filas.
+    """
+    vecs = _normalize(vecs)
+    rng = np.random.default_rng(seed)
+    centroids = vecs[rng.choice(len(vecs), size=k, replace=False)].copy()
+    for _ in range(iters):
+        labels = _assign(vecs, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, vecs)
+        counts = np.bincount(labels, minlength=k)
+        empty = counts == 0
+        if empty.any():
+            # Reubicar centroides vacíos en filas al azar
+            sums[empty] = vecs[rng.choice(len(vecs), size=int(empty.sum()), replace=False)]
+        centroids = _normalize(sums)
+    return centroids
+
+
+class IVFIndex:
+    """Índice invertido: centroides + filas agrupadas por lista."""
+
+    def __init__(self, centroids, order, offsets):
+        self.centroids = centroids  # (nlist, d) normalizados
+        self.order = order          # índices de fila ordenados por lista
+        self.offsets = offsets      # order[offsets[i]:offsets[i+1]] = filas de la lista i
+
+    @property
+    def nlist(self):
+        return self.centroids.shape[0]
+
+    @property
+    def n_rows(self):
+        return int(self.order.shape[0])
+
+    @classmethod
+    def from_centroids(cls, data, centroids):
+        labels = _assign(data, centroids)
+        order = np.argsort(labels, kind="stable").astype(np.int64)
+        counts = np.bincount(labels, minlength=centroids.shape[0])
+        offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        return cls(centroids, order, offsets)
+
+    @classmethod
+    def build(cls, data, nlist=None, iters=20, seed=0):
+        """Entrena el k-means (sobre una muestra si hay muchas filas) y asigna todo."""
+        n = data.shape[0]
+        nlist = nlist or default_nlist(n)
+        rng = np.random.default_rng(seed)
+        if n > TRAIN_SAMPLE:
+            sample = np.sort(rng.choice(n, size=TRAIN_SAMPLE, replace=False))
+            train = data[sample]
+        else:
+            train = data[:]
+        # No puede haber más listas que filas de entrenamiento (``--nlist`` grande)
+        nlist = max(1, min(int(nlist), len(train)))
+        centroids = kmeans(train, nlist, iters=iters, seed=seed)
+        return cls.from_centroids(data, centroids)
+
+    def save(self, path):
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as fh:
+            np.savez(fh, centroids=self.centroids, order=self.order, offsets=self.offsets)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data["centroids"], data["order"], data["offsets"])
+
+    def candidates(self, query, nprobe):
+        """Filas de las ``nprobe`` listas más cercanas a ``query`` (vector 1-D)."""
+        nprobe = max(1, min(int(nprobe), self.nlist))
+        sims = self.centroids @ _normalize(np.atleast_2d(query))[0]
+        if nprobe < self.nlist:
+            lists = np.argpartition(-sims, nprobe - 1)[:nprobe]
+        else:
+            lists = np.arange(self.nlist)
+        return np.concatenate([self.order[self.offsets[i]:self.offsets[i + 1]] for i in lists])
+
+
+def nprobe_report(store, index, nprobes=(1, 2, 4, 8, 16, 32), k=10, sample=100, seed=0):
+    """Recall@k y latencia del IVF frente a la búsqueda exacta para varios ``nprobe``."""
+    n = len(store)
+    k = min(k, n)
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(n, size=min(sample, n), replace=False)
+    queries = np.asarray(store.data[picks], dtype=np.float32)
+    exact = top_k(store.cosine(queries), k)
+    report = []
+    for nprobe in nprobes:
+        if nprobe > index.nlist:
+            break
+        hits, scanned = 0, 0
+        start = time.perf_counter()
+        for query, truth in zip(queries, exact):
+            rows = index.candidates(query, nprobe)
+            sims = store.cosine(query, rows=rows)[0]
+            top = rows[top_k(sims, k)]
+            hits += len(set(top) & set(truth))
+            scanned += len(rows)
+        elapsed = time.perf_counter() - start
+        report.append({
+            "nprobe": nprobe,
+            "recall": hits / float(k * len(queries)),
+            "scanned": scanned / float(len(queries)),
+            "ms_per_query": 1000.0 * elapsed / len(queries),
+        })
+    return report
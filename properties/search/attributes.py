@@ -0,0 +1,164 @@
+"""
+Almacén columnar de atributos alineado con las filas del índice de embeddings.
+
+Guarda en arrays de numpy (``property_embeddings.attrs.npz``) los campos por
+los que se filtra la búsqueda, en el mismo orden que ``property_ids.joblib``.
+Así los filtros estructurados se aplican como una máscara booleana *antes*
+del top-k: una búsqueda filtrada devuelve una página llena sin pedir más
+resultados al motor ni rehacer la consulta.
+"""
+import os
+
+import numpy as np
+
+# Campos del modelo Propiedad que se guardan (y su dtype en el almacén)
+FIELDS = {
+    "price_cop": np.int64,
+    "area_m2": np.float32,
+    "rooms": np.int16,
+    "bathrooms": np.int16,
+    "parking_spaces": np.int16,
+    "estrato": np.int8,          # -1 = sin dato
+    "pets_allowed": np.bool_,
+    "property_type": np.int16,   # código en ``TYPE_CODES`` (-1 = otro/sin dato)
+    "barrio_id": np.int32,       # -1 = sin barrio reconocido
+    "municipio_id": np.int32,
+}
+
+# Códigos estables: si se agrega un tipo al modelo, se agrega al final
+TYPE_CODES = {"Apartamento": 0, "Casa": 1, "Lote": 2, "Oficina": 3, "Otro": 4}
+
+# Con más ids que esto se recorre la tabla completa en vez de un IN (...) gigante
+IN_QUERY_LIMIT = 900
+
+# Parámetros GET del buscador que entiende ``AttributeStore.mask``
+FILTER_KEYS = (
+    "precio_min", "precio_max", "rooms", "bathrooms", "parking_spaces",
+    "area_min", "area_max", "tipo", "garaje", "mascotas", "estrato", "barrio", "municipio",
+)
+
+
+def attrs_path(embed_path):
+    stem, _ = os.path.splitext(embed_path)
+    return f"{stem}.attrs.npz"
+
+
+def row_attrs(source):
+    """Atributos de una propiedad (instancia del modelo o dict de ``.values()``)."""
+    get = source.get if isinstance(source, dict) else (lambda name: getattr(source, name, None))
+    estrato = get("estrato")
+    return {
+        "price_cop": int(get("price_cop") or 0),
+        "area_m2": float(get("area_m2") or 0),
+        "rooms": int(get("rooms") or 0),
+        "bathrooms": int(get("bathrooms") or 0),
+        "parking_spaces": int(get("parking_spaces") or 0),
+        "estrato": int(estrato) if estrato is not None else -1,
+        "pets_allowed": bool(get("pets_allowed")),
+        "property_type": TYPE_CODES.get(get("property_type"), -1),
+        "barrio_id": get("barrio_id") or -1,
+        "municipio_id": get("municipio_id") or -1,
+    }
+
+
+def _num(value, cast=float):
+    if value in (None, ""):
+        return None
+    try:
+        return cast(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def clean_filters(params):
+    """Extrae de un dict/QueryDict los filtros no vacíos que entiende el almacén."""
+    return {key: params.get(key) for key in FILTER_KEYS if params.get(key) not in (None, "")}
+
+
+class AttributeStore:
+    def __init__(self, columns):
+        self.columns = columns
+
+    def __len__(self):
+        return len(self.columns["price_cop"])
+
+    @classmethod
+    def from_rows(cls, rows):
+        rows = list(rows)
+        missing = row_attrs({})  # filas del delta guardadas antes de agregar una columna
+        return cls({
+            name: np.fromiter((row.get(name, missing[name]) for row in rows), dtype=dtype, count=len(rows))
+            for name, dtype in FIELDS.items()
+        })
+
+    @classmethod
+    def from_db(cls, property_ids):
+        """Construye el almacén para ``property_ids`` con una sola consulta ``.values()``."""
+        from properties.models import Propiedad
+
+        qs = Propiedad.objects.all()
+        if len(property_ids) <= IN_QUERY_LIMIT:
+            qs = qs.filter(id__in=property_ids)
+        by_id = {row["id"]: row_attrs(row) for row in qs.values("id", *FIELDS).iterator(chunk_size=2000)}
+        missing = row_attrs({})
+        return cls.from_rows(by_id.get(pk, missing) for pk in property_ids)
+
+    def save(self, path):
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as fh:
+            np.savez(fh, **self.columns)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        """Almacén guardado en ``path``; ``KeyError`` si le falta alguna columna de ``FIELDS``."""
+        with np.load(path) as data:
+            return cls({name: data[name] for name in FIELDS})
+
+    def take(self, rows):
+        return AttributeStore({name: col[rows] for name, col in self.columns.items()})
+
+    def concat(self, other):
+        return AttributeStore({
+            name: np.concatenate([col, other.columns[name]]) for name, col in self.columns.items()
+        })
+
+    def mask(self, filters):
+        """Máscara booleana de filas que cumplen ``filters`` (None si no hay filtros).
+
+        Replica la semántica de los filtros SQL de ``views.buscar_propiedades``;
+        los valores inválidos se ignoran igual que un campo vacío.
+        """
+        if not filters:
+            return None
+        c = self.columns
+        conds = []
+        bounds = (
+            ("precio_min", "price_cop", np.greater_equal, int),
+            ("precio_max", "price_cop", np.less_equal, int),
+            ("area_min", "area_m2", np.greater_equal, float),
+            ("area_max", "area_m2", np.less_equal, float),
+        )
+        for key, field, op, cast in bounds:
+            value = _num(filters.get(key), cast)
+            if value is not None:
+                conds.append(op(c[field], value))
+        for key in ("rooms", "bathrooms", "parking_spaces", "estrato"):
+            value = _num(filters.get(key), int)
+            if value is not None:
+                conds.append(c[key] == value)
+        # ``barrio``/``municipio`` llegan como ids (la vista traduce el slug)
+        for key in ("barrio", "municipio"):
+            value = _num(filters.get(key), int)
+            if value is not None:
+                conds.append(c[f"{key}_id"] == value)
+        tipo = filters.get("tipo")
+        if tipo:
+            conds.append(c["property_type"] == TYPE_CODES.get(tipo, -2))
+        if str(filters.get("garaje")) == "1":
+            conds.append(c["parking_spaces"] > 0)
+        if str(filters.get("mascotas")) == "1":
+            conds.append(c["pets_allowed"])
+        if not conds:
+            return None
+        return np.logical_and.reduce(conds)
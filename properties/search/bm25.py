@@ -0,0 +1,172 @@
+"""
+Índice invertido BM25 en memoria para la parte léxica de la búsqueda.
+
+Complementa a los embeddings: encuentra coincidencias exactas ("Laureles",
+un ``codigo_fincaraiz``) que el modelo trata de forma difusa, y sirve de
+respaldo con ranking cuando el modelo no está disponible, en lugar de los
+``icontains`` sobre toda la tabla.
+
+Los textos se normalizan igual que las consultas (minúsculas, sin tildes) y
+pasan por un stemmer ligero para español (plurales y género). Las postings
+se guardan en formato CSR (``indptr``/``docs``/``tfs``) en un ``.npz``.
+"""
+import os
+import re
+
+import numpy as np
+
+from .query_cache import normalize_query
+from .store import top_k
+
+K1 = 1.2
+B = 0.75
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_VOWELS = set("aeiou")
+STOPWORDS = frozenset("""
+a al con de del el en es la las lo los o para por que se sin su sus un una unos unas y
+""".split())
+
+
+def stem(word):
+    """Stemmer ligero para español: quita plural y vocal de género.
+
+    No pretende ser lingüísticamente exacto, sólo que "casas"/"casa",
+    "apartamentos"/"apartamento" o "habitaciones"/"habitación" coincidan.
+    Los tokens con dígitos (códigos, áreas) se dejan intactos.
+    """
+    if len(word) < 4 or not word.isalpha():
+        return word
+    if word.endswith("iones"):
+        word = word[:-5] + "ion"
+    elif word.endswith("ces"):
+        word = word[:-3] + "z"
+    elif word.endswith("es") and len(word) > 4 and word[-3] not in _VOWELS:
+        word = word[:-2]
+    elif word.endswith("s"):
+        word = word[:-1]
+    if len(word) > 4 and word[-1] in "aoe":
+        word = word[:-1]
+    return word
+
+
+def tokenize(text):
+    return [stem(tok) for tok in _TOKEN_RE.findall(normalize_query(text)) if tok not in STOPWORDS]
+
+
+def bm25_path(embed_path):
+    stem_, _ = os.path.splitext(embed_path)
+    return f"{stem_}.bm25.npz"
+
+
+class BM25Index:
+    def __init__(self, ids, terms, indptr, docs, tfs, doc_len):
+        self.ids = ids              # id de propiedad de cada documento
+        self.terms = terms          # término -> posición en indptr
+        self.indptr = indptr
+        self.docs = docs
+        self.tfs = tfs
+        self.doc_len = doc_len
+        n = len(doc_len)
+        self.avgdl = float(doc_len.mean()) if n else 0.0
+        df = np.diff(indptr)
+        self.idf = np.log1p((n - df + 0.5) / (df + 0.5)).astype(np.float32)
+
+    def __len__(self):
+        return len(self.doc_len)
+
+    @classmethod
+    def build(cls, ids, texts):
+        postings = {}
+        doc_len = np.zeros(len(ids), dtype=np.float32)
+        for doc, text in enumerate(texts):
+            tokens = tokenize(text)
+            doc_len[doc] = len(tokens)
+            counts = {}
+            for tok in tokens:
+                counts[tok] = counts.get(tok, 0) + 1
+            for tok, tf in counts.items():
+                postings.setdefault(tok, []).append((doc, tf))
+        terms = {tok: i for i, tok in enumerate(sorted(postings))}
+        indptr = np.zeros(len(terms) + 1, dtype=np.int64)
+        for tok, i in terms.items():
+            indptr[i + 1] = len(postings[tok])
+        indptr = np.cumsum(indptr)
+        docs = np.empty(indptr[-1], dtype=np.int32)
+        tfs = np.empty(indptr[-1], dtype=np.float32)
+        for tok, i in terms.items():
+            pairs = np.asarray(postings[tok], dtype=np.int64).reshape(-1, 2)
+            docs[indptr[i]:indptr[i + 1]] = pairs[:, 0]
+            tfs[indptr[i]:indptr[i + 1]] = pairs[:, 1]
+        return cls(list(ids), terms, indptr, docs, tfs, doc_len)
+
+    def save(self, path):
+        vocab = sorted(self.terms, key=self.terms.get)
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as fh:
+            np.savez(
+                fh, ids=np.asarray(self.ids, dtype=np.int64), vocab=np.asarray(vocab, dtype=str),
+                indptr=self.indptr, docs=self.docs, tfs=self.tfs, doc_len=self.doc_len,
+            )
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            terms = {str(tok): i for i, tok in enumerate(data["vocab"])}
+            return cls([int(x) for x in data["ids"]], terms, data["indptr"], data["docs"],
+                       data["tfs"], data["doc_len"])
+
+    def _idf_for(self, tok):
+        i = self.terms.get(tok)
+        if i is not None:
+            return self.idf[i]
+        return np.log1p((len(self) + 0.5) / 0.5)
+
+    def scores(self, query):
+        """Puntaje BM25 de cada documento para ``query`` (0 = sin coincidencias)."""
+        out = np.zeros(len(self), dtype=np.float32)
+        for tok in set(tokenize(query)):
+            i = self.terms.get(tok)
+            if i is None:
+                continue
+            start, end = self.indptr[i], self.indptr[i + 1]
+            docs, tf = self.docs[start:end], self.tfs[start:end]
+            norm = K1 * (1 - B + B * self.doc_len[docs] / (self.avgdl or 1.0))
+            out[docs] += self.idf[i] * tf * (K1 + 1) / (tf + norm)
+        return out
+
+    def search(self, query, k, mask=None):
+        """(docs, scores) de los ``k`` mejores documentos con alguna coincidencia."""
+        scores = self.scores(query)
+        if mask is not None:
+            scores[~mask] = 0.0
+        docs = top_k(scores, k)
+        docs = docs[scores[docs] > 0]
+        return docs, scores[docs]
+
+    def score_texts(self, query, texts):
+        """Puntaje BM25 de textos sueltos (p. ej. filas del delta) con las
+        estadísticas (idf, largo medio) del índice."""
+        q_tokens = set(tokenize(query))
+        out = np.zeros(len(texts), dtype=np.float32)
+        if not q_tokens:
+            return out
+        for n, text in enumerate(texts):
+            tokens = tokenize(text or "")
+            norm = K1 * (1 - B + B * len(tokens) / (self.avgdl or 1.0))
+            for tok in q_tokens:
+                tf = tokens.count(tok)
+                if tf:
+                    out[n] += self._idf_for(tok) * tf * (K1 + 1) / (tf + norm)
+        return out
+
+
+def reciprocal_rank_fusion(rankings, k=60, limit=None):
+    """Fusiona listas de ids ordenadas con RRF: score = Σ 1 / (k + rank)."""
+    fused = {}
+    for ranking in rankings:
+        for rank, pk in enumerate(ranking, start=1):
+            fused[pk] = fused.get(pk, 0.0) + 1.0 / (k + rank)
+    ordered = sorted(fused.items(), key=lambda item: item[1], reverse=True)
+    return ordered[:limit] if limit else ordered
@@ -0,0 +1,276 @@
+"""
+Build del índice en streaming, por lotes y reanudable.
+
+Las propiedades se leen con ``.values()`` / ``.iterator()`` en lotes de
+tamaño fijo (sin instanciar modelos ni juntar todo el corpus en una lista) y
+cada lote se codifica en un pool de procesos del tamaño de los núcleos. Cada
+lote codificado se escribe como un shard en disco y se anota en un
+checkpoint, así que un build interrumpido continúa desde el último shard:
+
+    search_index/build/
+      checkpoint.json     # modelo, marca de agua de la BD, último id y shards escritos
+      shard-000000.npz    # ids, vecs (normalizados), huellas, atributos y textos BM25 del lote
+      ...
+
+Al terminar, los shards se juntan en una versión del índice (ver
+``manifest.py``) y el directorio se borra.
+
+Cada versión guarda además la huella del texto codificado de cada fila
+(``property_embeddings.hashes.npy``). En un rebuild, las filas cuya huella no
+cambió reutilizan el vector de la versión activa en lugar de recodificarse.
+"""
+import hashlib
+import json
+import os
+import shutil
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import numpy as np
+
+from .store import normalize_rows
+
+CHECKPOINT = "checkpoint.json"
+IN_FLIGHT_PER_WORKER = 2  # lotes en cola por proceso (acota la memoria del pipeline)
+
+_worker_model = None  # modelo cargado una vez por proceso del pool
+
+
+def text_hash(text):
+    """Huella (blake2b de 64 bits, nunca 0) del texto que se codifica de una propiedad."""
+    digest = int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+    return digest or 1
+
+
+def hashes_path(embed_path):
+    stem, _ = os.path.splitext(embed_path)
+    return f"{stem}.hashes.npy"
+
+
+class PreviousVectors:
+    """Vectores y huellas de una versión anterior, para no recodificar filas sin cambios.
+
+    Una huella 0 significa "desconocida" (p. ej. filas que vinieron del delta)
+    y nunca coincide, así que esa fila se vuelve a codificar.
+    """
+
+    def __init__(self, ids, vecs, hashes):
+        self.vecs = vecs
+        self.hashes = hashes
+        self._pos = {int(pk): i for i, pk in enumerate(ids)}
+
+    @classmethod
+    def load(cls, ids, embed_path):
+        """None si la versión no tiene huellas (builds anteriores) o no están alineadas."""
+        path = hashes_path(embed_path)
+        if not os.path.exists(path):
+            return None
+        hashes = np.load(path)
+        if len(hashes) != len(ids):
+            return None
+        return cls(ids, np.load(embed_path, mmap_mode="r"), hashes)
+
+    def reuse(self, ids, hashes):
+        """Devuelve (posiciones a codificar, vecs con las filas reutilizadas o None)."""
+        need, found, rows = [], [], []
+        for i, (pk, digest) in enumerate(zip(ids, hashes)):
+            row = self._pos.get(int(pk))
+            if row is not None and digest and int(self.hashes[row]) == digest:
+                found.append(i)
+                rows.append(row)
+            else:
+                need.append(i)
+        if not found:
+            return need, None
+        vecs = np.empty((len(ids), self.vecs.shape[1]), dtype=np.float32)
+        vecs[found] = self.vecs[np.asarray(rows, dtype=np.int64)]
+        return need, vecs
+
+
+def _init_worker(model_name, threads):
+    global _worker_model
+    import torch
+    # Sin esto cada proceso usaría todos los núcleos y competirían entre sí
+    torch.set_num_threads(threads)
+    from sentence_transformers import SentenceTransformer
+    _worker_model = SentenceTransformer(model_name)
+
+
+def _encode_in_worker(texts):
+    return np.asarray(
+        _worker_model.encode(texts, convert_to_numpy=True, normalize_embeddings=True), dtype=np.float32,
+    )
+
+
+def default_workers():
+    return os.cpu_count() or 1
+
+
+def iter_batches(queryset, fields, batch_size):
+    """Filas de ``queryset`` como dicts (``.values(*fields)``) en lotes de ``batch_size``."""
+    batch = []
+    for row in queryset.values(*fields).iterator(chunk_size=batch_size):
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class Checkpoint:
+    """Shards escritos y progreso de un build en ``work_dir``."""
+
+    def __init__(self, work_dir):
+        self.work_dir = work_dir
+        self.state = {}
+
+    @property
+    def path(self):
+        return os.path.join(self.work_dir, CHECKPOINT)
+
+    @property
+    def last_id(self):
+        return self.state.get("last_id")
+
+    @property
+    def rows(self):
+        return self.state.get("rows", 0)
+
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as fh:
+                self.state = json.load(fh)
+        except (OSError, ValueError):
+            self.state = {}
+        return self
+
+    def start(self, model, resume=True, **meta):
+        """Retoma el checkpoint si es del mismo modelo; si no, empieza de cero.
+
+        Devuelve True si se reanudó un build previo.
+        """
+        self.load()
+        if resume and self.state.get("model") == model and self.state.get("shards"):
+            return True
+        self.clear()
+        os.makedirs(self.work_dir, exist_ok=True)
+        self.state = {"model": model, "last_id": None, "rows": 0, "shards": [], **meta}
+        self._save()
+        return False
+
+    def _save(self):
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(self.state, fh, indent=2, ensure_ascii=False, default=str)
+        os.replace(tmp, self.path)
+
+    def write_shard(self, ids, vecs, attrs, texts, hashes=None):
+        """Guarda un lote codificado y avanza el checkpoint (en ese orden)."""
+        name = f"shard-{len(self.state['shards']):06d}.npz"
+        tmp = os.path.join(self.work_dir, f"{name}.tmp")
+        with open(tmp, "wb") as fh:
+            np.savez(
+                fh,
+                ids=np.asarray(ids, dtype=np.int64),
+                vecs=normalize_rows(vecs),
+                hashes=np.asarray(hashes if hashes is not None else [0] * len(ids), dtype=np.uint64),
+                attrs=np.array(json.dumps(attrs)),
+                texts=np.array(json.dumps(texts)),
+            )
+        os.replace(tmp, os.path.join(self.work_dir, name))
+        self.state["shards"].append(name)
+        self.state["last_id"] = int(ids[-1])
+        self.state["rows"] = self.rows + len(ids)
+        self._save()
+
+    def read(self):
+        """Devuelve (ids, vecs, hashes, attrs, texts) de todos los shards, en orden."""
+        ids, vecs, hashes, attrs, texts = [], [], [], [], []
+        for name in self.state.get("shards", []):
+            with np.load(os.path.join(self.work_dir, name)) as data:
+                ids.extend(int(x) for x in data["ids"])
+                vecs.append(data["vecs"].astype(np.float32, copy=False))
+                # Shards de builds anteriores a las huellas: 0 = desconocida
+                hashes.append(data["hashes"] if "hashes" in data else np.zeros(len(data["ids"]), np.uint64))
+                attrs.extend(json.loads(str(data["attrs"])))
+                texts.extend(json.loads(str(data["texts"])))
+        if not vecs:
+            return ids, np.zeros((0, 0), np.float32), np.zeros(0, np.uint64), attrs, texts
+        return ids, np.vstack(vecs), np.concatenate(hashes), attrs, texts
+
+    def clear(self):
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+        self.state = {}
+
+
+def encode_batches(batches, checkpoint, encode, model_name, workers=1, previous=None, report=print):
+    """Codifica ``batches`` y escribe un shard por lote en ``checkpoint``.
+
+    Cada lote es una tupla (ids, textos a codificar, huellas, atributos,
+    textos BM25) con ids crecientes. Con ``previous`` (``PreviousVectors``)
+    sólo se codifican las filas cuya huella cambió; las demás reutilizan su
+    vector. Con ``workers`` > 1 los lotes se codifican en un pool de procesos
+    (cada uno carga ``model_name`` una vez); si no, con ``encode`` en este
+    proceso. Los shards se escriben en el orden de los lotes, así que
+    ``last_id`` del checkpoint siempre marca un prefijo completo. Informa el
+    avance y las filas/s con ``report``.
+    """
+    started = time.perf_counter()
+    done = reused = 0
+
+    def plan(batch):
+        ids, texts, hashes = batch[0], batch[1], batch[2]
+        if previous is None:
+            return batch, list(range(len(ids))), None
+        need, vecs = previous.reuse(ids, hashes)
+        return batch, need, vecs
+
+    def write(planned, encoded):
+        nonlocal done, reused
+        (ids, _, hashes, attrs, lexical), need, vecs = planned
+        if vecs is None:
+            vecs = encoded
+        elif need:
+            vecs[need] = encoded
+        checkpoint.write_shard(ids, vecs, attrs, lexical, hashes)
+        done += len(ids)
+        reused += len(ids) - len(need)
+        elapsed = time.perf_counter() - started
+        report(f"  {checkpoint.rows} filas, {reused} reutilizadas ({done / elapsed if elapsed else 0:.0f} filas/s)")
+
+    def textos(planned):
+        batch, need, _ = planned
+        return [batch[1][i] for i in need]
+
+    if workers <= 1:
+        for batch in batches:
+            planned = plan(batch)
+            write(planned, encode(textos(planned)) if planned[1] else None)
+    else:
+        threads = max(1, default_workers() // workers)
+        # spawn: los hijos no heredan la conexión a la BD ni el estado de torch del padre
+        with ProcessPoolExecutor(
+            max_workers=workers, mp_context=get_context("spawn"),
+            initializer=_init_worker, initargs=(model_name, threads),
+        ) as pool:
+            pending = deque()
+            for batch in batches:
+                planned = plan(batch)
+                # Un lote sin cambios no pasa por el pool
+                future = pool.submit(_encode_in_worker, textos(planned)) if planned[1] else None
+                pending.append((planned, future))
+                if len(pending) >= workers * IN_FLIGHT_PER_WORKER:
+                    planned, future = pending.popleft()
+                    write(planned, future.result() if future else None)
+            while pending:
+                planned, future = pending.popleft()
+                write(planned, future.result() if future else None)
+
+    elapsed = time.perf_counter() - started
+    return {
+        "rows": done, "reused": reused, "seconds": elapsed,
+        "rows_per_sec": done / elapsed if elapsed else 0.0,
+    }
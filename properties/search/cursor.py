@@ -0,0 +1,27 @@
+"""
+Cursores opacos para paginar sin OFFSET.
+
+Un cursor guarda la posición del último elemento de la página anterior
+(p. ej. ``(score, id)`` en el ranking semántico) más el número de página,
+sólo para mostrarlo. Se firma con ``django.core.signing``: el cliente no
+puede fabricarlo ni alterarlo (sí leerlo: es base64), y uno inválido se
+trata como la primera página.
+"""
+from django.core import signing
+
+SALT = "properties.search.cursor"
+
+
+def encode(position, page):
+    return signing.dumps({"p": list(position), "n": page}, salt=SALT, compress=True)
+
+
+def decode(token):
+    """Devuelve (posición, página) o (None, 1) si no hay token o no es válido."""
+    if not token:
+        return None, 1
+    try:
+        data = signing.loads(token, salt=SALT)
+        return tuple(data["p"]), int(data["n"])
+    except (signing.BadSignature, KeyError, TypeError, ValueError):
+        return None, 1
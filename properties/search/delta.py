@@ -0,0 +1,181 @@
+"""
+Índice incremental de embeddings.
+
+La matriz base (``property_embeddings.npy``) sólo se reescribe en un build
+completo o en una compactación. Entre tanto, los cambios se acumulan en un
+segmento delta persistido en un ``.npz``:
+
+  - ``ids`` / ``vecs``: filas nuevas o actualizadas (una por propiedad).
+  - ``attrs``: atributos filtrables de esas filas (ver ``attributes.py``).
+  - ``texts``: texto léxico de esas filas, para puntuarlas con BM25.
+  - ``tombstones``: ids eliminados, que deben ocultarse de la base.
+
+Una propiedad actualizada aparece en el delta y su fila de la base queda
+oculta, así que nunca hay dos versiones visibles del mismo id.
+"""
+import json
+import os
+from contextlib import contextmanager
+
+import numpy as np
+
+from .attributes import AttributeStore
+from .store import normalize_rows
+
+try:  # fcntl no existe en Windows; allí se trabaja sin bloqueo entre procesos
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+
+@contextmanager
+def file_lock(path):
+    """Bloqueo exclusivo entre procesos usando un archivo ``<path>.lock``."""
+    lock_path = f"{path}.lock"
+    with open(lock_path, "a+") as fh:
+        if fcntl is not None:
+            fcntl.flock(fh.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+
+
+class DeltaIndex:
+    """Segmento delta + tombstones del índice de embeddings."""
+
+    def __init__(self, path, dim=None):
+        self.path = path
+        self.dim = dim
+        self.ids = []          # ids en orden de fila de ``vecs``
+        self.vecs = None       # np.ndarray (n, dim) float32
+        self.attrs = []        # dict de atributos por fila (o None si se desconocen)
+        self.texts = []        # texto para BM25 por fila ("" si se desconoce)
+        self.tombstones = set()
+        self._pos = {}         # id -> fila en ``vecs``
+        self._attr_store = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def size(self):
+        """Cantidad de cambios pendientes de compactar."""
+        return len(self.ids) + len(self.tombstones)
+
+    def mtime(self):
+        try:
+            return os.path.getmtime(self.path)
+        except OSError:
+            return None
+
+    # ------ Persistencia ------
+    def load(self):
+        """Recarga el delta desde disco (vacío si el archivo no existe)."""
+        self.ids, self.vecs, self.attrs, self.texts, self.tombstones, self._pos = [], None, [], [], set(), {}
+        self._attr_store = None
+        if not os.path.exists(self.path):
+            return self
+        with np.load(self.path) as data:
+            ids = [int(x) for x in data["ids"]]
+            vecs = data["vecs"].astype(np.float32, copy=False)
+            tombstones = {int(x) for x in data["tombstones"]}
+            attrs = json.loads(str(data["attrs"])) if "attrs" in data else [None] * len(ids)
+            texts = json.loads(str(data["texts"])) if "texts" in data else [""] * len(ids)
+        self.ids = ids
+        self.attrs = attrs
+        self.texts = texts
+        self.vecs = vecs if ids else None
+        self.tombstones = tombstones
+        self._pos = {pk: i for i, pk in enumerate(ids)}
+        if self.vecs is not None:
+            self.dim = self.vecs.shape[1]
+        return self
+
+    def save(self):
+        dim = self.dim or 0
+        vecs = self.vecs if self.vecs is not None else np.zeros((0, dim), dtype=np.float32)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "wb") as fh:
+            np.savez(
+                fh,
+                ids=np.asarray(self.ids, dtype=np.int64),
+                vecs=vecs,
+                attrs=np.array(json.dumps(self.attrs)),
+                texts=np.array(json.dumps(self.texts)),
+                tombstones=np.asarray(sorted(self.tombstones), dtype=np.int64),
+            )
+        os.replace(tmp, self.path)
+
+    def clear(self):
+        """Borra el delta (tras una compactación)."""
+        self.ids, self.vecs, self.attrs, self.texts, self.tombstones, self._pos = [], None, [], [], set(), {}
+        self._attr_store = None
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    # ------ Cambios ------
+    def upsert(self, prop_id, vec, attrs=None, text=""):
+        """Inserta o reemplaza el vector (normalizado), atributos y texto de una propiedad."""
+        prop_id = int(prop_id)
+        vec = normalize_rows(np.asarray(vec, dtype=np.float32).reshape(1, -1))
+        self.tombstones.discard(prop_id)
+        self._attr_store = None
+        if prop_id in self._pos:
+            self.vecs[self._pos[prop_id]] = vec[0]
+            self.attrs[self._pos[prop_id]] = attrs
+            self.texts[self._pos[prop_id]] = text
+            return
+        self.dim = vec.shape[1]
+        self.vecs = vec if self.vecs is None else np.vstack([self.vecs, vec])
+        self._pos[prop_id] = len(self.ids)
+        self.ids.append(prop_id)
+        self.attrs.append(attrs)
+        self.texts.append(text)
+
+    def delete(self, prop_id):
+        """Marca una propiedad como eliminada (tombstone)."""
+        prop_id = int(prop_id)
+        if prop_id in self._pos:
+            keep = [i for i, pk in enumerate(self.ids) if pk != prop_id]
+            self.ids = [self.ids[i] for i in keep]
+            self.attrs = [self.attrs[i] for i in keep]
+            self.texts = [self.texts[i] for i in keep]
+            self.vecs = self.vecs[keep] if keep else None
+            self._attr_store = None
+            self._pos = {pk: i for i, pk in enumerate(self.ids)}
+        self.tombstones.add(prop_id)
+
+    def hidden_ids(self):
+        """Ids cuya fila en la base ya no es válida (borrados o reemplazados)."""
+        return self.tombstones | set(self._pos)
+
+    def attribute_store(self):
+        """Atributos de las filas del delta como ``AttributeStore`` (cacheado).
+
+        Las filas sin atributos (deltas anteriores a este formato) se consultan
+        en la base de datos.
+        """
+        if self._attr_store is None:
+            if any(a is None for a in self.attrs):
+                self._attr_store = AttributeStore.from_db(self.ids)
+            else:
+                self._attr_store = AttributeStore.from_rows(self.attrs)
+        return self._attr_store
+
+    def merge_into(self, base_ids, base_vecs, base_attrs=None):
+        """Devuelve (ids, vecs, attrs) de la base con el delta aplicado.
+
+        ``attrs`` es None si no se pasó ``base_attrs``.
+        """
+        hidden = self.hidden_ids()
+        keep = [i for i, pk in enumerate(base_ids) if pk not in hidden]
+        ids = [base_ids[i] for i in keep] + list(self.ids)
+        parts = [np.asarray(base_vecs[keep], dtype=np.float32)]
+        if self.vecs is not None:
+            parts.append(self.vecs)
+        attrs = None
+        if base_attrs is not None:
+            attrs = base_attrs.take(np.asarray(keep, dtype=np.int64)).concat(self.attribute_store())
+        return ids, np.vstack(parts), attrs
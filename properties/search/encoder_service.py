@@ -0,0 +1,253 @@
+"""
+Servicio local de codificación de consultas (fuera de los workers web).
+
+Un solo proceso tiene el modelo cargado y atiende por un socket Unix:
+
+    python manage.py encoder_service            # EMBEDDINGS_ENCODER_SOCKET
+
+Las peticiones concurrentes se juntan en micro-lotes: el primer pedido
+espera como máximo ``max_wait`` segundos a que lleguen otros (hasta
+``max_batch`` textos) y todos se codifican en un único ``encode``. Los
+workers usan ``EncoderClient`` y, si el servicio no responde, el modelo
+local (ver ``_codificar`` en ``embeddings.py``).
+
+Protocolo: cada mensaje es un entero de 4 bytes (big-endian) con el largo
+del cuerpo, seguido del cuerpo.
+
+  - petición:  JSON ``{"texts": [...]}`` o ``{"ping": true}``
+  - respuesta: JSON ``{"shape": [n, d]}`` y un segundo mensaje con los
+    ``n * d`` float32 (little-endian), o JSON ``{"error": "..."}``
+"""
+import json
+import logging
+import os
+import queue
+import socket
+import socketserver
+import struct
+import threading
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_HEADER = struct.Struct(">I")
+CONNECT_RETRY_SECONDS = 0.005  # espera entre intentos de conexión con la cola del socket llena
+
+
+def _send(sock, payload):
+    sock.sendall(_HEADER.pack(len(payload)) + payload)
+
+
+def _recv_exact(sock, n):
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            raise ConnectionError("Conexión cerrada por el otro extremo.")
+        buf.extend(chunk)
+    return bytes(buf)
+
+
+def _recv(sock):
+    (size,) = _HEADER.unpack(_recv_exact(sock, _HEADER.size))
+    return _recv_exact(sock, size)
+
+
+class _Pending:
+    __slots__ = ("texts", "result", "error", "done")
+
+    def __init__(self, texts):
+        self.texts = texts
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class MicroBatcher:
+    """Junta pedidos concurrentes de ``encode`` en un solo llamado al modelo."""
+
+    def __init__(self, encode, max_batch=64, max_wait=0.005):
+        self.encode = encode
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.queue = queue.Queue()
+        self.stats = {"requests": 0, "batches": 0, "texts": 0}
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="encoder-batcher", daemon=True)
+        self._thread.start()
+        return self
+
+    def submit(self, texts):
+        """Encola ``texts`` y espera sus embeddings (n, d)."""
+        item = _Pending(list(texts))
+        self.queue.put(item)
+        item.done.wait()
+        if item.error is not None:
+            raise item.error
+        return item.result
+
+    def _collect(self):
+        batch = [self.queue.get()]
+        size = len(batch[0].texts)
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self.queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(item)
+            size += len(item.texts)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            texts = [text for item in batch for text in item.texts]
+            try:
+                vecs = np.asarray(self.encode(texts), dtype=np.float32)
+            except Exception as e:
+                for item in batch:
+                    item.error = e
+                    item.done.set()
+                continue
+            start = 0
+            for item in batch:
+                item.result = vecs[start:start + len(item.texts)]
+                start += len(item.texts)
+                item.done.set()
+            self.stats["requests"] += len(batch)
+            self.stats["batches"] += 1
+            self.stats["texts"] += len(texts)
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        # Conexión persistente: un cliente manda varias peticiones seguidas
+        while True:
+            try:
+                request = json.loads(_recv(self.request))
+            except (ConnectionError, OSError):
+                return
+            except ValueError as e:
+                _send(self.request, json.dumps({"error": f"petición inválida: {e}"}).encode())
+                return
+            if request.get("ping"):
+                info = {"ok": True, "model": self.server.model_name, "pid": os.getpid(), **self.server.batcher.stats}
+                _send(self.request, json.dumps(info).encode())
+                continue
+            try:
+                vecs = self.server.batcher.submit(request.get("texts") or [])
+            except Exception as e:
+                _send(self.request, json.dumps({"error": str(e)}).encode())
+                continue
+            _send(self.request, json.dumps({"shape": list(vecs.shape)}).encode())
+            _send(self.request, vecs.astype("<f4", copy=False).tobytes())
+
+
+if hasattr(socketserver, "UnixStreamServer"):
+    class EncoderServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        """Servidor del socket Unix: un hilo por conexión, un solo ``MicroBatcher``."""
+
+        daemon_threads = True
+        # Conexiones pendientes de aceptar: con el default de socketserver (5)
+        # una ráfaga de workers llena la cola justo cuando el servicio más sirve
+        request_queue_size = 128
+
+        def __init__(self, path, batcher, model_name):
+            self.batcher = batcher
+            self.model_name = model_name
+            if os.path.exists(path):
+                os.remove(path)  # socket huérfano de una ejecución anterior
+            super().__init__(path, _Handler)
+
+        def server_close(self):
+            super().server_close()
+            try:
+                os.remove(self.server_address)
+            except OSError:
+                pass
+else:  # pragma: no cover - Windows no tiene sockets Unix en socketserver
+    EncoderServer = None
+
+
+class EncoderClient:
+    """Cliente del servicio, con una conexión persistente por hilo.
+
+    Lanza ``ConnectionError`` (u otro ``OSError``) si el servicio no está o no
+    responde a tiempo, y ``RuntimeError`` si el servicio informó un error.
+    """
+
+    def __init__(self, path, timeout=2.0):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _conn(self):
+        sock = getattr(self._local, "sock", None)
+        if sock is None:
+            if not hasattr(socket, "AF_UNIX"):
+                raise ConnectionError("Sockets Unix no disponibles en esta plataforma.")
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                self._connect(sock)
+            except OSError:
+                sock.close()
+                raise
+            sock.settimeout(self.timeout)
+            self._local.sock = sock
+        return sock
+
+    def _connect(self, sock):
+        """``connect`` que espera (hasta ``timeout``) si la cola del servidor está llena.
+
+        Un socket Unix con timeout no espera un lugar en la cola: falla en el
+        acto con EAGAIN. Se reintenta hasta el plazo en lugar de darlo por caído.
+        """
+        deadline = time.monotonic() + self.timeout
+        sock.setblocking(False)
+        while True:
+            try:
+                sock.connect(self.path)
+                return
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    raise TimeoutError(f"El servicio de codificación no aceptó la conexión en {self.timeout}s.")
+                time.sleep(CONNECT_RETRY_SECONDS)
+
+    def _request(self, payload):
+        try:
+            sock = self._conn()
+            _send(sock, json.dumps(payload).encode())
+            header = json.loads(_recv(sock))
+            if "shape" in header:
+                n, d = header["shape"]
+                return header, np.frombuffer(_recv(sock), dtype="<f4").reshape(n, d)
+        except (OSError, ValueError):
+            # Conexión a medio leer: descartarla para no desincronizar el protocolo
+            self.close()
+            raise
+        if "error" in header:
+            raise RuntimeError(header["error"])
+        return header, None
+
+    def encode(self, texts):
+        """Embeddings (n, d) de ``texts`` calculados por el servicio."""
+        _, vecs = self._request({"texts": list(texts)})
+        return vecs
+
+    def ping(self):
+        header, _ = self._request({"ping": True})
+        return header
+
+    def close(self):
+        sock = getattr(self._local, "sock", None)
+        if sock is not None:
+            self._local.sock = None
+            sock.close()
@@ -0,0 +1,209 @@
+"""
+Nomenclátor offline de barrios, comunas y municipios del Valle de Aburrá.
+
+``Propiedad.location`` es texto libre ("El Poblado, Medellín", "Medellín,
+Colombia", "Poblado - Medellin"). Este módulo lo resuelve contra una lista
+fija de lugares, sin servicios externos:
+
+  - las claves se comparan en minúsculas, sin tildes ni puntuación
+    ("Itagui" = "Itagüí", "Carlos E Restrepo" = "Carlos E. Restrepo");
+  - ``ALIASES`` cubre nombres cortos o comunes ("Poblado", "Laureles Estadio");
+  - los errores de tipeo se resuelven con ``difflib`` (ratio >= ``FUZZY_CUTOFF``)
+    sobre las claves, sólo para palabras de ``FUZZY_MIN_LEN`` letras o más.
+
+Con esto cada propiedad recibe un ``Barrio``/``Municipio`` normalizado al
+guardarse (``Propiedad.asignar_ubicacion``) y el buscador convierte "en
+Laureles" en el filtro ``barrio=laureles`` (``find_in_text``).
+
+No depende de Django: lo usan el modelo, la migración de datos y el parser
+de consultas.
+"""
+import difflib
+import re
+import unicodedata
+from functools import lru_cache
+from typing import NamedTuple, Optional
+
+FUZZY_CUTOFF = 0.85
+FUZZY_MIN_LEN = 5
+MAX_WORDS = 5  # palabras máximas de un nombre (para buscar dentro de un texto)
+
+MUNICIPIOS = (
+    "Medellín", "Envigado", "Sabaneta", "Itagüí", "Bello", "La Estrella",
+    "Caldas", "Copacabana", "Girardota", "Barbosa",
+)
+
+# municipio -> comuna -> barrios. La comuna lleva el nombre con el que se la
+# conoce; en los demás municipios no se usa (None).
+BARRIOS = {
+    "Medellín": {
+        "Popular": ["Popular", "Santo Domingo Savio", "Granizal"],
+        "Santa Cruz": ["Santa Cruz", "La Rosa", "Moscú"],
+        "Manrique": ["Manrique", "Manrique Central", "La Salle", "Las Granjas"],
+        "Aranjuez": ["Aranjuez", "Campo Valdés", "Moravia", "Palermo"],
+        "Castilla": ["Castilla", "Francisco Antonio Zea", "Boyacá", "Belalcázar", "Tricentenario"],
+        "Doce de Octubre": ["Doce de Octubre", "Pedregal", "Kennedy"],
+        "Robledo": ["Robledo", "Pajarito", "Bosques de San Pablo", "El Volador", "Santa Margarita", "Córdoba", "La Pilarica"],
+        "Villa Hermosa": ["Villa Hermosa", "Enciso", "La Milagrosa"],
+        "Buenos Aires": ["Buenos Aires", "Caicedo", "Miraflores", "Alejandro Echavarría", "Loreto"],
+        "La Candelaria": ["La Candelaria", "Prado", "Boston", "Villa Nueva", "San Benito", "Jesús Nazareno", "San Diego"],
+        "Laureles-Estadio": [
+            "Laureles", "Estadio", "Carlos E. Restrepo", "Suramericana", "Naranjal", "Bolivariana",
+            "Las Acacias", "La Castellana", "Lorena", "Conquistadores", "Florida Nueva", "Los Colores",
+            "Velódromo", "San Joaquín",
+        ],
+        "La América": ["La América", "Calasanz", "Santa Mónica", "Simón Bolívar", "La Floresta", "Santa Lucía", "Ferrini", "Los Pinos"],
+        "San Javier": ["San Javier", "El Salado", "Veinte de Julio", "Juan XXIII"],
+        "El Poblado": [
+            "El Poblado", "Provenza", "Manila", "Astorga", "Lalinde", "Castropol", "Los Balsos", "El Tesoro",
+            "Patio Bonito", "La Aguacatala", "Alejandría", "San Lucas", "Las Lomas", "El Castillo",
+            "Los Naranjos", "Santa María de los Ángeles", "Villa Carlota",
+        ],
+        "Guayabal": ["Guayabal", "Cristo Rey", "Campo Amor", "La Colina", "Santa Fe", "Trinidad"],
+        "Belén": [
+            "Belén", "Loma de los Bernal", "Fátima", "Rosales", "La Mota", "Los Alpes", "Las Playas",
+            "Granada", "La Gloria", "Diego Echavarría", "Las Mercedes", "Belén Rincón",
+        ],
+        "Corregimientos": ["San Antonio de Prado", "Santa Elena", "San Cristóbal", "Altavista", "Palmitas"],
+    },
+    "Envigado": {None: ["Zúñiga", "El Portal", "La Magnolia", "Loma del Escobero", "El Esmeraldal", "Jardines", "Alcalá", "Las Palmas"]},
+    "Sabaneta": {None: ["Aves María", "Las Vegas", "Calle Larga", "La Doctora", "Mayorca", "Restrepo Naranjo"]},
+    "Itagüí": {None: ["Suramérica", "Santa María", "Ditaires", "San Pío", "Las Acacias de Itagüí"]},
+    "Bello": {None: ["Niquía", "Cabañas", "La Madera", "Santa Ana", "Fontidueño", "Trapiche"]},
+    "La Estrella": {None: ["La Tablaza", "Pueblo Viejo", "Ancón"]},
+    "Caldas": {None: ["La Valeria"]},
+}
+
+# Nombres alternativos (clave normalizada -> nombre oficial)
+ALIASES = {
+    "poblado": "El Poblado",
+    "laureles estadio": "Laureles",
+    "carlos e": "Carlos E. Restrepo",
+    "san antonio": "San Antonio de Prado",
+    "loma del bernal": "Loma de los Bernal",
+    "la 70": "Estadio",
+    "mde": "Medellín",
+    "medallo": "Medellín",
+}
+
+# Partes de ``location`` que no son lugares
+IGNORAR = {"colombia", "antioquia", "valle de aburra", "area metropolitana", "co"}
+# Nombres que también son palabras comunes ("apartamento bello", "vista al
+# estadio"): dentro de una consulta sólo cuentan después de "en", "barrio"...
+AMBIGUOS = {
+    "bello", "popular", "prado", "estadio", "granada", "boston", "kennedy", "palermo", "manila",
+    "trinidad", "santa fe", "rosales", "jardines", "caldas", "copacabana", "la gloria", "la colina",
+    "las lomas", "el castillo", "las palmas", "las playas", "las vegas", "el portal", "el tesoro",
+    "la mota", "la rosa", "la madera", "cabanas", "calle larga", "la doctora", "lorena", "fatima",
+    "las mercedes", "el salado", "pedregal", "altavista", "moravia", "la milagrosa", "alcala",
+}
+# Palabras antes de un lugar dentro de una consulta ("en Laureles")
+_PREFIJO = re.compile(r"(?:^|\s)(?:en|barrio|sector|cerca\s+(?:a|al|de)|por)\s+$")
+
+
+class Lugar(NamedTuple):
+    nombre: str
+    slug: str
+    tipo: str                # "barrio" o "municipio"
+    municipio: str           # el propio nombre si ``tipo == "municipio"``
+    comuna: Optional[str] = None
+
+
+def clave(text):
+    """Minúsculas, sin tildes ni puntuación y con espacios colapsados."""
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(ch for ch in text if not unicodedata.combining(ch)).lower()
+    return " ".join(re.sub(r"[^a-z0-9ñ]+", " ", text).split())
+
+
+def slug(text):
+    return clave(text).replace(" ", "-")
+
+
+def _construir():
+    lugares = {}  # clave -> Lugar
+    for nombre in MUNICIPIOS:
+        lugares[clave(nombre)] = Lugar(nombre, slug(nombre), "municipio", nombre)
+    slugs = set()
+    for municipio, comunas in BARRIOS.items():
+        for comuna, nombres in comunas.items():
+            for nombre in nombres:
+                s = slug(nombre)
+                if s in slugs:  # mismo nombre en otro municipio
+                    s = f"{s}-{slug(municipio)}"
+                slugs.add(s)
+                lugares.setdefault(clave(nombre), Lugar(nombre, s, "barrio", municipio, comuna))
+    por_nombre = {lugar.nombre: lugar for lugar in lugares.values()}
+    for alias, nombre in ALIASES.items():
+        lugares.setdefault(alias, por_nombre[nombre])
+    return lugares
+
+
+LUGARES = _construir()
+_CLAVES = sorted(LUGARES)
+
+
+def barrios():
+    """Todos los barrios del nomenclátor."""
+    return [lugar for key, lugar in LUGARES.items() if lugar.tipo == "barrio" and key == clave(lugar.nombre)]
+
+
+@lru_cache(maxsize=4096)
+def resolve(text, fuzzy=True):
+    """Lugar para un nombre ("laureles", "Itagui", "Envigadoo") o None."""
+    key = clave(text)
+    if not key or key in IGNORAR:
+        return None
+    if key in LUGARES:
+        return LUGARES[key]
+    if fuzzy and len(key) >= FUZZY_MIN_LEN:
+        match = difflib.get_close_matches(key, _CLAVES, n=1, cutoff=FUZZY_CUTOFF)
+        if match:
+            return LUGARES[match[0]]
+    return None
+
+
+@lru_cache(maxsize=4096)
+def resolve_location(location):
+    """(barrio, municipio) de un ``location`` de texto libre; cualquiera puede ser None.
+
+    Se revisa cada parte separada por comas, guiones o barras. El municipio
+    sale del propio texto o, si no aparece, del barrio.
+    """
+    barrio = municipio = None
+    for part in re.split(r"[,;/|()]|\s-\s", location or ""):
+        lugar = resolve(part)
+        if lugar is None:
+            continue
+        if lugar.tipo == "barrio" and barrio is None:
+            barrio = lugar
+        elif lugar.tipo == "municipio" and municipio is None:
+            municipio = lugar
+    if barrio is not None and (municipio is None or municipio.nombre != barrio.municipio):
+        municipio = LUGARES[clave(barrio.municipio)]
+    return barrio, municipio
+
+
+def find_in_text(text, folded=None):
+    """(Lugar, (inicio, fin)) del lugar más largo nombrado en ``text`` o None.
+
+    Las coincidencias exactas valen en cualquier parte; las aproximadas
+    (errores de tipeo) y los nombres de ``AMBIGUOS`` sólo después de "en",
+    "barrio", "sector"... para no confundir palabras comunes con barrios. ``folded`` es ``text`` ya en
+    minúsculas y sin tildes, con la misma longitud.
+    """
+    folded = folded if folded is not None else text.lower()
+    words = [(m.start(), m.end()) for m in re.finditer(r"[^\W_]+(?:\.)?", folded)]
+    for size in range(min(MAX_WORDS, len(words)), 0, -1):
+        for i in range(len(words) - size + 1):
+            start, end = words[i][0], words[i + size - 1][1]
+            key = clave(folded[start:end])
+            if key in IGNORAR:
+                continue
+            despues_de_prefijo = _PREFIJO.search(folded[:start]) is not None
+            lugar = LUGARES.get(key) if key not in AMBIGUOS or despues_de_prefijo else None
+            if lugar is None and despues_de_prefijo:
+                lugar = resolve(key)
+            if lugar is not None:
+                return lugar, (start, end)
+    return None
@@ -0,0 +1,38 @@
+"""
+Hidratación de listas rankeadas de propiedades.
+
+Las listas con un orden que no sale de la BD (resultados del buscador,
+vistas recientes, favoritos, similares, recomendadas) se traían con
+``order_by(Case(When(id=pk, then=pos), ...))``: SQLite evalúa esa cadena de
+``CASE`` en cada fila candidata y la consulta viaja con un parámetro por id
+en cada página. Aquí la BD sólo resuelve un ``id__in`` por clave primaria y
+el orden se rehace en Python con un dict, en O(n).
+
+``bench_search.py`` compara las dos formas con 100 y 1.000 ids (etapas
+``rank_sql_*`` / ``rank_py_*``).
+"""
+
+
+def hydrate(ids, queryset=None):
+    """Propiedades de ``ids`` en ese mismo orden (las que no existen se omiten).
+
+    ``queryset`` restringe (p. ej. con los filtros del buscador). Las tarjetas
+    usan la portada desnormalizada (``Propiedad.portada``).
+    """
+    ids = list(ids)
+    if not ids:
+        return []
+    if queryset is None:
+        from properties.models import Propiedad
+        queryset = Propiedad.objects.all()
+    por_id = {p.id: p for p in queryset.filter(id__in=ids)}
+    return [por_id[pk] for pk in ids if pk in por_id]
+
+
+def filter_ranked(ids, queryset):
+    """Los ``ids`` que están en ``queryset``, en el orden de ``ids`` (sólo trae ids)."""
+    ids = list(ids)
+    if not ids:
+        return []
+    vivos = set(queryset.filter(id__in=ids).values_list("id", flat=True))
+    return [pk for pk in ids if pk in vivos]
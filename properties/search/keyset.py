@@ -0,0 +1,147 @@
+"""
+Paginación por keyset (seek) para listados ordenados por una columna.
+
+``Paginator`` hace un ``COUNT(*)`` sobre el queryset filtrado en cada página
+y después ``LIMIT/OFFSET``, que recorre y descarta todas las filas
+anteriores: cuanto más profunda la página, más lenta. Aquí cada página
+continúa desde la clave ``(valor, id)`` de la última fila vista:
+
+    WHERE price_cop > :v OR (price_cop = :v AND id > :id)
+    ORDER BY price_cop, id LIMIT 13
+
+Con los índices ``(columna, id)`` de ``Propiedad`` es un seek más 13 filas,
+igual en la página 1 que en la 10.000. El ``id`` desempata, así que ninguna
+fila se repite ni se salta aunque muchas compartan precio.
+
+Los cursores (siguiente / anterior) son opacos y firmados, como los del
+ranking semántico (``cursor.py``). Las columnas que admiten NULL
+(``created_at``) ordenan los NULL al final en los dos sentidos.
+
+El total es opcional y aproximado: un ``COUNT(*)`` por filtro guardado en la
+cache de resultados (se invalida con las mismas señales), no uno por página.
+"""
+import datetime
+import decimal
+import hashlib
+
+from django.db.models import F, Q
+
+from . import cursor, result_cache
+
+
+class KeysetPage:
+    """Una página: sus filas, cursores vecinos y, si se pidió, el total aproximado."""
+
+    def __init__(self, object_list, next_cursor, prev_cursor, number, total=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.number = number
+        self.total = total
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.prev_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+def _parse_order(order):
+    descending = order.startswith("-")
+    return order.lstrip("-"), descending
+
+
+def _dump(value):
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    return value
+
+
+def _ordering(field, descending, nullable, reverse=False):
+    """ORDER BY de la columna y el id; NULL al final (al principio si ``reverse``)."""
+    desc = descending != reverse
+    nulls = ({"nulls_first": True} if reverse else {"nulls_last": True}) if nullable else {}
+    col = F(field).desc(**nulls) if desc else F(field).asc(**nulls)
+    return [col, F("id").desc() if desc else F("id").asc()]
+
+
+def _after(field, descending, nullable, value, pk):
+    """Filas posteriores a la clave ``(value, pk)`` en el orden (NULL al final)."""
+    cmp = "lt" if descending else "gt"
+    if value is None:
+        return Q(**{f"{field}__isnull": True, f"id__{cmp}": pk})
+    cond = Q(**{f"{field}__{cmp}": value}) | Q(**{field: value, f"id__{cmp}": pk})
+    if nullable:
+        cond |= Q(**{f"{field}__isnull": True})
+    return cond
+
+
+def _before(field, descending, nullable, value, pk):
+    """Filas anteriores a la clave ``(value, pk)`` en el orden (NULL al final)."""
+    cmp = "gt" if descending else "lt"
+    if value is None:
+        return Q(**{f"{field}__isnull": False}) | Q(**{f"{field}__isnull": True, f"id__{cmp}": pk})
+    return Q(**{f"{field}__{cmp}": value}) | Q(**{field: value, f"id__{cmp}": pk})
+
+
+def approximate_count(queryset):
+    """``COUNT(*)`` de ``queryset`` cacheado en la cache de resultados."""
+    sql, params = queryset.query.sql_with_params()
+    digest = hashlib.sha1(f"{sql}|{params}".encode("utf-8")).hexdigest()
+    key = result_cache.make_key("", None, None, extra=["count", digest])
+    return result_cache.get_or_compute(key, lambda: (queryset.count(), True))
+
+
+def paginate(queryset, order, per_page, token=None, with_total=False):
+    """Página de ``queryset`` ordenado por ``order`` ("price_cop", "-created_at", "-id"...).
+
+    ``token`` es un cursor devuelto en una página anterior (``next_cursor``
+    o ``prev_cursor``); sin token, o con uno inválido, es la primera página.
+    """
+    field, descending = _parse_order(order)
+    model_field = queryset.model._meta.get_field(field)
+    nullable = model_field.null and field != "id"
+    position, number = cursor.decode(token)
+    direction, key = "n", None
+    if position and len(position) == 3 and position[0] in ("n", "p"):
+        direction = position[0]
+        value = model_field.to_python(position[1]) if position[1] is not None else None
+        key = (value, int(position[2]))
+    else:
+        number = 1
+
+    qs = queryset
+    backwards = direction == "p" and key is not None
+    if key is not None:
+        cond = _before if backwards else _after
+        qs = qs.filter(cond(field, descending, nullable, *key))
+    qs = qs.order_by(*_ordering(field, descending, nullable, reverse=backwards))
+    rows = list(qs[:per_page + 1])
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+
+    def token_for(direction, row, page):
+        return cursor.encode((direction, _dump(getattr(row, field)), row.pk), page)
+
+    has_next = more if not backwards else bool(rows)
+    has_prev = (key is not None and bool(rows)) if not backwards else more
+    next_cursor = token_for("n", rows[-1], number + 1) if rows and has_next else None
+    # La página anterior a la 2 es la primera: cursor vacío (la URL sin ``cursor``)
+    prev_cursor = None
+    if rows and has_prev:
+        prev_cursor = token_for("p", rows[0], number - 1) if number > 2 else ""
+    total = approximate_count(queryset) if with_total else None
+    return KeysetPage(rows, next_cursor, prev_cursor, number, total)
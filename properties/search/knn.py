@@ -0,0 +1,94 @@
+"""
+Tabla precalculada de vecinos más cercanos ("propiedades similares").
+
+Se calcula por lotes directamente desde la matriz normalizada de la versión
+(``property_embeddings.npy``): se multiplica un bloque de filas contra un
+bloque de columnas a la vez y se conservan sólo los ``k`` mejores por fila,
+así la memoria es O(bloque² + n·k) y nunca hay una matriz N×N.
+
+Se guarda como ``property_embeddings.knn.npz`` con los ids ordenados
+(búsqueda por ``searchsorted``), los ids de sus ``k`` vecinos y el coseno en
+float16. La página de detalle sólo lee una fila de esta tabla: no carga el
+modelo ni recorre la matriz.
+"""
+import os
+
+import numpy as np
+
+from .store import top_k
+
+BLOCK_ROWS = 2048  # bloque² float32 = 16 MB de similitudes temporales
+DEFAULT_K = 12
+
+
+def knn_path(embed_path):
+    stem, _ = os.path.splitext(embed_path)
+    return f"{stem}.knn.npz"
+
+
+def nearest_neighbors(vecs, k=DEFAULT_K, block=BLOCK_ROWS):
+    """(filas, scores) de los ``k`` vecinos de cada fila de ``vecs`` (ya normalizados).
+
+    ``filas`` (n, k) son índices de fila, del más al menos parecido, sin la
+    propia fila. ``vecs`` puede ser un memmap: se lee de a bloques.
+    """
+    n = len(vecs)
+    k = max(0, min(int(k), n - 1))
+    rows_out = np.empty((n, k), dtype=np.int64)
+    scores_out = np.empty((n, k), dtype=np.float32)
+    if k == 0:
+        return rows_out, scores_out
+    for start in range(0, n, block):
+        q = np.asarray(vecs[start:start + block], dtype=np.float32)
+        best_rows = np.empty((len(q), 0), dtype=np.int64)
+        best_scores = np.empty((len(q), 0), dtype=np.float32)
+        for cstart in range(0, n, block):
+            c = np.asarray(vecs[cstart:cstart + block], dtype=np.float32)
+            sims = q @ c.T
+            if cstart == start:
+                np.fill_diagonal(sims, -np.inf)  # una propiedad no es similar a sí misma
+            local = top_k(sims, k)
+            cand_rows = np.concatenate([best_rows, local + cstart], axis=1)
+            cand_scores = np.concatenate([best_scores, np.take_along_axis(sims, local, axis=1)], axis=1)
+            keep = top_k(cand_scores, k)
+            best_rows = np.take_along_axis(cand_rows, keep, axis=1)
+            best_scores = np.take_along_axis(cand_scores, keep, axis=1)
+        rows_out[start:start + len(q)] = best_rows
+        scores_out[start:start + len(q)] = best_scores
+    return rows_out, scores_out
+
+
+class KNNTable:
+    def __init__(self, ids, neighbors, scores):
+        self.ids = ids              # (n,) int64, ordenados
+        self.neighbors = neighbors  # (n, k) int64: ids de los vecinos
+        self.scores = scores        # (n, k) float16
+
+    @property
+    def k(self):
+        return self.neighbors.shape[1]
+
+    @classmethod
+    def build(cls, ids, vecs, k=DEFAULT_K, block=BLOCK_ROWS):
+        ids = np.asarray(ids, dtype=np.int64)
+        rows, scores = nearest_neighbors(vecs, k=k, block=block)
+        order = np.argsort(ids, kind="stable")
+        return cls(ids[order], ids[rows[order]], scores[order].astype(np.float16))
+
+    def save(self, path):
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as fh:
+            np.savez(fh, ids=self.ids, neighbors=self.neighbors, scores=self.scores)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data["ids"], data["neighbors"], data["scores"])
+
+    def similar(self, prop_id, limit=None):
+        """Ids de los vecinos de ``prop_id`` (del más parecido al menos), o [] si no está."""
+        pos = int(np.searchsorted(self.ids, int(prop_id)))
+        if pos >= len(self.ids) or self.ids[pos] != int(prop_id):
+            return []
+        return [int(pk) for pk in self.neighbors[pos, :limit]]
@@ -0,0 +1,170 @@
+"""
+Versiones del índice de búsqueda.
+
+Cada build o compactación escribe un directorio nuevo y completo, y la
+versión activa se cambia de forma atómica:
+
+    search_index/
+      CURRENT                 # nombre de la versión activa (se reemplaza con os.replace)
+      versions/
+        20250101T120000-.../  # property_embeddings.npy, property_ids.joblib,
+        ...                   # atributos, BM25, IVF, variantes y manifest.json
+
+``manifest.json`` describe la versión: modelo, dimensión, filas, momento del
+build, marca de agua de la BD (``Propiedad.updated_at`` máximo incluido) y
+el sha256 de cada archivo. Los workers leen ``CURRENT`` en cada búsqueda y
+cargan la versión nueva cuando cambia, sin reiniciar. Una versión se puede
+exportar como bundle ``.tar.gz`` e importar en otro nodo.
+"""
+import hashlib
+import json
+import os
+import secrets
+import shutil
+import tarfile
+import time
+
+MANIFEST = "manifest.json"
+CURRENT = "CURRENT"
+VERSIONS = "versions"
+PARTIAL = ".partial"
+
+
+def version_dir(root, name):
+    return os.path.join(root, VERSIONS, name)
+
+
+def current_version(root):
+    """Nombre de la versión activa, o None si todavía no hay ninguna."""
+    try:
+        with open(os.path.join(root, CURRENT), "r", encoding="utf-8") as fh:
+            name = fh.read().strip()
+    except OSError:
+        return None
+    return name if name and os.path.isdir(version_dir(root, name)) else None
+
+
+def new_version(root):
+    """Crea un directorio de trabajo para una versión nueva.
+
+    Devuelve (nombre, ruta). El directorio termina en ``.partial`` hasta que
+    ``publish`` lo renombra, así que nunca se activa una versión a medias.
+    """
+    name = f"{time.strftime('%Y%m%dT%H%M%S', time.gmtime())}-{secrets.token_hex(3)}"
+    path = version_dir(root, name) + PARTIAL
+    os.makedirs(path)
+    return name, path
+
+
+def sha256(path, chunk=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(chunk), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _files(path):
+    return sorted(
+        name for name in os.listdir(path)
+        if name != MANIFEST and not name.endswith((".tmp", ".lock")) and os.path.isfile(os.path.join(path, name))
+    )
+
+
+def write_manifest(path, **meta):
+    meta["files"] = {name: sha256(os.path.join(path, name)) for name in _files(path)}
+    tmp = os.path.join(path, f"{MANIFEST}.tmp")
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(meta, fh, indent=2, ensure_ascii=False, default=str)
+    os.replace(tmp, os.path.join(path, MANIFEST))
+    return meta
+
+
+def read_manifest(path):
+    try:
+        with open(os.path.join(path, MANIFEST), "r", encoding="utf-8") as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+
+def verify(path):
+    """Archivos del manifest que faltan o cuyo sha256 no coincide ([] = íntegra)."""
+    manifest = read_manifest(path)
+    if manifest is None:
+        return [MANIFEST]
+    bad = []
+    for name, digest in manifest.get("files", {}).items():
+        file_path = os.path.join(path, name)
+        if not os.path.exists(file_path) or sha256(file_path) != digest:
+            bad.append(name)
+    return bad
+
+
+def publish(root, name, keep=3):
+    """Cierra la versión ``name`` (renombrando el ``.partial``) y la activa."""
+    final = version_dir(root, name)
+    if os.path.isdir(final + PARTIAL):
+        os.rename(final + PARTIAL, final)
+    tmp = os.path.join(root, f"{CURRENT}.tmp")
+    with open(tmp, "w", encoding="utf-8") as fh:
+        fh.write(name)
+    os.replace(tmp, os.path.join(root, CURRENT))
+    prune(root, keep)
+
+
+def prune(root, keep=3):
+    """Borra versiones viejas conservando la activa y las ``keep`` más recientes.
+
+    Conservar algunas permite volver atrás y que un worker que aún no
+    recargó siga leyendo la suya.
+    """
+    base = os.path.join(root, VERSIONS)
+    active = current_version(root)
+    names = sorted(n for n in os.listdir(base) if not n.endswith(PARTIAL) and not n.startswith("."))
+    for name in names[:-keep] if keep else names:
+        if name != active:
+            shutil.rmtree(os.path.join(base, name), ignore_errors=True)
+
+
+def link_or_copy(src, dst):
+    """Reutiliza un archivo de otra versión sin duplicarlo en disco si se puede."""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def export_bundle(root, output, name=None):
+    """Empaqueta una versión (la activa por defecto) en un ``.tar.gz``."""
+    name = name or current_version(root)
+    if name is None:
+        raise FileNotFoundError("No hay una versión activa del índice.")
+    with tarfile.open(output, "w:gz") as tar:
+        tar.add(version_dir(root, name), arcname=name)
+    return name
+
+
+def import_bundle(root, bundle, activate=True, keep=3):
+    """Importa un bundle de ``export_bundle``, verifica checksums y lo activa."""
+    os.makedirs(os.path.join(root, VERSIONS), exist_ok=True)
+    with tarfile.open(bundle, "r:gz") as tar:
+        names = {member.name.split("/", 1)[0] for member in tar.getmembers()}
+        if len(names) != 1:
+            raise ValueError("El bundle debe contener exactamente una versión.")
+        name = names.pop()
+        staging = os.path.join(root, VERSIONS, f".import-{secrets.token_hex(3)}")
+        tar.extractall(staging, filter="data")
+    target = version_dir(root, name)
+    if os.path.isdir(target):
+        shutil.rmtree(staging, ignore_errors=True)
+    else:
+        bad = verify(os.path.join(staging, name))
+        if bad:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise ValueError(f"Checksums inválidos en el bundle: {', '.join(bad)}")
+        os.rename(os.path.join(staging, name), target)
+        shutil.rmtree(staging, ignore_errors=True)
+    if activate:
+        publish(root, name, keep)
+    return name
@@ -0,0 +1,171 @@
+"""
+Métricas del buscador: spans por etapa, histogramas y formato Prometheus.
+
+Cada etapa (codificar, puntuar, top-k, SQL de filtros, paginación,
+hidratación, render...) se mide con ``span("nombre")``. La duración
+siempre se acumula en un histograma en memoria del proceso y, si hay una
+petición en curso (``collect``), también en sus spans, que ``timed_view``
+devuelve en la cabecera ``Server-Timing``:
+
+    Server-Timing: encode;dur=3.10, score;dur=1.42, topk;dur=0.08, render;dur=6.51, total;dur=14.20
+
+Un nombre repetido dentro de la misma petición (p. ej. varias ventanas de
+candidatos en la paginación por cursor) suma sus duraciones.
+
+``render_prometheus`` expone los histogramas y las métricas adicionales que
+le pase la vista (``/properties/metrics/``). Los histogramas son por
+proceso: con varios workers cada uno informa los suyos.
+"""
+import bisect
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+
+PREFIX = "inmofinder_search"
+# Segundos; cubren desde el top-k (sub-ms) hasta una búsqueda en frío
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_current = ContextVar("search_spans", default=None)
+_lock = threading.Lock()
+_histograms = {}  # etapa -> Histogram
+
+
+class Histogram:
+    """Histograma acumulativo con buckets fijos (como el de Prometheus)."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # el último es +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """[(le, cuenta acumulada)] incluyendo ``+Inf``."""
+        out, total = [], 0
+        for le, n in zip(self.buckets + (float("inf"),), self.counts):
+            total += n
+            out.append((le, total))
+        return out
+
+
+def observe(stage, seconds):
+    with _lock:
+        hist = _histograms.get(stage)
+        if hist is None:
+            hist = _histograms[stage] = Histogram()
+        hist.observe(seconds)
+
+
+@contextmanager
+def span(name):
+    """Mide el bloque como la etapa ``name``."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        observe(name, elapsed)
+        spans = _current.get()
+        if spans is not None:
+            spans[name] = spans.get(name, 0.0) + elapsed
+
+
+@contextmanager
+def collect():
+    """Junta los spans del bloque (una petición) en un dict nombre -> segundos."""
+    spans = {}
+    token = _current.set(spans)
+    try:
+        yield spans
+    finally:
+        _current.reset(token)
+
+
+def server_timing(spans):
+    """Valor de la cabecera ``Server-Timing`` para ``spans`` (en el orden en que ocurrieron)."""
+    return ", ".join(f"{name};dur={seconds * 1000:.2f}" for name, seconds in spans.items())
+
+
+def _server_timing_enabled():
+    return getattr(settings, "SEARCH_SERVER_TIMING", True)
+
+
+def timed_view(view):
+    """Decorador: mide la vista completa (``total``) y añade ``Server-Timing``."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        with collect() as spans:
+            with span("total"):
+                response = view(request, *args, **kwargs)
+        if _server_timing_enabled() and spans:
+            response["Server-Timing"] = server_timing(spans)
+        return response
+    return wrapper
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+
+
+def snapshot():
+    """{etapa: (cumulative, sum, count)} copiado bajo lock."""
+    with _lock:
+        return {stage: (hist.cumulative(), hist.sum, hist.count) for stage, hist in _histograms.items()}
+
+
+# ---------- Formato Prometheus ----------
+def _fmt(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    escaped = (
+        (k, str(v).replace("\\", r"\\").replace("\n", r"\n").replace('"', r'\"')) for k, v in labels.items()
+    )
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+def _name(name):
+    return f"{PREFIX}_{re.sub(r'[^a-zA-Z0-9_]', '_', name)}"
+
+
+def render_prometheus(extra=()):
+    """Texto de exposición de Prometheus (0.0.4).
+
+    ``extra`` son tuplas (nombre, tipo, ayuda, [(labels, valor)]) con las
+    métricas que no son histogramas (caches, tamaño del índice...).
+    """
+    lines = [
+        f"# HELP {PREFIX}_stage_seconds Duración de cada etapa de la búsqueda.",
+        f"# TYPE {PREFIX}_stage_seconds histogram",
+    ]
+    for stage, (cumulative, total, count) in sorted(snapshot().items()):
+        for le, n in cumulative:
+            lines.append(f"{PREFIX}_stage_seconds_bucket{_labels({'stage': stage, 'le': _fmt(le)})} {n}")
+        lines.append(f"{PREFIX}_stage_seconds_sum{_labels({'stage': stage})} {_fmt(float(total))}")
+        lines.append(f"{PREFIX}_stage_seconds_count{_labels({'stage': stage})} {count}")
+    for name, kind, help_text, samples in extra:
+        full = _name(name)
+        lines.append(f"# HELP {full} {help_text}")
+        lines.append(f"# TYPE {full} {kind}")
+        for labels, value in samples:
+            if value is not None:
+                lines.append(f"{full}{_labels(labels)} {_fmt(value)}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,212 @@
+"""
+Vector de preferencias por usuario (favoritos + vistas recientes).
+
+Es la media ponderada de los embeddings guardados de las propiedades que el
+usuario marcó como favoritas (peso ``FAVORITE_WEIGHT``) y de las que vio en
+detalle (peso ``VIEW_WEIGHT``, con decaimiento ``VIEW_DECAY`` por cada vista
+nueva para que pesen más las recientes).
+
+El perfil (sumas ponderadas y pesos acumulados) vive en la cache de Django
+con clave por usuario, o por sesión para anónimos, y se actualiza de forma
+incremental: ``record_favorite`` suma o resta un vector, ``record_view``
+decae y suma. Si no está en cache se reconstruye desde ``Favorite`` y la
+lista ``recently_viewed`` de la sesión. Los vectores salen del índice (ver
+``vectores_propiedades`` en ``embeddings.py``): nada de esto ejecuta el modelo.
+
+Lo usan el buscador (mezcla del puntaje, ver ``_personalizar``) y la sección
+"Recomendadas para ti" del home.
+"""
+import hashlib
+import logging
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+FAVORITE_WEIGHT = 2.0
+VIEW_WEIGHT = 1.0
+VIEW_DECAY = 0.8  # cada vista nueva multiplica el peso de las anteriores por esto
+
+
+def _cache():
+    return caches[getattr(settings, "SEARCH_RESULT_CACHE", "default")]
+
+
+def _ttl():
+    return getattr(settings, "SEARCH_PREFERENCES_TTL", 30 * 24 * 3600)
+
+
+def _emb():
+    from properties.management.commands import embeddings as emb
+    return emb
+
+
+class PreferenceProfile:
+    """Sumas ponderadas de favoritos y vistas, y su media ya normalizada."""
+
+    def __init__(self, dim):
+        self.dim = dim
+        self.fav_sum = np.zeros(dim, dtype=np.float32)
+        self.favs = 0
+        self.view_sum = np.zeros(dim, dtype=np.float32)
+        self.view_weight = 0.0
+        self.recs = None  # (versión del índice, ids recomendados) calculados con este perfil
+
+    def add_favorite(self, vec):
+        self.fav_sum += vec
+        self.favs += 1
+        self.recs = None
+
+    def remove_favorite(self, vec):
+        self.favs = max(0, self.favs - 1)
+        if self.favs:
+            self.fav_sum -= vec
+        else:
+            self.fav_sum[:] = 0  # sin arrastrar error de redondeo
+        self.recs = None
+
+    def add_view(self, vec):
+        self.view_sum = self.view_sum * VIEW_DECAY + vec
+        self.view_weight = self.view_weight * VIEW_DECAY + 1.0
+        self.recs = None
+
+    @property
+    def empty(self):
+        return not self.favs and not self.view_weight
+
+    def vector(self):
+        """Vector unitario de preferencias, o None si el perfil está vacío."""
+        if self.empty:
+            return None
+        total = FAVORITE_WEIGHT * self.fav_sum + VIEW_WEIGHT * self.view_sum
+        weight = FAVORITE_WEIGHT * self.favs + VIEW_WEIGHT * self.view_weight
+        mean = total / weight
+        norm = float(np.linalg.norm(mean))
+        return mean / norm if norm > 0 else None
+
+
+def _key(request):
+    user = getattr(request, "user", None)
+    if user is not None and user.is_authenticated:
+        return f"prefs:user:{user.pk}"
+    session_key = request.session.session_key
+    return f"prefs:session:{session_key}" if session_key else None
+
+
+def _favorite_ids(request):
+    from properties.models import Favorite
+    user = getattr(request, "user", None)
+    if user is None or not user.is_authenticated:
+        return []
+    return list(Favorite.objects.filter(user=user).values_list("propiedad_id", flat=True))
+
+
+def _recent_ids(request):
+    return [int(pk) for pk in request.session.get("recently_viewed", []) if pk is not None]
+
+
+def _rebuild(request):
+    """Perfil desde cero con los favoritos y las vistas actuales (o None sin índice)."""
+    favs, recent = _favorite_ids(request), _recent_ids(request)
+    vecs = _emb().vectores_propiedades(favs + recent)
+    if not vecs:
+        return None
+    profile = PreferenceProfile(len(next(iter(vecs.values()))))
+    for pk in favs:
+        if pk in vecs:
+            profile.add_favorite(vecs[pk])
+    for pk in reversed(recent):  # la sesión guarda la más reciente primero
+        if pk in vecs:
+            profile.add_view(vecs[pk])
+    return profile
+
+
+def _load(request):
+    """(perfil, reconstruido). Un perfil reconstruido ya refleja el último evento."""
+    key = _key(request)
+    if key is None:
+        # Anónimo sin sesión: no hay historial ni dónde guardar el perfil
+        return None, True
+    profile = _cache().get(key)
+    if profile is not None:
+        return profile, False
+    profile = _rebuild(request)
+    if profile is not None:
+        _save(request, profile)
+    return profile, True
+
+
+def _save(request, profile):
+    key = _key(request)
+    if key:
+        _cache().set(key, profile, timeout=_ttl())
+
+
+def _update(request, prop_id, apply):
+    try:
+        profile, rebuilt = _load(request)
+        if profile is None or rebuilt:
+            return
+        vec = _emb().vectores_propiedades([prop_id]).get(int(prop_id))
+        if vec is None or len(vec) != profile.dim:
+            return
+        apply(profile, vec)
+        _save(request, profile)
+    except Exception as e:
+        logger.warning("No se pudo actualizar el perfil de preferencias: %s", e)
+
+
+def record_view(request, prop_id):
+    """Suma la vista de ``prop_id`` (llamar después de registrarla en la sesión)."""
+    _update(request, prop_id, lambda profile, vec: profile.add_view(vec))
+
+
+def record_favorite(request, prop_id, added):
+    """Suma o resta el favorito ``prop_id`` (llamar después de guardarlo en la BD)."""
+    _update(
+        request, prop_id,
+        lambda profile, vec: profile.add_favorite(vec) if added else profile.remove_favorite(vec),
+    )
+
+
+def preference_vector(request):
+    """Vector de preferencias del usuario o None (sin historial, sin índice o con error)."""
+    try:
+        profile, _ = _load(request)
+    except Exception as e:
+        logger.warning("No se pudo cargar el perfil de preferencias: %s", e)
+        return None
+    return profile.vector() if profile is not None else None
+
+
+def fingerprint(vec):
+    """Huella corta de un vector de preferencias (para claves de cache), o None."""
+    if vec is None:
+        return None
+    return hashlib.sha1(np.asarray(vec, dtype=np.float16).tobytes()).hexdigest()[:16]
+
+
+def recommended_ids(request, limit, exclude=()):
+    """Ids recomendados para el usuario, sin ``exclude`` ni lo ya visto.
+
+    El resultado se guarda en el propio perfil (por versión del índice), así
+    que sólo se recalcula cuando cambia el perfil o se activa otro índice.
+    """
+    try:
+        profile, _ = _load(request)
+        if profile is None or profile.vector() is None:
+            return []
+        emb = _emb()
+        version = emb._version_activa()
+        if profile.recs is None or profile.recs[0] != version:
+            seen = set(_recent_ids(request)) | set(_favorite_ids(request))
+            hits = emb.recomendar_propiedades(profile.vector(), limit, excluir=seen)
+            profile.recs = (version, [hit["id"] for hit in hits])
+            _save(request, profile)
+    except Exception as e:
+        logger.warning("No se pudieron calcular recomendaciones: %s", e)
+        return []
+    exclude = {int(pk) for pk in exclude}
+    return [pk for pk in profile.recs[1] if pk not in exclude][:limit]
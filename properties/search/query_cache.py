@@ -0,0 +1,147 @@
+"""
+Cache de embeddings de consultas en dos niveles.
+
+  1. LRU en memoria del proceso (acotado, con contadores de hits/misses).
+  2. Tabla SQLite en disco, clave (modelo, consulta normalizada): sobrevive a
+     reinicios y la comparten todos los workers de la máquina.
+
+Las consultas se normalizan (minúsculas, sin tildes, espacios colapsados)
+antes de buscarlas y antes de codificarlas. all-MiniLM-L6-v2 usa un
+tokenizador *uncased* que ya hace esto, así que el vector no cambia y
+"Apartamento en El Poblado" y "apartamento en el  poblado" comparten entrada.
+"""
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+
+DISK_CHUNK = 500  # claves por consulta IN (...): SQLite viejo admite 999 parámetros
+
+
+def normalize_query(text):
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return " ".join(text.lower().split())
+
+
+class QueryEmbeddingCache:
+    def __init__(self, model_name, path=None, maxsize=2048):
+        self.model_name = model_name
+        self.path = path
+        self.maxsize = maxsize
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()  # una conexión SQLite por hilo
+
+    # ------ SQLite ------
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS query_embeddings ("
+                " model TEXT NOT NULL, query TEXT NOT NULL, vec BLOB NOT NULL,"
+                " PRIMARY KEY (model, query))"
+            )
+            self._local.conn = conn
+        return conn
+
+    def _disk_get(self, keys):
+        if not self.path or not keys:
+            return {}
+        keys, found = list(keys), {}
+        for start in range(0, len(keys), DISK_CHUNK):
+            chunk = keys[start:start + DISK_CHUNK]
+            marks = ",".join("?" * len(chunk))
+            rows = self._conn().execute(
+                f"SELECT query, vec FROM query_embeddings WHERE model = ? AND query IN ({marks})",
+                [self.model_name, *chunk],
+            ).fetchall()
+            found.update((query, np.frombuffer(blob, dtype=np.float32)) for query, blob in rows)
+        return found
+
+    def _disk_put(self, items):
+        if not self.path or not items:
+            return
+        conn = self._conn()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO query_embeddings (model, query, vec) VALUES (?, ?, ?)",
+                [(self.model_name, key, np.asarray(vec, dtype=np.float32).tobytes()) for key, vec in items],
+            )
+
+    # ------ LRU ------
+    def _remember(self, key, vec):
+        vec = np.asarray(vec, dtype=np.float32)
+        vec.flags.writeable = False  # se comparte entre peticiones: nadie debe mutarlo
+        with self._lock:
+            self._lru[key] = vec
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.maxsize:
+                self._lru.popitem(last=False)
+        return vec
+
+    def get_many(self, texts, encode):
+        """Vectores para ``texts`` (mismo orden), codificando sólo lo que falte.
+
+        ``encode(lista_de_textos)`` recibe las consultas ya normalizadas y
+        devuelve una matriz (n, d).
+        """
+        keys = [normalize_query(t) for t in texts]
+        found = {}
+        with self._lock:
+            for key in keys:
+                vec = self._lru.get(key)
+                if vec is not None:
+                    self._lru.move_to_end(key)
+                    found[key] = vec
+                    self.hits += 1
+        missing = [k for k in dict.fromkeys(keys) if k not in found]
+        if missing:
+            try:
+                from_disk = self._disk_get(missing)
+            except sqlite3.Error:
+                from_disk = {}
+            for key, vec in from_disk.items():
+                found[key] = self._remember(key, vec)
+            self.disk_hits += len(from_disk)
+            missing = [k for k in missing if k not in from_disk]
+        if missing:
+            self.misses += len(missing)
+            vecs = np.asarray(encode(missing), dtype=np.float32)
+            for key, vec in zip(missing, vecs):
+                found[key] = self._remember(key, vec)
+            try:
+                self._disk_put(zip(missing, vecs))
+            except sqlite3.Error:
+                pass  # la cache en disco es best-effort
+        return np.vstack([found[k] for k in keys])
+
+    def get(self, text, encode):
+        return self.get_many([text], encode)
+
+    def stats(self):
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "size": len(self._lru),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._lru.clear()
+        if self.path:
+            conn = self._conn()
+            with conn:
+                conn.execute("DELETE FROM query_embeddings WHERE model = ?", [self.model_name])
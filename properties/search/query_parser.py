@@ -0,0 +1,260 @@
+"""
+Extracción de filtros estructurados de consultas en español.
+
+"apartamento 2 habitaciones menos de 500 millones en Laureles con parqueadero"
+se convierte en los mismos filtros del formulario del buscador más el texto
+que sobra, que es lo único que se codifica:
+
+    filters = {"tipo": "Apartamento", "rooms": "2", "precio_max": "500000000", "garaje": "1",
+               "barrio": "laureles"}
+    text    = ""
+
+Son expresiones regulares compiladas una vez (sin modelo). Se aplican sobre
+una copia del texto en minúsculas y sin tildes con la misma longitud que el
+original, así el texto residual conserva mayúsculas y tildes.
+
+Lo que se reconoce:
+  - habitaciones, baños, parqueaderos y estrato ("3 alcobas", "dos baños")
+  - precio: "menos de / hasta / más de / desde / entre ... y ...", en
+    millones ("500 millones", "1,2 mil millones", "800M", "300 palos"),
+    miles ("900 mil") o pesos ("$450.000.000"); una cifra sin moneda, unidad
+    ni comparador no es precio (puede ser un ``codigo_fincaraiz``)
+  - área en m² con los mismos comparadores; un área suelta ("80 m2") se
+    toma como ±10 %
+  - tipo de propiedad, mascotas y garaje/parqueadero; las negaciones ("sin
+    parqueadero", "no se aceptan mascotas") se quitan del texto sin filtrar
+  - barrio o municipio del nomenclátor ("en Laureles", "envigado"), como
+    ``barrio``/``municipio`` con el slug (ver ``gazetteer.find_in_text``)
+
+Los comparadores que el formulario no puede expresar sobre habitaciones,
+baños, parqueaderos o estrato ("al menos 2 habitaciones", "de 2 a 3 alcobas",
+"3 baños o más") se dejan en el texto, con su número.
+"""
+import re
+import unicodedata
+from dataclasses import dataclass, field
+
+from . import gazetteer
+
+NUMEROS = {
+    "un": 1, "una": 1, "uno": 1, "dos": 2, "tres": 3, "cuatro": 4, "cinco": 5,
+    "seis": 6, "siete": 7, "ocho": 8, "nueve": 9, "diez": 10,
+}
+TIPOS = {
+    "apartamento": "Apartamento", "apartamentos": "Apartamento", "apto": "Apartamento", "aptos": "Apartamento",
+    "apartaestudio": "Apartamento", "apartaestudios": "Apartamento",
+    "casa": "Casa", "casas": "Casa",
+    "lote": "Lote", "lotes": "Lote", "terreno": "Lote", "terrenos": "Lote",
+    "oficina": "Oficina", "oficinas": "Oficina",
+}
+AREA_TOLERANCIA = 0.10
+
+_N = r"(?:\d+|" + "|".join(sorted(NUMEROS, key=len, reverse=True)) + r")"
+_MENOS = r"(?:menos\s+de|hasta|maximo|max\.?|por\s+debajo\s+de|no\s+mas\s+de|inferior\s+a|<=?)"
+_MAS = r"(?:mas\s+de|desde|minimo|min\.?|por\s+encima\s+de|superior\s+a|>=?)"
+_UNIDAD_AREA = r"(?:m2|m²|mt2|mts2|mts|metros(?:\s+cuadrados)?)"
+# Cantidad de dinero: número (con separadores o decimales) y unidad opcional.
+# "mil" seguido de una unidad de área ("3 mil metros") no es dinero.
+_DINERO = (
+    r"(?P<{u}s>\$)?\s*(?P<{n}>\d{{1,3}}(?:[.,]\d{{3}})+|\d+(?:[.,]\d+)?)\s*"
+    r"(?P<{u}>mil\s+millones|millones|millon|mill|mm|palos|m(?![0-9²a-z])|mil(?!\s*" + _UNIDAD_AREA + r")|k(?![a-z]))?"
+    r"(?:\s*(?:de\s+)?(?P<{u}c>pesos|cop))?"
+)
+_AREA = r"(?P<{n}>\d{{1,3}}(?:[.,]\d{{3}})+|\d+(?:[.,]\d+)?)(?P<{n}m>\s*mil)?\s*" + _UNIDAD_AREA
+# Cifra con separadores de miles ("1.500", "2,300,000"): entera, no decimal
+_MILES = re.compile(r"\d{1,3}(?:[.,]\d{3})+")
+
+
+def _dinero(n, u):
+    return _DINERO.format(n=n, u=u)
+
+
+def _area(n):
+    return _AREA.format(n=n)
+
+
+PATRONES = [
+    ("precio_rango", re.compile(rf"\bentre\s+{_dinero('a', 'ua')}\s+(?:y|a)\s+{_dinero('b', 'ub')}")),
+    ("precio_max", re.compile(rf"\b{_MENOS}\s+{_dinero('a', 'ua')}")),
+    ("precio_min", re.compile(rf"\b{_MAS}\s+{_dinero('a', 'ua')}")),
+    # Un precio sin comparador ("800M", "$450.000.000") se toma como tope sólo
+    # con moneda o unidad: una cifra suelta puede ser un código ("192840040")
+    ("precio", re.compile(rf"(?<![\w.,]){_dinero('a', 'ua')}")),
+    ("area_rango", re.compile(rf"\bentre\s+(?P<a>\d+(?:[.,]\d+)?)\s*{_UNIDAD_AREA}?\s+(?:y|a)\s+{_area('b')}")),
+    ("area_max", re.compile(rf"\b{_MENOS}\s+{_area('a')}")),
+    ("area_min", re.compile(rf"\b{_MAS}\s+{_area('a')}")),
+    ("area", re.compile(rf"\b{_area('a')}")),
+    ("rooms", re.compile(rf"\b(?:de\s+)?(?P<a>{_N})\s*(?:habitaciones|habitacion|habs?\.?|alcobas?|cuartos?|dormitorios?|piezas?)\b")),
+    ("bathrooms", re.compile(rf"\b(?:de\s+)?(?P<a>{_N})\s*(?:banos|bano|banios?)\b")),
+    ("parking_spaces", re.compile(rf"\b(?P<a>{_N})\s*(?:parqueaderos?|garajes?|parqueos?|celdas?)\b")),
+    ("estrato", re.compile(r"\bestrato\s*(?P<a>[1-6])\b")),
+    # "sin parqueadero", "no se aceptan mascotas": se quitan del texto sin filtrar
+    ("negado", re.compile(
+        r"\b(?:sin|(?:que\s+)?no\s+(?:se\s+)?(?:acept|admit|permit|tien|incluy)\w*)\s+"
+        r"(?:parqueaderos?|garajes?|parqueos?|parking|celdas?|mascotas?|perros?|gatos?)\b"
+    )),
+    ("garaje", re.compile(r"\b(?:con\s+)?(?:parqueadero|garaje|parqueo|parking)\b")),
+    ("mascotas", re.compile(
+        r"\b(?:(?:que\s+)?(?:se\s+)?(?:acept|admit|permit)\w*\s+|con\s+|para\s+)?(?:mascotas?|perros?|gatos?)\b"
+        r"|\bpet\s*friendly\b"
+    )),
+    ("tipo", re.compile(r"\b(?:" + "|".join(sorted(TIPOS, key=len, reverse=True)) + r")\b")),
+]
+# Cantidades con comparador o rango ("al menos 2", "de 2 a 3", "3 o más"): el
+# formulario sólo filtra por igualdad, así que se dejan en el texto
+_CONTEOS = ("rooms", "bathrooms", "parking_spaces", "estrato")
+_COMPARADOR_ANTES = re.compile(
+    rf"(?:(?<!\w)(?:al\s+menos|por\s+lo\s+menos|como\s+(?:minimo|maximo)|{_MENOS}|{_MAS})"
+    rf"|\b(?:de|entre)\s+{_N}\s+(?:a|y)|\b{_N}\s*(?:o|-))\s*$"
+)
+_COMPARADOR_DESPUES = re.compile(r"\s*(?:o\s+mas|o\s+menos|como\s+(?:minimo|maximo)|al\s+menos|minimo|maximo)\b")
+# Preposición que acompaña a un lugar y se quita con él ("en Laureles")
+_ANTES_DE_LUGAR = re.compile(r"(?:\ben|\bbarrio|\bsector|\bpor)\s+$")
+# Palabras que quedan colgando al quitar un filtro ("... en Laureles con")
+_CONECTORES = {"con", "de", "del", "en", "y", "a", "para", "que", "por", "un", "una", "el", "la", "los", "las", "o"}
+
+
+@dataclass
+class ParsedQuery:
+    text: str                                  # texto residual (lo que se codifica)
+    filters: dict = field(default_factory=dict)  # claves de ``attributes.FILTER_KEYS``, valores str
+    spans: list = field(default_factory=list)    # (inicio, fin) de cada fragmento reconocido
+
+
+def _fold(text):
+    """Minúsculas y sin tildes, carácter por carácter (misma longitud que ``text``)."""
+    out = []
+    for ch in text:
+        base = unicodedata.normalize("NFKD", ch)[:1] or ch
+        low = base.lower()
+        out.append(low if len(low) == 1 else base)
+    return "".join(out)
+
+
+def _cifra(numero):
+    """Valor de un número escrito: "1.500" es mil quinientos y "2,5" dos y medio."""
+    if _MILES.fullmatch(numero):
+        return int(re.sub(r"[.,]", "", numero))
+    return float(numero.replace(",", "."))
+
+
+def _numero(token):
+    token = token.strip()
+    if token in NUMEROS:
+        return NUMEROS[token]
+    return int(token)
+
+
+def _pesos(numero, unidad):
+    """Valor en COP de un número con su unidad; None si no parece un precio."""
+    unidad = re.sub(r"\s+", " ", unidad or "")
+    if unidad:
+        valor = _cifra(numero)
+        factor = {"mil millones": 1e9, "mil": 1e3, "k": 1e3}.get(unidad, 1e6)
+        return int(round(valor * factor))
+    valor = int(re.sub(r"[.,]", "", numero))
+    # Sin unidad sólo es precio si la cifra es de pesos ("450.000.000"), no "500"
+    return valor if valor >= 1_000_000 else None
+
+
+def _metros(numero, mil=None):
+    valor = float(_cifra(numero))
+    return valor * 1000 if mil else valor
+
+
+def _fmt_area(value):
+    return str(int(value)) if float(value).is_integer() else f"{value:.1f}"
+
+
+def _aplicar(kind, m, filters):
+    """Agrega a ``filters`` lo reconocido por ``m``. Devuelve False si no aplica."""
+    g = m.groupdict()
+    if kind == "precio_rango":
+        a, b = _pesos(g["a"], g["ua"] or g["ub"]), _pesos(g["b"], g["ub"])
+        if a is None or b is None:
+            return False
+        filters["precio_min"], filters["precio_max"] = str(min(a, b)), str(max(a, b))
+    elif kind == "precio":
+        valor = _pesos(g["a"], g["ua"]) if g["ua"] or g["uas"] or g["uac"] else None
+        if valor is None or "precio_max" in filters:
+            return False
+        filters["precio_max"] = str(valor)
+    elif kind in ("precio_max", "precio_min"):
+        valor = _pesos(g["a"], g["ua"])
+        if valor is None:
+            return False
+        filters[kind] = str(valor)
+    elif kind == "area_rango":
+        a, b = _metros(g["a"], g.get("am")), _metros(g["b"], g["bm"])
+        filters["area_min"], filters["area_max"] = _fmt_area(min(a, b)), _fmt_area(max(a, b))
+    elif kind in ("area_max", "area_min"):
+        filters[kind] = _fmt_area(_metros(g["a"], g["am"]))
+    elif kind == "area":
+        valor = _metros(g["a"], g["am"])
+        filters["area_min"] = _fmt_area(round(valor * (1 - AREA_TOLERANCIA)))
+        filters["area_max"] = _fmt_area(round(valor * (1 + AREA_TOLERANCIA)))
+    elif kind in ("rooms", "bathrooms", "parking_spaces", "estrato"):
+        filters[kind] = str(_numero(g["a"]))
+        if kind == "parking_spaces":
+            filters.setdefault("garaje", "1")
+    elif kind == "negado":
+        pass  # el formulario no tiene "sin garaje" / "sin mascotas"
+    elif kind in ("garaje", "mascotas"):
+        filters[kind] = "1"
+    elif kind == "tipo":
+        filters["tipo"] = TIPOS[m.group(0)]
+    return True
+
+
+def _con_comparador(folded, m):
+    """True si la cantidad de ``m`` lleva un comparador o es parte de un rango."""
+    return bool(
+        _COMPARADOR_ANTES.search(folded[:m.start()]) or _COMPARADOR_ANTES.search(folded[:m.start("a")])
+        or _COMPARADOR_DESPUES.match(folded, m.end())
+    )
+
+
+def _residual(text, spans):
+    partes, pos = [], 0
+    for start, end in sorted(spans):
+        partes.append(text[pos:start])
+        pos = max(pos, end)
+    partes.append(text[pos:])
+    palabras = " ".join(" ".join(partes).replace(",", " ").split()).split(" ")
+    while palabras and _fold(palabras[0]) in _CONECTORES:
+        palabras.pop(0)
+    while palabras and _fold(palabras[-1]) in _CONECTORES:
+        palabras.pop()
+    return " ".join(p for p in palabras if p)
+
+
+def parse(text):
+    """Filtros y texto residual de una consulta libre (ver el docstring del módulo)."""
+    text = text or ""
+    folded = _fold(text)
+    ocupado = [False] * len(text)
+    filters, spans = {}, []
+    for kind, pattern in PATRONES:
+        for m in pattern.finditer(folded):
+            start, end = m.span()
+            # Un fragmento ya reconocido (p. ej. "menos de 80 m2" por area_max) no se reusa
+            if any(ocupado[start:end]):
+                continue
+            # Sólo el primer valor de cada filtro cuenta; el resto queda en el texto
+            if kind not in ("garaje", "mascotas", "negado") and kind in filters:
+                continue
+            if kind in _CONTEOS and _con_comparador(folded, m):
+                continue
+            if not _aplicar(kind, m, filters):
+                continue
+            ocupado[start:end] = [True] * (end - start)
+            spans.append((start, end))
+    # Barrio o municipio, en lo que no se reconoció como otro filtro
+    libre = "".join(" " if usado else ch for ch, usado in zip(folded, ocupado))
+    found = gazetteer.find_in_text(text, libre)
+    if found is not None:
+        lugar, (start, end) = found
+        filters[lugar.tipo] = lugar.slug
+        prefijo = _ANTES_DE_LUGAR.search(libre[:start])
+        spans.append((prefijo.start() if prefijo else start, end))
+    return ParsedQuery(text=_residual(text, spans), filters=filters, spans=sorted(spans))
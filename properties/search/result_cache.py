@@ -0,0 +1,117 @@
+"""
+Cache de resultados del buscador.
+
+Guarda la lista ordenada de ids de una búsqueda (todas las páginas) con
+clave (texto normalizado, filtros, orden, versión del índice). Cada página
+se arma cortando esa lista, así que las landing pages que repiten la misma
+URL no vuelven a codificar, puntuar ni filtrar.
+
+La invalidación es por generación: las claves incluyen un contador que las
+señales de ``Propiedad``/``MediaPropiedad`` incrementan, de modo que todas
+las entradas anteriores dejan de usarse de golpe (y expiran solas por TTL).
+Para que la invalidación llegue a todos los workers, el alias de cache
+(``SEARCH_RESULT_CACHE``) debe ser compartido (Redis, Memcached, archivo...);
+con ``LocMemCache`` cada proceso tiene su propia copia.
+
+Protección contra estampida: ante un fallo de cache sólo el worker que toma
+el lock (``cache.add``) recalcula; los demás esperan un momento a que el
+valor aparezca y sólo si no aparece lo calculan ellos mismos.
+"""
+import hashlib
+import json
+import os
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .query_cache import normalize_query
+
+GEN_KEY = "search-results:gen"
+LOCK_TTL = 30     # segundos; lo que puede tardar como máximo un recálculo
+WAIT = 2.0        # segundos que un worker espera el resultado de otro
+POLL = 0.05
+
+_stats = {"hits": 0, "misses": 0}  # de este proceso (ver metrics.py)
+
+
+def _cache():
+    return caches[getattr(settings, "SEARCH_RESULT_CACHE", "default")]
+
+
+def _ttl():
+    return getattr(settings, "SEARCH_RESULT_CACHE_TTL", 300)
+
+
+def enabled():
+    return _ttl() > 0
+
+
+def generation():
+    """Generación vigente. Arranca en un timestamp para que, si el contador se
+    pierde (expulsión, reinicio de la cache), nunca vuelva a un valor viejo."""
+    cache = _cache()
+    gen = cache.get(GEN_KEY)
+    if gen is None:
+        cache.add(GEN_KEY, int(time.time() * 1000), timeout=None)
+        gen = cache.get(GEN_KEY)
+    return gen
+
+
+def invalidate():
+    """Invalida todas las búsquedas cacheadas (nueva generación)."""
+    cache = _cache()
+    try:
+        cache.incr(GEN_KEY)
+    except ValueError:  # aún no existe o fue expulsado
+        cache.add(GEN_KEY, int(time.time() * 1000), timeout=None)
+
+
+def stats():
+    lookups = _stats["hits"] + _stats["misses"]
+    return {**_stats, "hit_rate": _stats["hits"] / lookups if lookups else 0.0}
+
+
+def make_key(search, filters, orden, index_version=None, extra=None):
+    """Clave de la búsqueda; ``extra`` distingue variantes (p. ej. el cursor de una página)."""
+    raw = json.dumps(
+        [normalize_query(search), sorted((k, str(v)) for k, v in (filters or {}).items()), orden or "",
+         index_version, extra],
+        ensure_ascii=False,
+    )
+    digest = hashlib.sha1(raw.encode("utf-8")).hexdigest()
+    return f"search-results:{generation()}:{digest}"
+
+
+def get_or_compute(key, compute):
+    """Valor cacheado de ``key`` o ``compute()`` con protección contra estampida.
+
+    ``compute`` devuelve ``(valor, cacheable)``; un resultado no cacheable
+    (p. ej. el fallback SQL cuando el motor falló) se devuelve sin guardarlo.
+    """
+    if not enabled():
+        return compute()[0]
+    cache = _cache()
+    value = cache.get(key)
+    if value is not None:
+        _stats["hits"] += 1
+        return value
+    _stats["misses"] += 1
+    lock = f"{key}:lock"
+    if cache.add(lock, os.getpid(), timeout=LOCK_TTL):
+        try:
+            value, cacheable = compute()
+            if cacheable:
+                cache.set(key, value, timeout=_ttl())
+            return value
+        finally:
+            cache.delete(lock)
+    deadline = time.monotonic() + WAIT
+    while time.monotonic() < deadline:
+        time.sleep(POLL)
+        value = cache.get(key)
+        if value is not None:
+            return value
+        if cache.get(lock) is None:
+            break  # el otro worker terminó sin guardar (no cacheable o error)
+    return compute()[0]
@@ -0,0 +1,243 @@
+"""
+Almacenamiento de vectores en disco, abierto con ``mmap_mode``.
+
+Para cada base ``property_embeddings.npy`` se generan variantes por precisión:
+
+  - ``float32``: la propia base.
+  - ``float16``: ``property_embeddings.float16.npy`` (mitad de memoria).
+  - ``int8``:    ``property_embeddings.int8.npy`` con escala/offset por
+                 dimensión (x ≈ q * scale + offset), un cuarto de memoria.
+
+Cada variante lleva un ``.meta.npz`` con las normas de sus filas (y la
+escala/offset en int8). Al abrirse con mmap, todos los workers comparten las
+mismas páginas del page cache del sistema operativo en lugar de tener una
+copia privada cada uno.
+"""
+import os
+import tempfile
+import time
+
+import numpy as np
+
+PRECISIONS = ("float32", "float16", "int8")
+BLOCK_ROWS = 16384  # filas por bloque al recorrer la matriz (acota la memoria temporal)
+
+
+def variant_paths(embed_path, precision):
+    """Devuelve (ruta_datos, ruta_meta) de una variante."""
+    if precision not in PRECISIONS:
+        raise ValueError(f"Precisión no soportada: {precision}. Opciones: {', '.join(PRECISIONS)}")
+    stem, _ = os.path.splitext(embed_path)
+    data = embed_path if precision == "float32" else f"{stem}.{precision}.npy"
+    return data, f"{stem}.{precision}.meta.npz"
+
+
+def normalize_rows(vecs):
+    """Normaliza cada fila a norma L2 = 1 (las filas nulas quedan en cero)."""
+    vecs = np.atleast_2d(np.asarray(vecs, dtype=np.float32))
+    norms = np.linalg.norm(vecs, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vecs / norms
+
+
+def top_k(scores, k):
+    """Índices de los ``k`` mayores puntajes (por fila), de mayor a menor.
+
+    ``argpartition`` selecciona los ganadores en O(N) y sólo esos k se ordenan,
+    en lugar de ordenar las N filas con ``argsort``.
+    """
+    scores = np.asarray(scores)
+    n = scores.shape[-1]
+    k = min(int(k), n)
+    if k <= 0:
+        return np.empty(scores.shape[:-1] + (0,), dtype=np.int64)
+    if k < n:
+        idx = np.argpartition(-scores, k - 1, axis=-1)[..., :k]
+    else:
+        idx = np.broadcast_to(np.arange(n), scores.shape).copy()
+    order = np.argsort(-np.take_along_axis(scores, idx, axis=-1), axis=-1, kind="stable")
+    return np.take_along_axis(idx, order, axis=-1)
+
+
+def _save_atomic(path, writer):
+    # Temporal con nombre único: dos procesos que escriben la misma variante no
+    # se pisan el archivo a medio escribir; el último ``os.replace`` gana.
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=f"{os.path.basename(path)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            writer(fh)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def quantize_int8(vecs):
+    """Cuantiza por dimensión a int8. Devuelve (q, scale, offset)."""
+    vecs = np.asarray(vecs, dtype=np.float32)
+    lo = vecs.min(axis=0) if len(vecs) else np.zeros(vecs.shape[1], np.float32)
+    hi = vecs.max(axis=0) if len(vecs) else np.zeros(vecs.shape[1], np.float32)
+    scale = (hi - lo) / 255.0
+    scale[scale == 0] = 1.0
+    offset = lo + 128.0 * scale
+    q = np.clip(np.rint((vecs - offset) / scale), -128, 127).astype(np.int8)
+    return q, scale.astype(np.float32), offset.astype(np.float32)
+
+
+def write_variant(embed_path, vecs, precision):
+    """Escribe la variante ``precision`` de ``vecs`` (ya normalizados) junto a ``embed_path``."""
+    data_path, meta_path = variant_paths(embed_path, precision)
+    vecs = np.asarray(vecs, dtype=np.float32)
+    meta = {}
+    if precision == "float16":
+        data = vecs.astype(np.float16)
+        deq = data.astype(np.float32)
+    elif precision == "int8":
+        data, scale, offset = quantize_int8(vecs)
+        meta.update(scale=scale, offset=offset)
+        deq = data.astype(np.float32) * scale + offset
+    else:
+        data, deq = vecs, vecs
+    meta["norms"] = np.linalg.norm(deq, axis=1).astype(np.float32)
+    if data_path != embed_path:
+        _save_atomic(data_path, lambda fh: np.save(fh, data))
+    _save_atomic(meta_path, lambda fh: np.savez(fh, **meta))
+
+
+def write_variants(embed_path, vecs, precisions=PRECISIONS):
+    for precision in precisions:
+        write_variant(embed_path, vecs, precision)
+
+
+def _is_fresh(embed_path, precision):
+    data_path, meta_path = variant_paths(embed_path, precision)
+    try:
+        base = os.path.getmtime(embed_path)
+        return os.path.getmtime(data_path) >= base and os.path.getmtime(meta_path) >= base
+    except OSError:
+        return False
+
+
+class VectorStore:
+    """Matriz de embeddings (posiblemente cuantizada) con producto punto por bloques."""
+
+    def __init__(self, data, norms, precision="float32", scale=None, offset=None):
+        self.data = data
+        self.norms = norms
+        self.precision = precision
+        self.scale = scale
+        self.offset = offset
+        # Los builds guardan vectores normalizados: el coseno es un solo producto
+        # punto. Archivos viejos sin normalizar siguen funcionando dividiendo por la norma.
+        self.unit_norm = bool(len(norms) == 0 or np.allclose(norms, 1.0, atol=1e-2))
+
+    def __len__(self):
+        return self.data.shape[0]
+
+    @property
+    def dim(self):
+        return self.data.shape[1]
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes
+
+    @classmethod
+    def open(cls, embed_path, precision="float32", mmap=True):
+        """Abre una variante; la (re)genera si falta o es más vieja que la base.
+
+        La regeneración se hace bajo un bloqueo por variante: si varios workers
+        arrancan a la vez, uno la escribe y los demás la encuentran ya fresca.
+        """
+        from .delta import file_lock  # delta importa este módulo
+
+        data_path, meta_path = variant_paths(embed_path, precision)
+        if not _is_fresh(embed_path, precision):
+            with file_lock(meta_path):
+                if not _is_fresh(embed_path, precision):
+                    write_variant(embed_path, np.load(embed_path, mmap_mode="r"), precision)
+        data = np.load(data_path, mmap_mode="r" if mmap else None)
+        with np.load(meta_path) as meta:
+            norms = meta["norms"]
+            scale = meta["scale"] if "scale" in meta else None
+            offset = meta["offset"] if "offset" in meta else None
+        return cls(data, norms, precision, scale, offset)
+
+    def rows(self, rows):
+        """Filas ``rows`` como float32 (decuantizadas si la variante es int8)."""
+        out = np.asarray(self.data[rows], dtype=np.float32)
+        if self.precision == "int8":
+            out = out * self.scale + self.offset
+        return out
+
+    def _weights(self, queries):
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        if self.precision == "int8":
+            return queries * self.scale, queries @ self.offset
+        return queries, None
+
+    def dot(self, queries):
+        """Producto punto (m, N) entre ``queries`` (m, d) y todas las filas.
+
+        Se opera directamente sobre los datos cuantizados: en int8,
+        x·v = q·(scale∘v) + offset·v, así que no hace falta decuantizar la matriz.
+        """
+        weights, bias = self._weights(queries)
+        n = len(self)
+        out = np.empty((weights.shape[0], n), dtype=np.float32)
+        for start in range(0, n, BLOCK_ROWS):
+            block = np.asarray(self.data[start:start + BLOCK_ROWS], dtype=np.float32)
+            out[:, start:start + block.shape[0]] = weights @ block.T
+        if bias is not None:
+            out += bias[:, None]
+        return out
+
+    def dot_rows(self, queries, rows):
+        """Producto punto (m, len(rows)) sólo contra las filas ``rows``."""
+        weights, bias = self._weights(queries)
+        out = weights @ np.asarray(self.data[rows], dtype=np.float32).T
+        if bias is not None:
+            out += bias[:, None]
+        return out
+
+    def cosine(self, queries, rows=None):
+        """Similitud coseno (m, N) contra todas las filas, o sólo contra ``rows``."""
+        queries = normalize_rows(queries)
+        scores = self.dot(queries) if rows is None else self.dot_rows(queries, rows)
+        if not self.unit_norm:
+            norms = np.where(self.norms == 0, 1.0, self.norms)
+            scores /= norms[None, :] if rows is None else norms[rows][None, :]
+        return scores
+
+
+def recall_report(embed_path, k=10, sample=200, seed=0):
+    """Compara cada precisión contra float32 exacto usando filas del índice como consultas.
+
+    Devuelve una lista de dicts con recall@k, memoria y tiempo medio por consulta.
+    """
+    exact_store = VectorStore.open(embed_path, "float32")
+    n = len(exact_store)
+    if n == 0:
+        return []
+    k = min(k, n)
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(n, size=min(sample, n), replace=False)
+    queries = np.asarray(exact_store.data[picks], dtype=np.float32)
+    exact = top_k(exact_store.cosine(queries), k)
+
+    report = []
+    for precision in PRECISIONS:
+        store = exact_store if precision == "float32" else VectorStore.open(embed_path, precision)
+        start = time.perf_counter()
+        sims = store.cosine(queries)
+        elapsed = time.perf_counter() - start
+        approx = top_k(sims, k)
+        hits = sum(len(set(a) & set(e)) for a, e in zip(approx, exact))
+        report.append({
+            "precision": precision,
+            "recall": hits / float(k * len(queries)),
+            "mb": store.nbytes / (1024 * 1024),
+            "ms_per_query": 1000.0 * elapsed / len(queries),
+        })
+    return report
@@ -0,0 +1,263 @@
+"""
+Sugerencias del buscador mientras se escribe (``/properties/suggest/?q=``).
+
+Índice de prefijos en memoria, construido a partir de:
+
+  - barrios / municipios normalizados (``Barrio``/``Municipio``) y, para las
+    propiedades fuera del nomenclátor, cada parte de ``location``
+  - tipos de propiedad
+  - títulos (los ``MAX_TITLES`` más repetidos)
+  - consultas populares registradas por el buscador (``ConsultaBusqueda``)
+
+Las claves se normalizan como las consultas (minúsculas, sin tildes), así
+que "belen" encuentra "Belén". Barrios, tipos y consultas se indexan además
+desde cada palabra ("poblado" encuentra "El Poblado").
+
+Estructura: un arreglo ordenado de claves con ``bisect`` más, para los
+prefijos de hasta ``TOP_PREFIX`` letras (los que tienen miles de
+coincidencias), la lista de las mejores ya calculada. Una consulta es un
+lookup en un dict o dos ``bisect`` y un recorrido acotado: sin BD.
+
+El índice se reconstruye (en un hilo, sirviendo el anterior mientras tanto)
+cuando cambia la versión activa del índice de búsqueda o el delta, y cada
+``SEARCH_SUGGEST_REFRESH`` segundos para incorporar consultas nuevas.
+
+Las consultas del buscador se cuentan por visitante distinto (usuario o IP,
+una vez por consulta cada ``VISITOR_TTL``) y se acumulan en memoria: la BD se
+escribe por lotes, no en cada búsqueda. Una consulta sólo se sugiere cuando
+la repiten ``SEARCH_SUGGEST_MIN_VISITORS`` visitantes, así que no basta con
+escribirla varias veces para publicarla.
+"""
+import bisect
+import hashlib
+import logging
+import math
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+
+from .query_cache import normalize_query
+
+logger = logging.getLogger(__name__)
+
+TOP_PREFIX = 3      # prefijos con las mejores sugerencias precalculadas
+MAX_LIMIT = 20      # sugerencias máximas por consulta
+MAX_SCAN = 512      # claves que se revisan como máximo para prefijos largos
+MAX_TITLES = 50000
+MAX_QUERIES = 5000
+MIN_QUERY_COUNT = 3  # visitantes distintos que deben buscar una consulta para sugerirla
+VISITOR_TTL = 24 * 3600  # un visitante suma una vez por consulta en este lapso
+LOG_BATCH = 50           # conteos acumulados en memoria antes de escribir en la BD
+LOG_FLUSH_SECONDS = 60   # ... o antigüedad máxima del lote
+BOOST = {"consulta": 3.0, "barrio": 2.0, "tipo": 2.0, "titulo": 1.0}
+WORD_ALIASES = ("consulta", "barrio", "tipo")
+
+_lock = threading.Lock()
+_index = None
+_token = None
+_building = False
+
+_log_lock = threading.Lock()
+_pending = Counter()  # texto normalizado -> visitantes nuevos aún sin escribir
+_pending_since = None
+
+
+class SuggestIndex:
+    def __init__(self, entries):
+        """``entries``: iterable de (texto, tipo, peso)."""
+        best = {}  # clave -> (score, texto, tipo)
+        for text, kind, weight in entries:
+            key = normalize_query(text)
+            if not key:
+                continue
+            score = BOOST.get(kind, 1.0) * math.log1p(max(weight, 0))
+            if key not in best or score > best[key][0]:
+                best[key] = (score, text.strip(), kind)
+        self.entries = best
+
+        pairs = []  # (clave de búsqueda, clave canónica)
+        for key, (_, _, kind) in best.items():
+            pairs.append((key, key))
+            if kind in WORD_ALIASES:
+                for pos, ch in enumerate(key):
+                    if ch == " " and pos + 1 < len(key):
+                        pairs.append((key[pos + 1:], key))
+        pairs.sort()
+        self.keys = [k for k, _ in pairs]
+        self.targets = [t for _, t in pairs]
+
+        buckets = defaultdict(set)
+        for key, target in pairs:
+            for n in range(1, min(TOP_PREFIX, len(key)) + 1):
+                buckets[key[:n]].add(target)
+        self._top = {prefix: sorted(targets, key=self._rank)[:MAX_LIMIT] for prefix, targets in buckets.items()}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _rank(self, key):
+        score, text, _ = self.entries[key]
+        return (-score, len(text), key)
+
+    def suggest(self, query, limit=8):
+        """[{"text", "kind"}] que empiezan (o tienen una palabra que empieza) con ``query``."""
+        prefix = normalize_query(query)
+        limit = max(1, min(int(limit), MAX_LIMIT))
+        if not prefix:
+            return []
+        if len(prefix) <= TOP_PREFIX:
+            found = self._top.get(prefix, [])
+        else:
+            lo = bisect.bisect_left(self.keys, prefix)
+            hi = bisect.bisect_left(self.keys, prefix + "\uffff", lo, min(len(self.keys), lo + MAX_SCAN))
+            found = sorted(set(self.targets[lo:hi]), key=self._rank)
+        return [{"text": self.entries[key][1], "kind": self.entries[key][2]} for key in found[:limit]]
+
+
+def _entries():
+    """(texto, tipo, peso) desde la BD. Sólo se llama al (re)construir el índice."""
+    from django.db.models import Count
+    from properties.models import Barrio, ConsultaBusqueda, Municipio, Propiedad
+
+    barrios = Counter()
+    for modelo in (Barrio, Municipio):
+        for nombre, n in modelo.objects.annotate(n=Count("propiedades")).filter(n__gt=0).values_list("nombre", "n"):
+            barrios[nombre] += n
+    # Lugares fuera del nomenclátor: las partes de ``location`` tal cual
+    sin_ubicacion = Propiedad.objects.filter(barrio__isnull=True, municipio__isnull=True)
+    for row in sin_ubicacion.values("location").annotate(n=Count("id")):
+        for part in (row["location"] or "").split(","):
+            if part.strip():
+                barrios[part.strip()] += row["n"]
+    for text, n in barrios.items():
+        yield text, "barrio", n
+    for row in Propiedad.objects.values("property_type").annotate(n=Count("id")):
+        if row["property_type"]:
+            yield row["property_type"], "tipo", row["n"]
+    titles = (
+        Propiedad.objects.exclude(title__isnull=True).exclude(title="")
+        .values("title").annotate(n=Count("id")).order_by("-n")[:MAX_TITLES]
+    )
+    for row in titles:
+        yield row["title"], "titulo", row["n"]
+    queries = ConsultaBusqueda.objects.filter(veces__gte=_min_visitors()).order_by("-veces")[:MAX_QUERIES]
+    for texto, veces in queries.values_list("texto", "veces"):
+        yield texto, "consulta", veces
+
+
+def _min_visitors():
+    return max(1, getattr(settings, "SEARCH_SUGGEST_MIN_VISITORS", MIN_QUERY_COUNT))
+
+
+def _refresh_seconds():
+    return getattr(settings, "SEARCH_SUGGEST_REFRESH", 600)
+
+
+def _current_token():
+    """Cambia cuando se activa otra versión del índice, cambia el delta o vence el refresco."""
+    from properties.management.commands import embeddings as emb
+    return emb._version_activa(), emb._mtime(emb.DELTA_PATH), int(time.time() // max(_refresh_seconds(), 1))
+
+
+def build(token=None):
+    """Construye el índice y lo activa. Devuelve el índice nuevo."""
+    global _index, _token
+    start = time.perf_counter()
+    flush_queries()
+    index = SuggestIndex(_entries())
+    with _lock:
+        _index, _token = index, token if token is not None else _current_token()
+    logger.info("Índice de sugerencias con %s entradas (%.2fs).", len(index), time.perf_counter() - start)
+    return index
+
+
+def _build_in_background(token):
+    global _building
+    from django.db import connection
+    try:
+        build(token)
+    except Exception as e:
+        logger.warning("No se pudo reconstruir el índice de sugerencias: %s", e)
+    finally:
+        connection.close()  # la conexión de este hilo no la cierra nadie más
+        _building = False
+
+
+def get_index():
+    """Índice vigente. La primera vez se construye aquí; después, en segundo plano."""
+    global _building
+    token = _current_token()
+    if _index is None:
+        return build(token)
+    if token != _token and not _building:
+        with _lock:
+            if _building:
+                return _index
+            _building = True
+        threading.Thread(target=_build_in_background, args=(token,), name="suggest-rebuild", daemon=True).start()
+    return _index
+
+
+def suggest(query, limit=8):
+    return get_index().suggest(query, limit)
+
+
+def _visitor(request):
+    """Usuario autenticado o, si no, la IP: una sesión nueva no cuenta como otro visitante."""
+    user = getattr(request, "user", None)
+    if user is not None and user.is_authenticated:
+        return f"user:{user.pk}"
+    return f"ip:{request.META.get('REMOTE_ADDR', '')}"
+
+
+def log_query(text, request):
+    """Cuenta una consulta del buscador (normalizada) para las sugerencias populares.
+
+    Cada visitante suma una vez por consulta; el conteo queda en memoria y se
+    escribe con ``flush_queries`` al juntar ``LOG_BATCH`` o tras ``LOG_FLUSH_SECONDS``.
+    """
+    global _pending_since
+    from django.core.cache import caches
+
+    texto = normalize_query(text)
+    if len(texto) < 2 or len(texto) > 255:
+        return
+    digest = hashlib.sha1(f"{texto}\0{_visitor(request)}".encode()).hexdigest()
+    cache = caches[getattr(settings, "SEARCH_RESULT_CACHE", "default")]
+    if not cache.add(f"suggest:visit:{digest}", 1, VISITOR_TTL):
+        return
+    with _log_lock:
+        _pending[texto] += 1
+        if _pending_since is None:
+            _pending_since = time.monotonic()
+        due = sum(_pending.values()) >= LOG_BATCH or time.monotonic() - _pending_since >= LOG_FLUSH_SECONDS
+    if due:
+        flush_queries()
+
+
+def flush_queries():
+    """Escribe en la BD los conteos acumulados. Devuelve cuántas consultas distintas escribió.
+
+    Un ``bulk_create`` de las que faltan y un solo UPDATE con ``F()`` para
+    todas, así que varios workers pueden escribir a la vez sin perder conteos.
+    """
+    global _pending_since
+    from django.db.models import Case, F, Value, When
+    from django.utils import timezone
+    from properties.models import ConsultaBusqueda
+
+    with _log_lock:
+        pending = dict(_pending)
+        _pending.clear()
+        _pending_since = None
+    if not pending:
+        return 0
+    now = timezone.now()
+    ConsultaBusqueda.objects.bulk_create(
+        [ConsultaBusqueda(texto=texto, veces=0, ultima=now) for texto in pending], ignore_conflicts=True,
+    )
+    suma = Case(*[When(texto=texto, then=Value(n)) for texto, n in pending.items()], default=Value(0))
+    ConsultaBusqueda.objects.filter(texto__in=pending).update(veces=F("veces") + suma, ultima=now)
+    return len(pending)
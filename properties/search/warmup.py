@@ -0,0 +1,122 @@
+"""
+Precalentamiento del índice y del modelo al arrancar el servidor.
+
+``PropertiesConfig.ready()`` sólo cubre ``runserver``. En producción se
+llama desde los hooks del servidor:
+
+  - gunicorn (``gunicorn.conf.py``): con ``--preload`` el índice (sólo
+    lectura) se carga una vez en el master antes del fork y los workers lo
+    comparten copy-on-write; cada worker carga el modelo en
+    ``post_worker_init``, antes de aceptar peticiones.
+  - ASGI: ``lifespan_app`` envuelve la aplicación y precalienta en el
+    evento ``lifespan.startup``.
+
+El estado queda en ``status()`` y lo expone la vista ``properties:ready``.
+"""
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_status = {
+    "state": "pending",   # pending | warming | ready | degraded
+    "pid": None,
+    "index_rows": None,
+    "version": None,      # versión del índice cargada (ver manifest.py)
+    "model": False,
+    "encoder": None,      # "service" (encoder_service) o "local" (modelo en este proceso)
+    "suggest": None,      # entradas del índice de sugerencias
+    "seconds": None,
+    "error": None,
+}
+
+
+def status():
+    return dict(_status)
+
+
+def is_ready():
+    return _status["state"] == "ready" and _status["pid"] == os.getpid()
+
+
+def warmup(load_model=True):
+    """Carga el índice (y el modelo) en este proceso y deja registrado el resultado.
+
+    Con ``load_model`` se hace además un ``encode`` de prueba para que torch
+    inicialice sus kernels antes de la primera búsqueda real. No pasa por la
+    cache de consultas, para no guardar la consulta ficticia. Si hay servicio
+    de codificación (``EMBEDDINGS_ENCODER_SOCKET``) y responde, el modelo no
+    se carga en este proceso.
+    Nunca lanza excepciones: si algo falla la búsqueda sigue funcionando con
+    sus fallbacks y el estado queda en ``degraded``.
+    """
+    from properties.management.commands import embeddings as emb
+
+    with _lock:
+        start = time.perf_counter()
+        _status.update(state="warming", pid=os.getpid(), error=None)
+        errors = []
+        # Los archivos sueltos de builds anteriores se versionan al cargarlos
+        if emb._indice_existe() or all(os.path.exists(path) for path in emb.LEGACY_PATHS):
+            try:
+                ids, _ = emb._load_embeddings_to_cache()
+                _status["index_rows"] = len(ids)
+                _status["version"] = emb._version
+            except Exception as e:
+                errors.append(f"índice: {e}")
+        else:
+            errors.append("índice: no hay embeddings; ejecuta `embeddings --build`")
+        try:
+            from django.db import connections
+            from . import suggest
+            _status["suggest"] = len(suggest.build())
+            # Con --preload esto corre en el master: no heredar la conexión a los workers
+            for conn in connections.all():
+                if not conn.in_atomic_block:
+                    conn.close()
+        except Exception as e:
+            # Sin sugerencias la búsqueda funciona igual: no cuenta para el estado
+            logger.warning("No se pudo precalentar el índice de sugerencias: %s", e)
+        if load_model:
+            try:
+                _status["encoder"] = emb._calentar_codificador()
+                _status["model"] = True
+            except Exception as e:
+                errors.append(f"modelo: {e}")
+        _status.update(
+            state="degraded" if errors else "ready",
+            seconds=round(time.perf_counter() - start, 3),
+            error="; ".join(errors) or None,
+        )
+        if errors:
+            logger.warning("Precalentamiento incompleto (pid %s): %s", os.getpid(), _status["error"])
+        else:
+            logger.info("Búsqueda lista en %.2fs (pid %s, %s filas).",
+                        _status["seconds"], os.getpid(), _status["index_rows"])
+    return status()
+
+
+def lifespan_app(app, load_model=True):
+    """Envuelve una aplicación ASGI para precalentar en ``lifespan.startup``.
+
+    El ``get_asgi_application()`` de Django no maneja el protocolo lifespan;
+    aquí se responde por él y el resto de scopes pasa intacto.
+    """
+    import asyncio
+
+    async def wrapper(scope, receive, send):
+        if scope["type"] != "lifespan":
+            return await app(scope, receive, send)
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await asyncio.to_thread(warmup, load_model)
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    return wrapper
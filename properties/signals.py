@@ -0,0 +1,86 @@
+"""
+Señales del app ``properties``.
+
+Mantienen el índice de embeddings al día cuando se crea, edita o borra una
+propiedad (vistas, admin o ``import_json``), sin esperar a un ``--build``, e
+invalidan la cache de resultados del buscador cuando cambian propiedades o
+su multimedia. También recalculan la portada desnormalizada de la propiedad
+(``Propiedad.portada_url``) cuando se agrega o borra su multimedia.
+"""
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import MediaPropiedad, Propiedad
+from .search import result_cache
+
+logger = logging.getLogger(__name__)
+
+
+def _auto_update_enabled():
+    return getattr(settings, "EMBEDDINGS_AUTO_UPDATE", True)
+
+
+def _indexar(propiedad):
+    try:
+        from properties.management.commands.embeddings import actualizar_embedding_propiedad
+        actualizar_embedding_propiedad(propiedad)
+    except Exception:
+        # La búsqueda nunca debe romper un guardado; el próximo build lo corrige
+        logger.exception("No se pudo actualizar el embedding de la propiedad %s", propiedad.pk)
+
+
+def _desindexar(prop_id):
+    try:
+        from properties.management.commands.embeddings import eliminar_embedding_propiedad
+        eliminar_embedding_propiedad(prop_id)
+    except Exception:
+        logger.exception("No se pudo eliminar el embedding de la propiedad %s", prop_id)
+
+
+@receiver(post_save, sender=Propiedad)
+def propiedad_guardada(sender, instance, raw=False, **kwargs):
+    # raw=True llega desde loaddata: no hay que tocar el índice con fixtures
+    if raw or not _auto_update_enabled():
+        return
+    # Codificar después del commit para no indexar filas que luego se revierten
+    transaction.on_commit(lambda: _indexar(instance))
+
+
+@receiver(post_delete, sender=Propiedad)
+def propiedad_eliminada(sender, instance, **kwargs):
+    if not _auto_update_enabled():
+        return
+    prop_id = instance.pk
+    transaction.on_commit(lambda: _desindexar(prop_id))
+
+
+@receiver(post_save, sender=MediaPropiedad)
+@receiver(post_delete, sender=MediaPropiedad)
+def actualizar_portada(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    # Al borrar la propiedad en cascada, su media se borra antes que ella
+    propiedad = Propiedad.objects.filter(pk=instance.propiedad_id).first()
+    if propiedad is not None:
+        propiedad.actualizar_portada()
+
+
+def _invalidar_resultados():
+    try:
+        result_cache.invalidate()
+    except Exception:
+        logger.exception("No se pudo invalidar la cache de resultados")
+
+
+@receiver(post_save, sender=Propiedad)
+@receiver(post_delete, sender=Propiedad)
+@receiver(post_save, sender=MediaPropiedad)
+@receiver(post_delete, sender=MediaPropiedad)
+def invalidar_resultados(sender, **kwargs):
+    # Tras el commit: si se invalidara antes, otra petición podría volver a
+    # cachear los datos viejos mientras la transacción sigue abierta
+    transaction.on_commit(_invalidar_resultados)
@@ -0,0 +1,76 @@
+// Sugerencias del buscador mientras se escribe (/properties/suggest/?q=)
+(function(){
+    const input = document.querySelector('input[data-suggest-url]');
+    if (!input) return;
+    const box = input.parentElement.querySelector('.search-suggestions');
+    const url = input.dataset.suggestUrl;
+    const DEBOUNCE_MS = 120;
+    let timer = null, controller = null, active = -1;
+
+    const items = () => Array.from(box.querySelectorAll('.list-group-item'));
+
+    const hide = () => {
+        box.classList.add('d-none');
+        box.innerHTML = '';
+        active = -1;
+    };
+
+    const render = suggestions => {
+        box.innerHTML = '';
+        active = -1;
+        if (!suggestions.length) { hide(); return; }
+        suggestions.forEach(s => {
+            const btn = document.createElement('button');
+            btn.type = 'button';
+            btn.className = 'list-group-item list-group-item-action d-flex justify-content-between';
+            btn.setAttribute('role', 'option');
+            const text = document.createElement('span');
+            text.textContent = s.text;
+            const kind = document.createElement('small');
+            kind.className = 'text-muted';
+            kind.textContent = s.kind;
+            btn.append(text, kind);
+            btn.addEventListener('mousedown', e => {
+                e.preventDefault();  // que el blur del input no cierre antes del click
+                input.value = s.text;
+                hide();
+                input.form.submit();
+            });
+            box.appendChild(btn);
+        });
+        box.classList.remove('d-none');
+    };
+
+    const fetchSuggestions = q => {
+        if (controller) controller.abort();
+        controller = new AbortController();
+        fetch(`${url}?q=${encodeURIComponent(q)}`, { signal: controller.signal })
+            .then(r => r.ok ? r.json() : { suggestions: [] })
+            .then(data => {
+                if (input.value.trim() === q) render(data.suggestions || []);
+            })
+            .catch(() => {});  // abortado o sin red: se ignora
+    };
+
+    input.addEventListener('input', () => {
+        clearTimeout(timer);
+        const q = input.value.trim();
+        if (!q) { hide(); return; }
+        timer = setTimeout(() => fetchSuggestions(q), DEBOUNCE_MS);
+    });
+
+    input.addEventListener('keydown', e => {
+        const list = items();
+        if (!list.length) return;
+        if (e.key === 'ArrowDown' || e.key === 'ArrowUp') {
+            e.preventDefault();
+            active = (active + (e.key === 'ArrowDown' ? 1 : -1) + list.length) % list.length;
+            list.forEach((el, i) => el.classList.toggle('active', i === active));
+            input.value = list[active].firstChild.textContent;
+        } else if (e.key === 'Escape') {
+            hide();
+        }
+    });
+
+    input.addEventListener('blur', hide);
+})();
@@ -1,7 +1,34 @@
-from django.test import TestCase
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from collections import Counter
+from datetime import timedelta
+from unittest import mock
+
+import joblib
+import numpy as np
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.contrib.auth import get_user_model
-from .models import Propiedad, ContactMessage
+from django.core.cache import caches
+from . import views
+from .models import Barrio, ConsultaBusqueda, MediaPropiedad, Propiedad, ContactMessage
+from .management.commands import embeddings as emb
+from .search.bm25 import BM25Index, reciprocal_rank_fusion, tokenize
+from .search import ann, cursor, gazetteer, hydrate, keyset, manifest, metrics, preferences, query_parser, result_cache, suggest, warmup
+from .search.build import Checkpoint
+from .search.delta import DeltaIndex
+from .search.ann import IVFIndex
+from .search.knn import KNNTable
+from .search.encoder_service import EncoderClient, EncoderServer, MicroBatcher
+from .search.query_cache import QueryEmbeddingCache, normalize_query
+from .search.store import VectorStore, normalize_rows, recall_report, top_k
 
 
 class ContactRequestTests(TestCase):
@@ -53,3 +80,1131 @@ class ContactRequestTests(TestCase):
 		self.assertEqual(cm.email, data['email'])
 		self.assertEqual(cm.nombre, data['nombre'])
 		self.assertIsNotNone(cm.fecha_envio)
+
+
+class FakeEncoder:
+	"""Codificador determinista para tests: un eje por palabra clave."""
+	KEYWORDS = ['piscina', 'jardin', 'centro', 'oficina']
+
+	def encode(self, texts, **kwargs):
+		out = np.zeros((len(texts), len(self.KEYWORDS)), dtype=np.float32)
+		for i, text in enumerate(texts):
+			for j, kw in enumerate(self.KEYWORDS):
+				if kw in text.lower():
+					out[i, j] = 1.0
+			if not out[i].any():
+				out[i, -1] = 0.1
+		return out
+
+
+class EmbeddingsTmpMixin:
+	"""Aísla los archivos y caches del índice de embeddings en un directorio temporal."""
+
+	def setUp(self):
+		super().setUp()
+		self.tmpdir = tempfile.mkdtemp()
+		paths = {
+			'LEGACY_PATHS': (os.path.join(self.tmpdir, 'emb.npy'), os.path.join(self.tmpdir, 'ids.joblib')),
+			'DELTA_PATH': os.path.join(self.tmpdir, 'delta.npz'),
+		}
+		emb_caches = {
+			'_model': FakeEncoder(), '_query_cache': None, '_embeddings_cache': None, '_ids_cache': None, '_ids_array': None,
+			'_version': None, '_store': None, '_ann': None, '_attrs': None, '_delta': None, '_delta_mtime': None, '_alive_mask': None,
+			'_bm25': None, '_bm25_db': None, '_encoder_client': None, '_encoder_down_until': 0.0, '_encoder_transient': 0,
+			'_knn': None,
+		}
+		patcher = mock.patch.multiple(emb, **paths, **emb_caches)
+		patcher.start()
+		self.addCleanup(patcher.stop)
+		settings_override = self.settings(
+			EMBEDDINGS_QUERY_CACHE_PATH=os.path.join(self.tmpdir, 'queries.sqlite3'),
+			EMBEDDINGS_INDEX_DIR=os.path.join(self.tmpdir, 'index'),
+			EMBEDDINGS_BUILD_WORKERS=1, EMBEDDINGS_BUILD_BATCH=2,
+		)
+		settings_override.enable()
+		self.addCleanup(settings_override.disable)
+		self.addCleanup(shutil.rmtree, self.tmpdir, ignore_errors=True)
+		caches['default'].clear()  # la cache de resultados no debe filtrarse entre tests
+
+	def write_base(self, ids, vecs):
+		# Igual que un build real: versión nueva con vectores normalizados
+		return emb._publicar(list(ids), np.asarray(vecs, dtype=np.float32), source='test')
+
+	def make_prop(self, title, **kwargs):
+		defaults = dict(
+			title=title, location='Medellín', area_m2=50, area_privada_m2=45, rooms=2,
+			bathrooms=1, parking_spaces=0, floor=1, price_cop=100000000, property_type='Apartamento',
+		)
+		defaults.update(kwargs)
+		return Propiedad.objects.create(**defaults)
+
+
+class IncrementalIndexTests(EmbeddingsTmpMixin, TestCase):
+	def test_upsert_and_delete_are_visible_without_rebuild(self):
+		self.write_base([1001, 1002], [[1, 0, 0, 0], [0, 1, 0, 0]])
+		self.assertEqual(emb.buscar_propiedades('casa con piscina', top_k=1)[0]['id'], 1001)
+
+		prop = self.make_prop('Casa con jardin y piscina')
+		self.assertTrue(emb.actualizar_embedding_propiedad(prop))
+		ids = [r['id'] for r in emb.buscar_propiedades('jardin y piscina', top_k=3)]
+		self.assertEqual(ids[0], prop.pk)
+
+		emb.eliminar_embedding_propiedad(1002)
+		ids = [r['id'] for r in emb.buscar_propiedades('jardin', top_k=5)]
+		self.assertNotIn(1002, ids)
+
+	def test_compaction_folds_delta_into_base(self):
+		self.write_base([1001, 1002], [[1, 0, 0, 0], [0, 1, 0, 0]])
+		prop = self.make_prop('Oficina en el centro')
+		emb.actualizar_embedding_propiedad(prop)
+		emb.eliminar_embedding_propiedad(1001)
+		self.assertEqual(emb.compactar_indice(), 2)
+		self.assertFalse(os.path.exists(emb.DELTA_PATH))
+		self.assertEqual(sorted(joblib.load(emb._ruta(emb.ID_PATH))), sorted([1002, prop.pk]))
+
+	def test_large_delta_is_compacted_outside_the_save(self):
+		self.write_base([1001, 1002], [[1, 0, 0, 0], [0, 1, 0, 0]])
+		with mock.patch.object(emb, 'COMPACT_THRESHOLD', 2), \
+				mock.patch.object(emb, '_compactar_en_segundo_plano') as fondo:
+			emb.eliminar_embedding_propiedad(1001)
+			fondo.assert_not_called()
+			emb.eliminar_embedding_propiedad(1002)
+			fondo.assert_called_once()
+			self.assertEqual(DeltaIndex(emb.DELTA_PATH).load().size, 2)  # guardado, sin compactar
+			self.assertEqual(emb.compactar_si_hace_falta(), 0)
+		self.assertIsNone(emb.compactar_si_hace_falta())
+		self.assertFalse(os.path.exists(emb.DELTA_PATH))
+
+
+class QuantizedStoreTests(EmbeddingsTmpMixin, TestCase):
+	def test_quantized_scores_track_float32(self):
+		vecs = np.random.default_rng(1).normal(size=(300, 16)).astype(np.float32)
+		self.write_base(range(300), vecs)
+		exact = VectorStore.open(emb._ruta(emb.EMBED_PATH), 'float32').cosine(vecs[:5])
+		for precision in ('float16', 'int8'):
+			store = VectorStore.open(emb._ruta(emb.EMBED_PATH), precision)
+			self.assertIsInstance(store.data, np.memmap)
+			np.testing.assert_allclose(store.cosine(vecs[:5]), exact, atol=0.05)
+		recalls = {row['precision']: row['recall'] for row in recall_report(emb._ruta(emb.EMBED_PATH), k=10, sample=50)}
+		self.assertEqual(recalls['float32'], 1.0)
+		self.assertGreater(recalls['int8'], 0.8)
+
+	def test_workers_opening_a_stale_variant_together_agree(self):
+		vecs = np.random.default_rng(3).normal(size=(200, 16)).astype(np.float32)
+		self.write_base(range(200), vecs)
+		path = emb._ruta(emb.EMBED_PATH)
+		barrier = threading.Barrier(8)
+		errors, stores = [], []
+
+		def abrir():
+			barrier.wait()
+			try:
+				stores.append(VectorStore.open(path, 'int8'))
+			except Exception as e:
+				errors.append(e)
+
+		threads = [threading.Thread(target=abrir) for _ in range(8)]
+		for t in threads:
+			t.start()
+		for t in threads:
+			t.join()
+		self.assertEqual(errors, [])
+		self.assertEqual([len(s) for s in stores], [200] * 8)
+		self.assertFalse([f for f in os.listdir(os.path.dirname(path)) if f.endswith('.tmp')])
+
+	def test_search_runs_on_int8_variant(self):
+		self.write_base([1001, 1002], [[1, 0, 0, 0], [0, 1, 0, 0]])
+		with self.settings(EMBEDDINGS_PRECISION='int8'):
+			results = emb.buscar_propiedades('jardin', top_k=2)
+		self.assertEqual(emb._store.precision, 'int8')
+		self.assertEqual(results[0]['id'], 1002)
+
+
+	def test_top_k_matches_full_sort(self):
+		scores = np.random.default_rng(2).normal(size=(3, 1000))
+		expected = np.argsort(-scores, axis=1)[:, :10]
+		np.testing.assert_array_equal(top_k(scores, 10), expected)
+		self.assertEqual(list(top_k(np.array([0.1, 0.9]), 5)), [1, 0])
+
+
+@override_settings(EMBEDDINGS_ANN_BACKEND='ivf', EMBEDDINGS_IVF_NPROBE=2)
+class IVFSearchTests(EmbeddingsTmpMixin, TestCase):
+	def setUp(self):
+		super().setUp()
+		rng = np.random.default_rng(0)
+		self.vecs = np.abs(rng.normal(size=(400, 4))).astype(np.float32)
+		self.vecs[7] = [0, 0, 5, 0]  # 'centro' puro: debe ganar
+		self.write_base(range(1000, 1400), self.vecs)
+		emb.construir_indice_ann(nlist=8)
+
+	def test_ivf_returns_exact_winner_and_scans_fewer_rows(self):
+		results = emb.buscar_propiedades('centro', top_k=3)
+		self.assertIsNotNone(emb._ann)
+		self.assertEqual(results[0]['id'], 1007)
+		self.assertLess(len(emb._ann.candidates(self.vecs[7], 2)), len(self.vecs))
+
+	@override_settings(EMBEDDINGS_IVF_NPROBE=1)
+	def test_selective_filters_still_fill_the_page(self):
+		rng = np.random.default_rng(3)
+		for n in (30, 120):  # menos filas que un sondeo (exacto) y más (se amplía nprobe)
+			ids = sorted(int(pk) for pk in rng.choice(range(1000, 1400), size=n, replace=False))
+			results = emb.buscar_propiedades('centro', top_k=n, filters={'ids': ids})
+			self.assertIsNotNone(emb._ann)
+			self.assertEqual(sorted(r['id'] for r in results), ids)
+
+	def test_nlist_is_clamped_and_assignment_is_blocked(self):
+		index = IVFIndex.build(self.vecs[:10], nlist=50)
+		self.assertEqual(index.nlist, 10)
+		self.assertEqual(index.n_rows, 10)
+		with mock.patch('properties.search.ann.ASSIGN_MAX_SIMS', 64):
+			bloques = ann._assign(self.vecs, index.centroids)  # bloques de 6 filas
+		np.testing.assert_array_equal(bloques, ann._assign(self.vecs, index.centroids))
+
+	def test_compaction_keeps_ivf_in_sync(self):
+		emb.buscar_propiedades('centro', top_k=1)
+		prop = self.make_prop('Oficina')
+		emb.actualizar_embedding_propiedad(prop)
+		emb.compactar_indice()
+		self.assertEqual(emb._ann.n_rows, 401)
+		self.assertEqual(emb.buscar_propiedades('oficina', top_k=1)[0]['id'], prop.pk)
+
+
+class QueryCacheTests(EmbeddingsTmpMixin, TestCase):
+	def test_normalized_queries_share_entry_and_survive_restart(self):
+		path = os.path.join(self.tmpdir, 'queries.sqlite3')
+		encoder = mock.Mock(side_effect=FakeEncoder().encode)
+		cache = QueryEmbeddingCache('m', path=path, maxsize=8)
+		first = cache.get('Casa con  Piscína', encoder)
+		second = cache.get('casa con piscina', encoder)
+		np.testing.assert_array_equal(first, second)
+		self.assertEqual(encoder.call_count, 1)
+		self.assertEqual(encoder.call_args[0][0], [normalize_query('CASA con piscina')])
+		self.assertEqual(cache.stats()['hits'], 1)
+
+		restarted = QueryEmbeddingCache('m', path=path, maxsize=8)
+		restarted.get('casa con piscina', encoder)
+		self.assertEqual(encoder.call_count, 1)
+		self.assertEqual(restarted.stats()['disk_hits'], 1)
+
+	def test_large_batches_are_read_from_disk_in_chunks(self):
+		path = os.path.join(self.tmpdir, 'queries.sqlite3')
+		texts = [f'consulta {i}' for i in range(1200)]
+		encoder = mock.Mock(side_effect=FakeEncoder().encode)
+		QueryEmbeddingCache('m', path=path, maxsize=8).get_many(texts, encoder)
+		restarted = QueryEmbeddingCache('m', path=path, maxsize=8)
+		self.assertEqual(len(restarted.get_many(texts, encoder)), 1200)
+		self.assertEqual(encoder.call_count, 1)
+		self.assertEqual(restarted.stats()['disk_hits'], 1200)
+
+	def test_search_skips_model_on_cache_hit(self):
+		self.write_base([1001, 1002], [[1, 0, 0, 0], [0, 1, 0, 0]])
+		emb.buscar_propiedades('jardin', top_k=1)
+		with mock.patch.object(emb, '_get_model', side_effect=AssertionError('model called')):
+			self.assertEqual(emb.buscar_propiedades('Jardín', top_k=1)[0]['id'], 1002)
+
+
+class BatchSearchTests(EmbeddingsTmpMixin, TestCase):
+	def test_batch_matches_single_queries_with_one_encode(self):
+		self.write_base([1001, 1002, 1003], [[1, 0, 0, 0], [0, 1, 0, 0], [0, 1, 1, 0]])
+		queries = ['piscina', 'jardin', 'centro con jardin']
+		with mock.patch.object(emb._model, 'encode', wraps=emb._model.encode) as encode:
+			batch = emb.buscar_propiedades_batch(queries, top_k=2)
+		self.assertEqual(encode.call_count, 1)
+		self.assertEqual(batch, [emb.buscar_propiedades(q, top_k=2) for q in queries])
+
+	def test_ids_filter_restricts_candidates(self):
+		self.write_base([1001, 1002, 1003], [[1, 0, 0, 0], [0, 1, 0, 0], [0, 1, 1, 0]])
+		results = emb.buscar_propiedades_batch(['jardin'], top_k=5, filters={'ids': [1001, 1003]})[0]
+		self.assertEqual([r['id'] for r in results], [1003, 1001])
+
+	def test_queries_file_writes_jsonl(self):
+		from django.core.management import call_command
+		self.write_base([1001, 1002], [[1, 0, 0, 0], [0, 1, 0, 0]])
+		src = os.path.join(self.tmpdir, 'q.txt')
+		out = os.path.join(self.tmpdir, 'r.jsonl')
+		with open(src, 'w', encoding='utf-8') as f:
+			f.write('piscina\n\njardin\n')
+		call_command('embeddings', queries_file=src, output=out, top_k=1, stdout=io.StringIO())
+		with open(out, encoding='utf-8') as f:
+			lines = [json.loads(line) for line in f]
+		self.assertEqual([(l['query'], l['results'][0]['id']) for l in lines], [('piscina', 1001), ('jardin', 1002)])
+
+
+class FilteredSearchTests(EmbeddingsTmpMixin, TestCase):
+	def setUp(self):
+		super().setUp()
+		# 30 casas caras muy parecidas a la consulta y 3 apartamentos baratos algo menos parecidos
+		self.caras = [self.make_prop('Casa con piscina', property_type='Casa', price_cop=900_000_000) for _ in range(30)]
+		self.baratas = [self.make_prop('Apto con piscina y jardin', price_cop=200_000_000, pets_allowed=True) for _ in range(3)]
+		props = self.caras + self.baratas
+		self.write_base([p.pk for p in props], FakeEncoder().encode([emb._texto_propiedad(p) for p in props]))
+
+	def test_filters_are_applied_before_top_k(self):
+		results = emb.buscar_propiedades('piscina', top_k=10, filters={'precio_max': '300000000', 'mascotas': '1'})
+		self.assertEqual(sorted(r['id'] for r in results), sorted(p.pk for p in self.baratas))
+		self.assertEqual(emb.buscar_propiedades('piscina', top_k=10, filters={'tipo': 'Lote'}), [])
+
+	def test_delta_rows_carry_their_attributes(self):
+		emb.buscar_propiedades('piscina', top_k=1)
+		nueva = self.make_prop('Lote con piscina', property_type='Lote', price_cop=50_000_000)
+		emb.actualizar_embedding_propiedad(nueva)
+		results = emb.buscar_propiedades('piscina', top_k=10, filters={'tipo': 'Lote'})
+		self.assertEqual([r['id'] for r in results], [nueva.pk])
+
+	def test_view_returns_full_page_for_selective_filter(self):
+		with mock.patch('properties.views.emb_buscar', emb.buscar_propiedades):
+			response = self.client.get(reverse('buscar'), {'search': 'piscina', 'precio_max': '300000000'})
+		self.assertEqual(
+			sorted(p.pk for p in response.context['propiedades']),
+			sorted(p.pk for p in self.baratas),
+		)
+
+
+class HybridSearchTests(EmbeddingsTmpMixin, TestCase):
+	def setUp(self):
+		super().setUp()
+		self.props = [self.make_prop(f'Apartamento con piscina {i}') for i in range(5)]
+		self.codigo = self.make_prop('Apartamento con piscina', codigo_fincaraiz='FR-778812')
+		self.numerico = self.make_prop('Apartamento con piscina', codigo_fincaraiz='192840040')
+		self.laureles = self.make_prop('Casa en Laureles', location='Laureles, Medellín')
+		props = self.props + [self.codigo, self.numerico, self.laureles]
+		self.write_base([p.pk for p in props], FakeEncoder().encode([emb._texto_propiedad(p) for p in props]))
+
+	def test_tokenize_stems_spanish_plurals(self):
+		self.assertEqual(tokenize('Casas con 3 Habitaciones'), tokenize('casa con 3 habitación'))
+		index = BM25Index.build([1, 2], ['casa en Laureles', 'apartamento en Envigado'])
+		docs, _ = index.search('laureles', 5)
+		self.assertEqual([index.ids[d] for d in docs], [1])
+		fused = reciprocal_rank_fusion([[1, 2, 3], [3]], k=60)
+		self.assertEqual(fused[0][0], 3)
+
+	def test_exact_code_is_surfaced_by_fusion(self):
+		# Para el modelo el código no significa nada; BM25 lo encuentra tal cual
+		ids = [r['id'] for r in emb.buscar_propiedades('FR-778812', top_k=3)]
+		self.assertEqual(ids[0], self.codigo.pk)
+		with self.settings(EMBEDDINGS_HYBRID=False):
+			self.assertIsInstance(emb.buscar_propiedades('piscina', top_k=1)[0]['score'], float)
+
+	def test_numeric_code_is_found_from_the_view(self):
+		# Una cifra sin moneda no es un precio: llega entera al motor
+		response = self.client.get(reverse('buscar'), {'search': '192840040'})
+		self.assertEqual(response.context['propiedades'][0].pk, self.numerico.pk)
+		self.assertFalse(response.context['filtros_detectados'])
+
+	def test_lexical_fallback_works_without_model(self):
+		with mock.patch.object(emb, '_get_model', side_effect=ImportError('sin modelo')):
+			self.assertEqual(emb.buscar_lexico('laureles', top_k=3)[0]['id'], self.laureles.pk)
+			with mock.patch('properties.views.emb_buscar', emb.buscar_propiedades), \
+					mock.patch('properties.views.emb_lexico', emb.buscar_lexico):
+				response = self.client.get(reverse('buscar'), {'search': 'Laureles'})
+		self.assertEqual([p.pk for p in response.context['propiedades']], [self.laureles.pk])
+
+
+class WarmupTests(EmbeddingsTmpMixin, TestCase):
+	def setUp(self):
+		super().setUp()
+		patcher = mock.patch.dict(warmup._status, state='pending', pid=None, index_rows=None, model=False, error=None)
+		patcher.start()
+		self.addCleanup(patcher.stop)
+
+	def test_warmup_loads_index_and_model_and_reports_ready(self):
+		self.write_base([1001, 1002], [[1, 0, 0, 0], [0, 1, 0, 0]])
+		self.assertEqual(self.client.get(reverse('search_ready')).status_code, 503)
+		with mock.patch.object(emb._model, 'encode', wraps=emb._model.encode) as encode:
+			info = warmup.warmup()
+		self.assertEqual(encode.call_count, 1)
+		self.assertEqual((info['state'], info['index_rows'], info['model']), ('ready', 2, True))
+		self.assertIsNotNone(emb._embeddings_cache)
+		response = self.client.get(reverse('search_ready'))
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(response.json()['state'], 'ready')
+
+	def test_missing_index_is_degraded_not_fatal(self):
+		info = warmup.warmup(load_model=False)
+		self.assertEqual(info['state'], 'degraded')
+		self.assertEqual(self.client.get(reverse('search_ready')).status_code, 503)
+
+	def test_asgi_lifespan_runs_warmup(self):
+		import asyncio
+		self.write_base([1001], [[1, 0, 0, 0]])
+		messages = iter([{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}])
+		sent = []
+
+		async def receive():
+			return next(messages)
+
+		async def send(message):
+			sent.append(message['type'])
+
+		app = warmup.lifespan_app(mock.AsyncMock(), load_model=False)
+		asyncio.run(app({'type': 'lifespan'}, receive, send))
+		self.assertEqual(sent, ['lifespan.startup.complete', 'lifespan.shutdown.complete'])
+		self.assertTrue(warmup.is_ready())
+
+
+class VersionedIndexTests(EmbeddingsTmpMixin, TestCase):
+	def test_new_version_is_hot_swapped_and_manifest_is_verifiable(self):
+		first = self.write_base([1001, 1002], [[1, 0, 0, 0], [0, 1, 0, 0]])
+		self.assertEqual(emb.buscar_propiedades('piscina', top_k=1)[0]['id'], 1001)
+		second = self.write_base([1003], [[1, 0, 0, 0]])
+		# Sin reiniciar ni limpiar caches: la siguiente búsqueda ya usa la versión nueva
+		self.assertEqual(emb.buscar_propiedades('piscina', top_k=1)[0]['id'], 1003)
+		self.assertEqual(emb._version, second)
+
+		info = manifest.read_manifest(manifest.version_dir(emb._index_dir(), second))
+		self.assertEqual((info['model'], info['dim'], info['rows'], info['previous']), (emb.EMBED_MODEL_NAME, 4, 1, first))
+		self.assertIn(emb.EMBED_PATH, info['files'])
+		self.assertEqual(manifest.verify(manifest.version_dir(emb._index_dir(), second)), [])
+
+	def test_bundle_round_trip_to_another_node(self):
+		version = self.write_base([1001, 1002], [[1, 0, 0, 0], [0, 1, 0, 0]])
+		bundle = os.path.join(self.tmpdir, 'v.tar.gz')
+		manifest.export_bundle(emb._index_dir(), bundle)
+		other = os.path.join(self.tmpdir, 'otro-nodo')
+		self.assertEqual(manifest.import_bundle(other, bundle), version)
+		self.assertEqual(manifest.current_version(other), version)
+		with self.settings(EMBEDDINGS_INDEX_DIR=other):
+			self.assertEqual(emb.buscar_propiedades('jardin', top_k=1)[0]['id'], 1002)
+
+	@override_settings(EMBEDDINGS_AUTO_UPDATE=False)
+	def test_status_detects_changes_after_watermark(self):
+		prop = self.make_prop('Casa con piscina')
+		emb._publicar([prop.pk], FakeEncoder().encode(['piscina']), db_watermark=emb._marca_bd())
+		self.assertFalse(emb.estado_indice()['stale'])
+		Propiedad.objects.filter(pk=prop.pk).update(updated_at=prop.updated_at + timedelta(minutes=1))
+		status = emb.estado_indice()
+		self.assertEqual(status['pending'], 1)
+		self.assertTrue(status['stale'])
+
+	def test_legacy_files_become_first_version(self):
+		prop = self.make_prop('Casa con piscina')
+		embed_path, id_path = emb.LEGACY_PATHS
+		np.save(embed_path, FakeEncoder().encode(['piscina']))
+		joblib.dump([prop.pk], id_path)
+		self.assertEqual(emb.buscar_propiedades('piscina', top_k=1)[0]['id'], prop.pk)
+		info = manifest.read_manifest(manifest.version_dir(emb._index_dir(), emb._version))
+		self.assertEqual(info['source'], 'legacy')
+
+
+class StreamingBuildTests(EmbeddingsTmpMixin, TestCase):
+	def test_interrupted_build_resumes_from_checkpoint(self):
+		props = [self.make_prop(title) for title in ['Casa con piscina', 'Casa con jardin', 'Oficina', 'Local centro', 'Lote']]
+		encoder = FakeEncoder()
+		calls = []
+
+		def falla_en_el_tercero(texts):
+			calls.append(len(texts))
+			if len(calls) == 3:
+				raise RuntimeError('corte')
+			return encoder.encode(texts)
+
+		with mock.patch.object(emb, '_codificar_corpus', side_effect=falla_en_el_tercero):
+			with self.assertRaises(RuntimeError):
+				emb.load_or_generate_embeddings(force=True)
+		checkpoint = Checkpoint(emb._build_dir()).load()
+		self.assertEqual((checkpoint.rows, checkpoint.last_id), (4, props[3].pk))
+		self.assertIsNone(emb._version_activa())
+
+		calls.clear()
+		with mock.patch.object(emb, '_codificar_corpus', side_effect=lambda texts: calls.append(len(texts)) or encoder.encode(texts)):
+			ids, vecs = emb.load_or_generate_embeddings(force=True)
+		self.assertEqual(calls, [1])  # sólo el lote que faltaba
+		self.assertEqual(ids, [p.pk for p in props])
+		self.assertEqual(vecs.shape, (5, 4))
+		self.assertFalse(os.path.exists(emb._build_dir()))
+		self.assertEqual(emb.buscar_propiedades('jardin', top_k=1)[0]['id'], props[1].pk)
+
+	def test_no_resume_starts_over(self):
+		self.make_prop('Casa con piscina')
+		checkpoint = Checkpoint(emb._build_dir())
+		checkpoint.start(emb.EMBED_MODEL_NAME)
+		checkpoint.write_shard([999999], FakeEncoder().encode(['jardin']), [None], [''])
+		ids, _ = emb.load_or_generate_embeddings(force=True, resume=False)
+		self.assertNotIn(999999, ids)
+
+	def test_workers_never_exceed_batches(self):
+		with self.settings(EMBEDDINGS_BUILD_WORKERS=0), mock.patch.object(emb, 'default_workers', return_value=64):
+			self.assertEqual(emb._build_workers(), 64)
+			self.assertEqual(emb._build_workers(3), 3)
+			self.assertEqual(emb._build_workers(0), 1)
+		with self.settings(EMBEDDINGS_BUILD_WORKERS=4):
+			self.assertEqual(emb._build_workers(2), 2)
+
+	def test_rebuild_reencodes_only_changed_listings(self):
+		props = [self.make_prop(title) for title in ['Casa con piscina', 'Casa con jardin', 'Oficina centro']]
+		encoder = FakeEncoder()
+		encoded = []
+		contar = lambda texts: encoded.extend(texts) or encoder.encode(texts)
+		with mock.patch.object(emb, '_codificar_corpus', side_effect=contar):
+			emb.load_or_generate_embeddings(force=True)
+			self.assertEqual(len(encoded), 3)
+
+			encoded.clear()
+			Propiedad.objects.filter(pk=props[0].pk).update(title='Lote con jardin')
+			emb.load_or_generate_embeddings(force=True)
+			self.assertEqual(len(encoded), 1)
+			self.assertIn('Lote con jardin', encoded[0])
+
+			encoded.clear()
+			emb.load_or_generate_embeddings(force=True, reuse=False)
+			self.assertEqual(len(encoded), 3)
+		info = manifest.read_manifest(manifest.version_dir(emb._index_dir(), emb._version_activa()))
+		self.assertEqual(info['reused'], 0)
+		self.assertIn('property_embeddings.hashes.npy', info['files'])
+		self.assertEqual({r['id'] for r in emb.buscar_propiedades('jardin', top_k=2)}, {props[0].pk, props[1].pk})
+
+
+@unittest.skipIf(EncoderServer is None, 'requiere sockets Unix')
+class EncoderServiceTests(EmbeddingsTmpMixin, TestCase):
+	def start_service(self, max_wait=0.01):
+		self.batcher = MicroBatcher(FakeEncoder().encode, max_batch=64, max_wait=max_wait).start()
+		path = os.path.join(self.tmpdir, 'enc.sock')
+		server = EncoderServer(path, self.batcher, emb.EMBED_MODEL_NAME)
+		threading.Thread(target=server.serve_forever, daemon=True).start()
+		self.addCleanup(server.server_close)
+		self.addCleanup(server.shutdown)
+		return path
+
+	def test_search_uses_service_without_loading_model(self):
+		self.write_base([1001, 1002], [[1, 0, 0, 0], [0, 1, 0, 0]])
+		path = self.start_service()
+		with self.settings(EMBEDDINGS_ENCODER_SOCKET=path), \
+				mock.patch.object(emb, '_get_model', side_effect=AssertionError('no debe cargar el modelo')):
+			self.assertEqual(emb._calentar_codificador(), 'service')
+			self.assertEqual(emb.buscar_propiedades('casa con piscina', top_k=1)[0]['id'], 1001)
+		self.assertEqual(self.batcher.stats['texts'], 1)
+
+	def test_concurrent_requests_are_micro_batched(self):
+		client = EncoderClient(self.start_service(max_wait=0.2))
+		barrier = threading.Barrier(8)
+		results = []
+
+		def pedir():
+			barrier.wait()
+			results.append(client.encode(['jardin']))
+
+		threads = [threading.Thread(target=pedir) for _ in range(8)]
+		for t in threads:
+			t.start()
+		for t in threads:
+			t.join()
+		self.assertEqual([r.shape for r in results], [(1, 4)] * 8)
+		self.assertEqual(self.batcher.stats['requests'], 8)
+		self.assertLess(self.batcher.stats['batches'], 8)
+
+	def test_connection_burst_is_queued_not_refused(self):
+		path = self.start_service(max_wait=0.05)
+		barrier = threading.Barrier(32)
+		errors, results = [], []
+
+		def pedir():
+			client = EncoderClient(path)  # una conexión nueva por cliente, todas a la vez
+			barrier.wait()
+			try:
+				results.append(client.encode(['piscina']))
+			except OSError as e:
+				errors.append(e)
+			finally:
+				client.close()
+
+		threads = [threading.Thread(target=pedir) for _ in range(32)]
+		for t in threads:
+			t.start()
+		for t in threads:
+			t.join()
+		self.assertEqual(errors, [])
+		self.assertEqual(len(results), 32)
+
+	def test_single_timeout_does_not_disable_the_service(self):
+		self.write_base([1001, 1002], [[1, 0, 0, 0], [0, 1, 0, 0]])
+		with self.settings(EMBEDDINGS_ENCODER_SOCKET=self.start_service()):
+			client = emb._get_encoder_client()
+			with mock.patch.object(client, 'encode', side_effect=TimeoutError('lento')):
+				emb.buscar_propiedades('jardin', top_k=1)
+				self.assertEqual(emb._encoder_down_until, 0.0)  # esa consulta se resolvió en local
+				for texto in ('piscina', 'centro'):
+					emb.buscar_propiedades(texto, top_k=1)
+			self.assertGreater(emb._encoder_down_until, 0)
+
+	def test_falls_back_to_local_model_when_service_is_down(self):
+		self.write_base([1001, 1002], [[1, 0, 0, 0], [0, 1, 0, 0]])
+		with self.settings(EMBEDDINGS_ENCODER_SOCKET=os.path.join(self.tmpdir, 'no-existe.sock')):
+			self.assertEqual(emb.buscar_propiedades('jardin', top_k=1)[0]['id'], 1002)
+		self.assertGreater(emb._encoder_down_until, 0)
+
+
+class ResultCacheTests(EmbeddingsTmpMixin, TestCase):
+	def setUp(self):
+		super().setUp()
+		self.props = [self.make_prop(f'Casa con piscina {i}') for i in range(15)]
+		self.write_base([p.pk for p in self.props], FakeEncoder().encode([emb._texto_propiedad(p) for p in self.props]))
+
+	def buscar(self, **params):
+		with mock.patch('properties.views.emb_buscar', wraps=emb.buscar_propiedades) as motor:
+			# Con un orden explícito se cachea la lista completa de ids
+			response = self.client.get(reverse('buscar'), {'search': 'piscina', 'orden': 'precio_asc', **params})
+		return response, motor.call_count
+
+	def test_pages_are_sliced_from_one_cached_ranking(self):
+		first, calls = self.buscar()
+		self.assertEqual(calls, 1)
+		second, calls = self.buscar(page=2)
+		self.assertEqual(calls, 0)
+		_, calls = self.buscar(search='  PISCINA ')
+		self.assertEqual(calls, 0)  # misma consulta normalizada
+		ids = [p.pk for p in first.context['propiedades']] + [p.pk for p in second.context['propiedades']]
+		self.assertEqual(sorted(ids), sorted(p.pk for p in self.props))
+
+	def test_sorted_search_reorders_the_most_relevant_and_says_so(self):
+		response, _ = self.buscar()
+		self.assertIsNone(response.context['acotado'])
+		with self.settings(SEARCH_SORT_CANDIDATES=10):
+			response, _ = self.buscar(search='con piscina')
+		self.assertEqual(response.context['propiedades'].paginator.count, 10)
+		self.assertEqual(response.context['acotado'], 10)
+		self.assertContains(response, 'Sorting the 10 most relevant results')
+
+	def test_property_changes_invalidate_cached_results(self):
+		self.buscar()
+		with self.captureOnCommitCallbacks(execute=True):
+			self.props[0].delete()
+		response, calls = self.buscar()
+		self.assertEqual(calls, 1)
+		self.assertNotIn(self.props[0].pk, list(response.context['propiedades'].paginator.object_list))
+
+	def test_only_one_worker_recomputes_a_missing_key(self):
+		key = result_cache.make_key('piscina', {}, None)
+		caches['default'].add(f'{key}:lock', 1)  # otro worker está recalculando
+		threading.Timer(0.1, lambda: caches['default'].set(key, [1, 2, 3])).start()
+		compute = mock.Mock(return_value=([9], True))
+		self.assertEqual(result_cache.get_or_compute(key, compute), [1, 2, 3])
+		compute.assert_not_called()
+
+
+class CursorPaginationTests(EmbeddingsTmpMixin, TestCase):
+	def test_engine_pages_past_the_candidate_window(self):
+		ids = list(range(5000, 5250))
+		vecs = np.random.default_rng(0).normal(size=(250, 4)).astype(np.float32)
+		self.write_base(ids, vecs)
+		vistos, posicion = [], None
+		for _ in range(10):
+			hits, posicion = emb.buscar_propiedades_pagina('piscina', limit=40, cursor=posicion)
+			vistos += [h['id'] for h in hits]
+			if posicion is None:
+				break
+		self.assertIsNone(posicion)
+		self.assertEqual(len(vistos), 250)
+		self.assertEqual(sorted(vistos), ids)
+
+	def test_hybrid_pages_cover_the_ranking_once(self):
+		# Con BM25 + RRF el puntaje fusionado depende de la profundidad: el
+		# cursor no puede ser un (score, id) de la fusión
+		props = Propiedad.objects.bulk_create([
+			Propiedad(
+				title=f"Casa {'piscina' if i % 3 else 'jardin'} {'centro' * (i % 4)}", location='Medellín',
+				area_m2=50, area_privada_m2=45, rooms=2, bathrooms=1, parking_spaces=0, floor=1,
+				price_cop=100000000, property_type='Casa',
+			)
+			for i in range(600)
+		])
+		ids = [p.pk for p in props]
+		self.write_base(ids, np.random.default_rng(1).normal(size=(600, 4)).astype(np.float32))
+		vistos, posicion = [], None
+		for _ in range(40):
+			hits, posicion = emb.buscar_propiedades_pagina('piscina centro', limit=25, cursor=posicion)
+			vistos += [h['id'] for h in hits]
+			if posicion is None:
+				break
+		self.assertIsNone(posicion)
+		self.assertEqual(len(vistos), len(set(vistos)))
+		self.assertEqual(sorted(vistos), sorted(ids))
+		primera, _ = emb.buscar_propiedades_pagina('piscina centro', limit=25)
+		self.assertEqual([h['id'] for h in primera], [h['id'] for h in emb.buscar_propiedades('piscina centro', top_k=25)])
+
+	def test_view_follows_cursor_tokens(self):
+		props = [self.make_prop(f'Casa con piscina {i}') for i in range(30)]
+		self.write_base([p.pk for p in props], FakeEncoder().encode([emb._texto_propiedad(p) for p in props]))
+		vistos, params = [], {'search': 'piscina'}
+		while True:
+			response = self.client.get(reverse('buscar'), params)
+			self.assertTrue(response.context['cursor_mode'])
+			vistos += [p.pk for p in response.context['propiedades']]
+			token = response.context['next_cursor']
+			if not token:
+				break
+			params = {'search': 'piscina', 'cursor': token}
+		self.assertEqual(response.context['pagina'], 3)
+		self.assertEqual(sorted(vistos), sorted(p.pk for p in props))
+
+	def test_invalid_cursor_is_first_page(self):
+		self.assertEqual(cursor.decode('basura'), (None, 1))
+		self.assertEqual(cursor.decode(cursor.encode((0.5, 7), 2)), ((0.5, 7), 2))
+
+
+class SimilarPropertiesTests(EmbeddingsTmpMixin, TestCase):
+	def test_blocked_knn_matches_brute_force(self):
+		vecs = normalize_rows(np.random.default_rng(1).normal(size=(50, 8)))
+		ids = np.arange(100, 150)
+		table = KNNTable.build(ids, vecs, k=5, block=7)
+		sims = vecs @ vecs.T
+		np.fill_diagonal(sims, -np.inf)
+		for row in (0, 13, 49):
+			self.assertEqual(table.similar(ids[row]), [int(ids[j]) for j in np.argsort(-sims[row])[:5]])
+		self.assertEqual(table.similar(999), [])
+
+	def test_detail_page_shows_similares_without_model(self):
+		props = [self.make_prop(t) for t in ['Casa con piscina', 'Apto con piscina', 'Oficina centro', 'Casa con jardin']]
+		self.write_base([p.pk for p in props], FakeEncoder().encode([emb._texto_propiedad(p) for p in props]))
+		emb.construir_tabla_knn(k=2)
+		with mock.patch.object(emb, '_get_model', side_effect=AssertionError('no debe cargar el modelo')):
+			response = self.client.get(reverse('detalle_propiedad', args=[props[0].pk]))
+		self.assertEqual(response.context['similares'][0].pk, props[1].pk)
+		self.assertEqual(len(response.context['similares']), 2)
+		# Un build posterior conserva la tabla hasta el próximo --knn
+		self.write_base([p.pk for p in props], FakeEncoder().encode([emb._texto_propiedad(p) for p in props]))
+		self.assertEqual(emb.propiedades_similares(props[0].pk)[0], props[1].pk)
+
+
+class PersonalizationTests(EmbeddingsTmpMixin, TestCase):
+	def setUp(self):
+		super().setUp()
+		self.user = get_user_model().objects.create_user(username='ana', password='x')
+		titles = ['Casa con piscina y centro', 'Casa con piscina y jardin', 'Finca con jardin', 'Oficina centro', 'Lote con jardin']
+		self.props = [self.make_prop(t) for t in titles]
+		self.write_base([p.pk for p in self.props], FakeEncoder().encode([emb._texto_propiedad(p) for p in self.props]))
+		self.client.force_login(self.user)
+		self.sin_modelo = mock.patch.object(emb, '_get_model', side_effect=AssertionError('no debe cargar el modelo'))
+
+	def perfil(self):
+		return caches['default'].get(f'prefs:user:{self.user.pk}')
+
+	def test_incremental_profile_matches_rebuild(self):
+		with self.sin_modelo:
+			self.client.get(reverse('detalle_propiedad', args=[self.props[3].pk]))
+			self.client.post(reverse('toggle_favorite', args=[self.props[2].pk]))
+			self.client.get(reverse('detalle_propiedad', args=[self.props[4].pk]))
+			self.client.post(reverse('toggle_favorite', args=[self.props[4].pk]))
+			self.client.post(reverse('toggle_favorite', args=[self.props[4].pk]))  # quitar
+		incremental = self.perfil()
+		caches['default'].delete(f'prefs:user:{self.user.pk}')
+		request = mock.Mock(user=self.user, session=self.client.session)
+		self.assertTrue(np.allclose(incremental.vector(), preferences.preference_vector(request), atol=1e-5))
+		self.assertEqual(incremental.favs, 1)
+
+	@override_settings(EMBEDDINGS_HYBRID=False)
+	def test_preference_breaks_ties_in_search(self):
+		jardin = np.array([0, 1, 0, 0], dtype=np.float32)
+		centro = np.array([0, 0, 1, 0], dtype=np.float32)
+		self.assertEqual(emb.buscar_propiedades('piscina', top_k=1, preferencia=jardin)[0]['id'], self.props[1].pk)
+		self.assertEqual(emb.buscar_propiedades('piscina', top_k=1, preferencia=centro)[0]['id'], self.props[0].pk)
+
+	def test_home_recommends_from_favorites_without_model(self):
+		self.client.post(reverse('toggle_favorite', args=[self.props[2].pk]))
+		with self.sin_modelo:
+			response = self.client.get(reverse('home'))
+		recomendadas = [p.pk for p in response.context['recommended_props']]
+		self.assertNotIn(self.props[2].pk, recomendadas)  # ya es favorita
+		self.assertEqual(set(recomendadas[:2]), {self.props[1].pk, self.props[4].pk})
+
+	def test_anonymous_without_session_skips_the_profile(self):
+		self.client.logout()
+		with mock.patch.object(preferences, '_rebuild') as rebuild, mock.patch.object(emb, 'vectores_propiedades') as vectores:
+			self.client.get(reverse('home'))
+			self.client.get(reverse('buscar'), {'search': 'piscina'})
+		rebuild.assert_not_called()
+		vectores.assert_not_called()
+
+
+class SearchMetricsTests(EmbeddingsTmpMixin, TestCase):
+	def setUp(self):
+		super().setUp()
+		metrics.reset()
+		props = [self.make_prop(t) for t in ['Casa con piscina', 'Oficina centro', 'Casa con jardin']]
+		self.write_base([p.pk for p in props], FakeEncoder().encode([emb._texto_propiedad(p) for p in props]))
+
+	def test_histogram_buckets_are_cumulative(self):
+		hist = metrics.Histogram(buckets=(0.01, 0.1))
+		for value in (0.005, 0.05, 0.05, 3.0):
+			hist.observe(value)
+		self.assertEqual(hist.cumulative(), [(0.01, 1), (0.1, 3), (float('inf'), 4)])
+
+	def test_search_emits_server_timing_per_stage(self):
+		response = self.client.get(reverse('buscar'), {'search': 'piscina'})
+		stages = [part.split(';')[0] for part in response['Server-Timing'].split(', ')]
+		for stage in ('encode', 'score', 'topk', 'filter_sql', 'render', 'total'):
+			self.assertIn(stage, stages)
+		self.assertNotIn('prefetch', stages)  # las tarjetas usan la portada desnormalizada
+		response = self.client.get(reverse('buscar'), {'search': 'piscina', 'orden': 'precio_asc'})
+		self.assertIn('paginate;dur=', response['Server-Timing'])
+
+	def test_metrics_endpoint_exposes_histograms_caches_and_index(self):
+		self.client.get(reverse('buscar'), {'search': 'piscina', 'orden': 'precio_asc'})
+		self.client.get(reverse('buscar'), {'search': 'piscina', 'orden': 'precio_asc'})
+		body = self.client.get(reverse('search_metrics')).content.decode()
+		self.assertIn('inmofinder_search_stage_seconds_count{stage="encode"} 1', body)
+		self.assertIn('inmofinder_search_stage_seconds_bucket{stage="total",le="+Inf"} 2', body)
+		self.assertIn('inmofinder_search_cache_hits_total{cache="results"}', body)
+		self.assertIn('inmofinder_search_index_rows 3', body)
+		with self.settings(SEARCH_METRICS_TOKEN='s3'):
+			self.assertEqual(self.client.get(reverse('search_metrics')).status_code, 403)
+			response = self.client.get(reverse('search_metrics'), HTTP_AUTHORIZATION='Bearer s3')
+			self.assertEqual(response.status_code, 200)
+
+
+class SuggestTests(EmbeddingsTmpMixin, TestCase):
+	def setUp(self):
+		super().setUp()
+		patcher = mock.patch.multiple(suggest, _index=None, _token=None, _building=False, _pending=Counter(), _pending_since=None)
+		patcher.start()
+		self.addCleanup(patcher.stop)
+		self.make_prop('Casa con piscina', location='Belén, Medellín', property_type='Casa')
+		self.make_prop('Apartamento amplio', location='El Poblado, Medellín')
+		self.make_prop('Apartamento moderno', location='El Poblado, Medellín')
+
+	def textos(self, q):
+		return [s['text'] for s in suggest.suggest(q)]
+
+	def test_prefix_matches_are_accent_insensitive_and_ranked(self):
+		self.assertEqual(self.textos('bel'), ['Belén'])
+		self.assertEqual(self.textos('BELÉ')[0], 'Belén')
+		self.assertIn('El Poblado', self.textos('pobl'))  # desde cualquier palabra
+		self.assertEqual(self.textos('apartamento')[0], 'Apartamento')  # tipo antes que títulos
+		self.assertEqual(self.textos('med'), ['Medellín'])
+		self.assertEqual(self.textos('xyz'), [])
+
+	def test_endpoint_does_not_hit_the_database(self):
+		self.client.get(reverse('search_suggest'), {'q': 'a'})  # construye el índice
+		with self.assertNumQueries(0):
+			response = self.client.get(reverse('search_suggest'), {'q': 'casa con', 'limit': 3})
+		self.assertEqual(response.json()['suggestions'][0], {'text': 'Casa con piscina', 'kind': 'titulo'})
+
+	def test_popular_queries_are_logged_and_suggested(self):
+		for ip in ('10.0.0.1', '10.0.0.2', '10.0.0.3'):
+			self.client.get(reverse('buscar'), {'search': 'Casa con jardín'}, REMOTE_ADDR=ip)
+		self.assertFalse(ConsultaBusqueda.objects.exists())  # acumulado en memoria, sin escribir
+		suggest.build()
+		self.assertEqual(ConsultaBusqueda.objects.get(texto='casa con jardin').veces, 3)
+		self.assertIn('casa con jardin', self.textos('casa con j'))
+
+	def test_repeating_a_query_does_not_promote_it(self):
+		for _ in range(10):
+			self.client.get(reverse('buscar'), {'search': 'oferta spam'}, REMOTE_ADDR='10.0.0.9')
+		self.client.get(reverse('buscar'), {'search': 'oferta spam'}, REMOTE_ADDR='10.0.0.8')
+		suggest.build()
+		self.assertEqual(ConsultaBusqueda.objects.get(texto='oferta spam').veces, 2)
+		self.assertEqual(self.textos('oferta'), [])
+
+	def test_counts_are_written_in_batches(self):
+		request = mock.Mock(user=None, META={'REMOTE_ADDR': '10.0.0.1'})
+		with self.assertNumQueries(0):
+			for n in range(suggest.LOG_BATCH - 1):
+				suggest.log_query(f'consulta {n}', request)
+		with self.assertNumQueries(2):
+			suggest.log_query('consulta final', request)
+		self.assertEqual(ConsultaBusqueda.objects.count(), suggest.LOG_BATCH)
+
+
+class QueryParserTests(EmbeddingsTmpMixin, TestCase):
+	def test_extracts_form_filters_and_keeps_residual_text(self):
+		parsed = query_parser.parse('apartamento 2 habitaciones menos de 500 millones en Laureles con parqueadero')
+		self.assertEqual(parsed.text, '')
+		self.assertEqual(parsed.filters, {
+			'tipo': 'Apartamento', 'rooms': '2', 'precio_max': '500000000', 'garaje': '1', 'barrio': 'laureles',
+		})
+
+	def test_prices_areas_and_words(self):
+		cases = {
+			'Casa de tres alcobas y 2 baños entre 300 y 450 millones': {
+				'tipo': 'Casa', 'rooms': '3', 'bathrooms': '2', 'precio_min': '300000000', 'precio_max': '450000000',
+			},
+			'oficina desde $1.200.000.000 hasta 2,5 mil millones': {
+				'tipo': 'Oficina', 'precio_min': '1200000000', 'precio_max': '2500000000',
+			},
+			'800M 2 parqueaderos estrato 4': {'precio_max': '800000000', 'parking_spaces': '2', 'garaje': '1', 'estrato': '4'},
+			'entre 60 y 90 m2 que acepten mascotas': {'area_min': '60', 'area_max': '90', 'mascotas': '1'},
+			'80 m2': {'area_min': '72', 'area_max': '88'},
+			'casa de 1.500 millones': {'tipo': 'Casa', 'precio_max': '1500000000'},
+			'lote de 2 mil m2': {'tipo': 'Lote', 'area_min': '1800', 'area_max': '2200'},
+			'más de 3 mil metros': {'area_min': '3000'},
+		}
+		for text, expected in cases.items():
+			with self.subTest(text=text):
+				parsed = query_parser.parse(text)
+				self.assertEqual(parsed.filters, expected)
+				self.assertEqual(parsed.text, '')
+
+	def test_negations_do_not_set_filters(self):
+		for text in ['sin mascotas', 'no se aceptan mascotas', 'que no permitan perros', 'sin parqueadero', 'no tiene garaje']:
+			with self.subTest(text=text):
+				parsed = query_parser.parse(f'casa {text} con piscina')
+				self.assertEqual(parsed.filters, {'tipo': 'Casa'})
+				self.assertEqual(parsed.text, 'piscina')
+
+	def test_counts_with_comparators_stay_in_the_text(self):
+		for text in [
+			'al menos 2 habitaciones', 'más de 2 habitaciones', 'mínimo 3 habitaciones', 'hasta 3 alcobas',
+			'mínimo 2 baños', 'entre 2 y 3 habitaciones', '3 habitaciones o más', 'al menos 2 parqueaderos',
+			'mínimo estrato 4',
+		]:
+			with self.subTest(text=text):
+				parsed = query_parser.parse(f'casa {text}')
+				self.assertEqual(parsed.filters, {'tipo': 'Casa'})
+				self.assertEqual(parsed.text, text)
+		parsed = query_parser.parse('casa de 2 a 3 habitaciones')
+		self.assertEqual(parsed.filters, {'tipo': 'Casa'})
+		self.assertEqual(parsed.text, '2 a 3 habitaciones')
+		self.assertEqual(query_parser.parse('3 habitaciones y 2 baños').filters, {'rooms': '3', 'bathrooms': '2'})
+
+	def test_plain_text_is_untouched(self):
+		parsed = query_parser.parse('Vista a la montaña, cerca al metro')
+		self.assertEqual(parsed.filters, {})
+		self.assertEqual(parsed.text, 'Vista a la montaña cerca al metro')
+
+	def test_view_filters_and_embeds_only_the_residual(self):
+		casa = self.make_prop('Casa con piscina', property_type='Casa', rooms=3)
+		otras = [
+			self.make_prop('Casa con piscina pequeña', property_type='Casa', rooms=2),
+			self.make_prop('Apartamento con piscina', rooms=3),
+		]
+		props = [casa] + otras
+		self.write_base([p.pk for p in props], FakeEncoder().encode([emb._texto_propiedad(p) for p in props]))
+		with mock.patch('properties.views.emb_buscar', wraps=emb.buscar_propiedades) as motor, \
+				mock.patch('properties.views.emb_pagina', None):
+			response = self.client.get(reverse('buscar'), {'search': 'casa de 3 habitaciones con piscina'})
+		self.assertEqual([p.pk for p in response.context['propiedades']], [casa.pk])
+		self.assertEqual(motor.call_args.args[0], 'piscina')
+		self.assertEqual(dict(response.context['filtros_detectados']), {'Type': 'Casa', 'Rooms': '3'})
+		self.assertEqual(response.context['search_query'], 'casa de 3 habitaciones con piscina')
+
+	def test_form_filters_take_precedence(self):
+		self.make_prop('Casa', property_type='Casa', rooms=2)
+		response = self.client.get(reverse('buscar'), {'search': 'casa 3 habitaciones', 'rooms': '2'})
+		self.assertEqual(len(response.context['propiedades']), 1)
+		self.assertEqual(dict(response.context['filtros_detectados']), {'Type': 'Casa'})
+
+
+class GazetteerTests(EmbeddingsTmpMixin, TestCase):
+	def test_resolves_free_text_locations(self):
+		cases = {
+			'El Poblado, Medellín': ('el-poblado', 'medellin'),
+			'Poblado - Medellin': ('el-poblado', 'medellin'),
+			'Medellín, Colombia': (None, 'medellin'),
+			'Itagui, Antioquia': (None, 'itagui'),
+			'Lauréles': ('laureles', 'medellin'),
+			'Laurels, Medellín': ('laureles', 'medellin'),  # error de tipeo
+			'Sabaneta (La Doctora)': ('la-doctora', 'sabaneta'),
+			'Test Location': (None, None),
+		}
+		for location, expected in cases.items():
+			with self.subTest(location=location):
+				barrio, municipio = gazetteer.resolve_location(location)
+				self.assertEqual((barrio and barrio.slug, municipio and municipio.slug), expected)
+
+	def test_common_words_need_a_preposition(self):
+		self.assertIsNone(gazetteer.find_in_text('apartamento bello con vista'))
+		self.assertEqual(gazetteer.find_in_text('apartamento en bello')[0].slug, 'bello')
+		self.assertEqual(query_parser.parse('casa con piscina en el Poblado').filters['barrio'], 'el-poblado')
+
+	def test_properties_get_normalized_location_on_save(self):
+		prop = self.make_prop('Casa', location='Laureles, Medellín')
+		self.assertEqual((prop.barrio.slug, prop.municipio.slug), ('laureles', 'medellin'))
+		prop.location = 'Envigado'
+		prop.save(update_fields=['location'])
+		prop.refresh_from_db()
+		self.assertEqual((prop.barrio, prop.municipio.slug), (None, 'envigado'))
+
+	def test_location_is_resolved_only_when_it_changes(self):
+		prop = Propiedad.objects.get(pk=self.make_prop('Casa', location='Laureles, Medellín').pk)
+		prop.title = 'Casa amplia'
+		with mock.patch.object(Propiedad, 'asignar_ubicacion') as asignar:
+			prop.save()
+		asignar.assert_not_called()
+		prop.location = 'Envigado'
+		prop.save()
+		prop.refresh_from_db()
+		self.assertEqual((prop.title, prop.barrio, prop.municipio.slug), ('Casa amplia', None, 'envigado'))
+
+	def test_barrio_filter_in_form_text_and_engine(self):
+		laureles = [self.make_prop(f'Casa con piscina {i}', location='Laureles, Medellín') for i in range(2)]
+		otra = self.make_prop('Casa con piscina', location='Belén, Medellín')
+		props = laureles + [otra]
+		self.write_base([p.pk for p in props], FakeEncoder().encode([emb._texto_propiedad(p) for p in props]))
+		esperados = sorted(p.pk for p in laureles)
+
+		response = self.client.get(reverse('buscar'), {'barrio': 'laureles'})
+		self.assertEqual(sorted(p.pk for p in response.context['propiedades']), esperados)
+		with mock.patch('properties.views.emb_buscar', wraps=emb.buscar_propiedades) as motor, \
+				mock.patch('properties.views.emb_pagina', None):
+			response = self.client.get(reverse('buscar'), {'search': 'piscina en Laureles'})
+		self.assertEqual(motor.call_args.args[0], 'piscina')
+		self.assertEqual(sorted(p.pk for p in response.context['propiedades']), esperados)
+		self.assertEqual(dict(response.context['filtros_detectados'])['Barrio'], 'Laureles')
+		self.assertEqual(
+			sorted(r['id'] for r in emb.buscar_propiedades('piscina', top_k=10, filters={'barrio': laureles[0].barrio_id})),
+			esperados,
+		)
+
+	def test_listing_count_per_barrio(self):
+		for _ in range(2):
+			self.make_prop('Casa', location='Laureles, Medellín')
+		self.make_prop('Casa', location='Belén, Medellín')
+		conteo = {b['slug']: b['total'] for b in views.conteo_barrios()}
+		self.assertEqual(conteo, {'laureles': 2, 'belen': 1})
+		self.assertEqual(Barrio.objects.get(slug='belen').municipio.nombre, 'Medellín')
+
+
+class RankedHydrationTests(EmbeddingsTmpMixin, TestCase):
+	def setUp(self):
+		super().setUp()
+		self.props = [self.make_prop(f'Casa con piscina {i}', rooms=2 + i % 2) for i in range(4)]
+
+	def test_keeps_rank_order_and_filters(self):
+		ids = [p.pk for p in reversed(self.props)] + [999999]
+		self.assertEqual([p.pk for p in hydrate.hydrate(ids)], ids[:-1])
+		pares = Propiedad.objects.filter(rooms=2)
+		self.assertEqual(hydrate.filter_ranked(ids, pares), [p.pk for p in reversed(self.props) if p.rooms == 2])
+		self.assertEqual(hydrate.hydrate([]), [])
+
+	def test_search_and_lists_do_not_order_by_case(self):
+		self.write_base([p.pk for p in self.props], FakeEncoder().encode([emb._texto_propiedad(p) for p in self.props]))
+		user = get_user_model().objects.create_user(username='fan', password='pass')
+		self.client.force_login(user)
+		for prop in self.props[:2]:
+			self.client.post(reverse('toggle_favorite', args=[prop.pk]))
+		self.client.get(reverse('detalle_propiedad', args=[self.props[3].pk]))
+		with mock.patch('properties.views.emb_buscar', emb.buscar_propiedades), \
+				mock.patch('properties.views.emb_pagina', None), \
+				CaptureQueriesContext(connection) as queries:
+			response = self.client.get(reverse('buscar'), {'search': 'piscina'})
+			home = self.client.get(reverse('home'))
+			favoritos = self.client.get(reverse('favorites'))
+		self.assertFalse([q['sql'] for q in queries if 'CASE WHEN' in q['sql'].upper()])
+		self.assertEqual(len(response.context['propiedades']), 4)
+		self.assertEqual([p.pk for p in home.context['recent_props']], [self.props[3].pk])
+		# Favoritos: el más reciente primero
+		self.assertEqual([p.pk for p in favoritos.context['propiedades']], [self.props[1].pk, self.props[0].pk])
+
+
+class KeysetPaginationTests(EmbeddingsTmpMixin, TestCase):
+	def setUp(self):
+		super().setUp()
+		# Precios y áreas repetidos (el id desempata) y una fecha NULL
+		self.props = [
+			self.make_prop(f'Casa {i}', price_cop=100000000 * (1 + i % 3), area_m2=40 + 10 * (i % 2))
+			for i in range(11)
+		]
+		Propiedad.objects.filter(pk=self.props[4].pk).update(created_at=None)
+
+	def walk(self, order, per_page=3):
+		pages, token = [], None
+		while True:
+			page = keyset.paginate(Propiedad.objects.all(), order, per_page, token)
+			pages.append(page)
+			if not page.has_next():
+				return pages
+			token = page.next_cursor
+
+	def expected(self, order):
+		field, descending = order.lstrip('-'), order.startswith('-')
+		rows = [(getattr(p, field), p.pk) for p in Propiedad.objects.all()]
+		con_valor = sorted((r for r in rows if r[0] is not None), reverse=descending)
+		nulos = sorted((r for r in rows if r[0] is None), reverse=descending)
+		return [pk for _, pk in con_valor + nulos]  # NULL al final en los dos sentidos
+
+	def test_every_order_visits_each_row_once(self):
+		for order in ['price_cop', '-price_cop', 'area_m2', '-area_m2', '-created_at', '-id']:
+			pages = self.walk(order)
+			self.assertEqual([p.pk for page in pages for p in page], self.expected(order), order)
+			self.assertEqual([page.number for page in pages], [1, 2, 3, 4])
+
+	def test_previous_cursor_returns_the_previous_page(self):
+		pages = self.walk('price_cop')
+		for i in range(2, len(pages)):
+			prev = keyset.paginate(Propiedad.objects.all(), 'price_cop', 3, pages[i].prev_cursor)
+			self.assertEqual([p.pk for p in prev], [p.pk for p in pages[i - 1]])
+			self.assertEqual(prev.number, i)
+		self.assertEqual(pages[1].prev_cursor, '')  # la anterior a la 2 es la URL sin cursor
+		self.assertFalse(pages[0].has_previous())
+
+	@mock.patch('properties.views.RESULTADOS_POR_PAGINA', 6)
+	def test_listing_pages_without_count_or_offset(self):
+		first = self.client.get(reverse('buscar'), {'orden': 'precio_desc'})
+		page = first.context['listado']
+		self.assertEqual(page.total, 11)
+		with CaptureQueriesContext(connection) as queries:
+			second = self.client.get(reverse('buscar'), {'orden': 'precio_desc', 'cursor': page.next_cursor})
+		sql = ' '.join(q['sql'].upper() for q in queries)
+		self.assertNotIn('COUNT(', sql)  # el total sale de la cache
+		self.assertNotIn('OFFSET', sql)
+		ids = [p.pk for p in first.context['propiedades']] + [p.pk for p in second.context['propiedades']]
+		self.assertEqual(len(set(ids)), 11)
+		self.assertContains(second, 'About 11 results')
+		with self.settings(SEARCH_APPROX_COUNTS=False):
+			self.assertIsNone(self.client.get(reverse('buscar')).context['listado'].total)
+
+	def test_owner_dashboard_is_paginated(self):
+		owner = get_user_model().objects.create_user(username='dueno', password='pass', is_propietario=True)
+		Propiedad.objects.update(owner=owner)
+		self.client.force_login(owner)
+		with mock.patch.object(views.OwnerDashboardView, 'paginate_by', 5):
+			first = self.client.get(reverse('dashboard'))
+			second = self.client.get(reverse('dashboard'), {'cursor': first.context['page_obj'].next_cursor})
+			last = self.client.get(reverse('dashboard'), {'cursor': second.context['page_obj'].next_cursor})
+		self.assertEqual([p.pk for p in first.context['propiedades']], [p.pk for p in reversed(self.props)][:5])
+		self.assertEqual([p.pk for p in last.context['propiedades']], [self.props[0].pk])
+		self.assertFalse(last.context['page_obj'].has_next())
+		self.assertContains(second, 'cursor=')
+
+
+class PortadaTests(EmbeddingsTmpMixin, TestCase):
+	def setUp(self):
+		super().setUp()
+		self.prop = self.make_prop('Casa con piscina')
+
+	def add_media(self, url):
+		return MediaPropiedad.objects.create(propiedad=self.prop, url=url)
+
+	def test_signals_keep_the_cover_in_sync(self):
+		video = self.add_media('https://example.com/tour.mp4')
+		self.prop.refresh_from_db()
+		self.assertEqual(self.prop.portada, video.url)  # sin imágenes, el video
+		foto = self.add_media('https://example.com/sala.jpg')
+		self.add_media('https://example.com/cocina.jpg')
+		self.prop.refresh_from_db()
+		self.assertEqual((self.prop.portada_media_id, self.prop.portada), (foto.pk, foto.url))
+		foto.delete()
+		self.prop.refresh_from_db()
+		self.assertEqual(self.prop.portada, 'https://example.com/cocina.jpg')
+		self.prop.title = 'Casa con piscina y jardín'  # instancia cargada antes del borrado
+		MediaPropiedad.objects.filter(propiedad=self.prop).exclude(pk=video.pk).delete()
+		self.prop.save()
+		self.prop.refresh_from_db()
+		self.assertEqual((self.prop.title, self.prop.portada), ('Casa con piscina y jardín', video.url))
+		video.delete()
+		self.prop.refresh_from_db()
+		self.assertIsNone(self.prop.portada)
+		self.assertIsNone(self.prop.portada_media_id)
+
+	def test_backfill_command(self):
+		from django.core.management import call_command
+		foto = self.add_media('https://example.com/sala.jpg')
+		otra = self.make_prop('Oficina centro')
+		Propiedad.objects.update(portada_media=None, portada_url='')
+		Propiedad.objects.filter(pk=otra.pk).update(portada_url='https://example.com/vieja.jpg')
+		out = io.StringIO()
+		call_command('portadas', batch_size=1, stdout=out)
+		self.assertIn('2 propiedades revisadas, 2 portadas actualizadas', out.getvalue())
+		self.prop.refresh_from_db()
+		otra.refresh_from_db()
+		self.assertEqual((self.prop.portada_media_id, self.prop.portada), (foto.pk, foto.url))
+		self.assertIsNone(otra.portada)
+
+	def test_card_lists_do_not_read_media(self):
+		self.add_media('https://example.com/sala.jpg')
+		self.write_base([self.prop.pk], FakeEncoder().encode([emb._texto_propiedad(self.prop)]))
+		with CaptureQueriesContext(connection) as queries:
+			home = self.client.get(reverse('home'))
+			buscar = self.client.get(reverse('buscar'), {'search': 'piscina'})
+		self.assertFalse([q['sql'] for q in queries if 'properties_mediapropiedad' in q['sql']])
+		self.assertContains(home, 'https://example.com/sala.jpg')
+		self.assertContains(buscar, 'https://example.com/sala.jpg')
@@ -19,4 +19,7 @@ urlpatterns = [
     path("contact-form/<int:propiedad_id>/", views.contact_form, name="contact_form"),
     path("role-redirect/", views.role_redirect, name="role_redirect"),
     path('toggle_favorite/<int:propiedad_id>/', views.toggle_favorite, name='toggle_favorite'),
+    path("ready/", views.search_ready, name="search_ready"),
+    path("metrics/", views.search_metrics, name="search_metrics"),
+    path("suggest/", views.search_suggest, name="search_suggest"),
 ]
\ No newline at end of file
@@ -1,6 +1,6 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.core.paginator import Paginator
-from django.db.models import Q, Prefetch, Case, When, IntegerField
+from django.db.models import Count, Q
 from django.db import transaction
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
@@ -11,18 +11,59 @@ from django.urls import reverse_lazy, reverse
 import logging
 from django.views.generic import ListView, CreateView, UpdateView, DeleteView
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
 from django.core.exceptions import ValidationError
 
-from InmoFinder import settings
+from django.conf import settings
 from .forms import ContactForm, PropiedadForm
-from .models import Favorite, Propiedad, MediaPropiedad
+from .models import Barrio, Favorite, Municipio, Propiedad, MediaPropiedad
+from .search import cursor, gazetteer, hydrate, keyset, metrics, preferences, query_parser, result_cache, suggest, warmup
+from .search.attributes import clean_filters
 
 # Intentar importar búsqueda por embeddings
 try:
     from properties.management.commands.embeddings import buscar_propiedades as emb_buscar
+    from properties.management.commands.embeddings import buscar_lexico as emb_lexico
+    from properties.management.commands.embeddings import buscar_propiedades_pagina as emb_pagina
+    from properties.management.commands.embeddings import propiedades_similares as emb_similares
+    from properties.management.commands.embeddings import _version_activa as emb_version
+    from properties.management.commands.embeddings import metricas_indice as emb_metricas
 except Exception:
     emb_buscar = None  # fallback si no está disponible
+    emb_lexico = None
+    emb_pagina = None
+    emb_similares = None
+    emb_version = None
+    emb_metricas = None
+
+
+# Ordenamientos explícitos del buscador (sin ``orden`` se ordena por relevancia)
+ORDENES = {
+    "precio_asc": "price_cop",
+    "precio_desc": "-price_cop",
+    "area_asc": "area_m2",
+    "area_desc": "-area_m2",
+    "recientes": "-created_at",
+}
+# Etiquetas de los filtros detectados en el texto de la búsqueda
+FILTROS_DETECTADOS = {
+    "precio_min": "Min price",
+    "precio_max": "Max price",
+    "rooms": "Rooms",
+    "bathrooms": "Bathrooms",
+    "parking_spaces": "Parking spaces",
+    "area_min": "Min area (m²)",
+    "area_max": "Max area (m²)",
+    "tipo": "Type",
+    "garaje": "Parking",
+    "mascotas": "Pets allowed",
+    "estrato": "Estrato",
+    "barrio": "Barrio",
+    "municipio": "Municipio",
+}
+RESULTADOS_POR_PAGINA = 12
+CANDIDATOS_ORDEN = 500  # búsqueda con texto y orden explícito: se ordenan los N más relevantes
+RECOMENDADAS = 8
 
 
 # =========================
@@ -41,24 +82,11 @@ ALLOWED_CONTENT_PREFIXES = ("image/", "video/")
 # =========================
 def home(request):
     """
-    Renderiza las últimas propiedades y añade una 'portada' (primer media disponible).
-    También expone favoritos del usuario y propiedades vistas recientemente.
+    Renderiza las últimas propiedades (con su ``portada`` desnormalizada, sin media).
+    También expone favoritos del usuario, propiedades vistas recientemente y
+    recomendaciones según su perfil de preferencias (ver ``search/preferences.py``).
     """
     qs = Propiedad.objects.all().order_by('-created_at')[:12]
-    media_prefetch = Prefetch('media', queryset=MediaPropiedad.objects.all())
-    qs = qs.prefetch_related(media_prefetch)
-
-    # Agregar atributo portada a cada propiedad (primer archivo o url disponible)
-    for propiedad in qs:
-        portada = None
-        for media in propiedad.media.all():  # type: ignore
-            if getattr(media, "archivo", None):
-                portada = media.archivo.url
-                break
-            elif getattr(media, "url", None):
-                portada = media.url
-                break
-        propiedad.portada = portada  # type: ignore
 
     # IDs de favoritos
     favorite_ids = []
@@ -71,31 +99,20 @@ def home(request):
     recent_ids = request.session.get('recently_viewed', [])
     recent_props = []
     if recent_ids:
-        top_ids = list(recent_ids)[:4]
-        when_list = [When(id=pk, then=pos) for pos, pk in enumerate(top_ids)]
-        recent_qs = (
-            Propiedad.objects.filter(id__in=top_ids)
-            .prefetch_related(media_prefetch)
-            .order_by(Case(*when_list, output_field=IntegerField()))
-        )
-        tmp = []
-        for propiedad in recent_qs:
-            portada = None
-            for media in propiedad.media.all():  # type: ignore
-                if getattr(media, "archivo", None):
-                    portada = media.archivo.url
-                    break
-                elif getattr(media, "url", None):
-                    portada = media.url
-                    break
-            propiedad.portada = portada  # type: ignore
-            tmp.append(propiedad)
-        recent_props = tmp
+        recent_props = hydrate.hydrate(list(recent_ids)[:4])
+
+    # Recomendadas: vecinos del vector de preferencias, sin lo ya visto
+    recommended_props = []
+    rec_ids = preferences.recommended_ids(request, RECOMENDADAS, exclude=favorite_ids)
+    if rec_ids:
+        recommended_props = hydrate.hydrate(rec_ids)
 
     return render(request, "properties/home.html", {
         "propiedades": qs,
         "favorite_ids": favorite_ids,
         "recent_props": recent_props,
+        "recommended_props": recommended_props,
+        "barrios": conteo_barrios(),
     })
 
 
@@ -152,10 +169,34 @@ class AdminRequiredMixin(UserPassesTestMixin):
         return user.groups.filter(name="Administradores").exists()
 
 
+def _conteos_aproximados():
+    return getattr(settings, "SEARCH_APPROX_COUNTS", True)
+
+
+class KeysetPaginationMixin:
+    """ListView paginada por keyset (ver ``search/keyset.py``): sin COUNT(*) por página ni OFFSET."""
+    paginate_by = 20
+    keyset_order = "-id"
+
+    def paginate_queryset(self, queryset, page_size):
+        page = keyset.paginate(
+            queryset, self.keyset_order, page_size, token=self.request.GET.get("cursor"),
+            with_total=_conteos_aproximados(),
+        )
+        return None, page, page.object_list, page.has_other_pages()
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        params = self.request.GET.copy()
+        params.pop("cursor", None)
+        context["querystring"] = params.urlencode()
+        return context
+
+
 # =========================
 #  Dashboards
 # =========================
-class OwnerDashboardView(LoginRequiredMixin, PropietarioRequiredMixin, ListView):
+class OwnerDashboardView(LoginRequiredMixin, PropietarioRequiredMixin, KeysetPaginationMixin, ListView):
     model = Propiedad
     template_name = "properties/owner_dashboard.html"
     context_object_name = "propiedades"
@@ -166,7 +207,7 @@ class OwnerDashboardView(LoginRequiredMixin, PropietarioRequiredMixin, ListView)
         return qs.filter(owner=self.request.user).order_by("-id")
 
 
-class AdminDashboardView(LoginRequiredMixin, AdminRequiredMixin, ListView):
+class AdminDashboardView(LoginRequiredMixin, AdminRequiredMixin, KeysetPaginationMixin, ListView):
     model = Propiedad
     template_name = "properties/admin_dashboard.html"
     context_object_name = "propiedades"
@@ -374,6 +415,7 @@ def detalle_propiedad(request, propiedad_id):
         request.session.modified = True
     except Exception:
         pass
+    preferences.record_view(request, propiedad.id)
     # ¿Es favorito del usuario actual?
     is_favorite = False
     if request.user.is_authenticated:
@@ -382,9 +424,21 @@ def detalle_propiedad(request, propiedad_id):
         except Exception:
             is_favorite = False
 
+    # Similares: una fila de la tabla kNN precalculada y una consulta por id
+    similares = []
+    if emb_similares is not None:
+        try:
+            ids = emb_similares(propiedad.id)
+        except Exception as e:
+            logging.warning("No se pudieron obtener similares de %s: %s", propiedad.id, e)
+            ids = []
+        if ids:
+            similares = hydrate.hydrate(ids)
+
     return render(request, "properties/detalle_propiedad.html", {
         "propiedad": propiedad,
         "is_favorite": is_favorite,
+        "similares": similares,
     })
 
 
@@ -559,116 +613,282 @@ def contact_owner(request, propiedad_id):
 # =========================
 #  Búsqueda de propiedades
 # =========================
-def buscar_propiedades(request):
-    """
-    Búsqueda de propiedades con:
-      - Texto libre (embeddings si está disponible; fallback a icontains).
-      - Filtros numéricos/categóricos.
-      - Ordenamiento estándar o preservando ranking de similitud.
-      - Prefetch de media y paginación.
-    
-    Optimizado para usar cache de embeddings en memoria.
-    """
-    propiedades = Propiedad.objects.all()
-
-    # Texto libre
-    search = request.GET.get("search")
-    ids_ranked = []
-    used_embeddings = False
-    if search:
-        if emb_buscar is not None:
-            try:
-                # Reducido a top_k=100 para mejor rendimiento
-                # Los embeddings ya están en cache, evitando I/O de disco
-                results = emb_buscar(search, top_k=100)
-                ids_ranked = [r.get("id") for r in results if r.get("id")]
-                if ids_ranked:
-                    propiedades = propiedades.filter(id__in=ids_ranked)
-                    used_embeddings = True
-            except Exception:
-                # Fallback a búsqueda SQL tradicional
-                propiedades = propiedades.filter(
-                    Q(title__icontains=search) |
-                    Q(description__icontains=search) |
-                    Q(location__icontains=search)
-                )
-        else:
-            propiedades = propiedades.filter(
-                Q(title__icontains=search) |
-                Q(description__icontains=search) |
-                Q(location__icontains=search)
-            )
-
-    # Filtros
-    precio_min = request.GET.get("precio_min")
-    precio_max = request.GET.get("precio_max")
+def _filtrar(propiedades, params):
+    """Aplica en SQL los filtros del buscador (fuente de verdad si el índice está desactualizado)."""
+    precio_min = params.get("precio_min")
+    precio_max = params.get("precio_max")
     if precio_min:
         propiedades = propiedades.filter(price_cop__gte=precio_min)
     if precio_max:
         propiedades = propiedades.filter(price_cop__lte=precio_max)
 
-    habitaciones = request.GET.get("rooms")
+    habitaciones = params.get("rooms")
     if habitaciones:
         propiedades = propiedades.filter(rooms=habitaciones)
 
-    banos = request.GET.get("bathrooms")
+    banos = params.get("bathrooms")
     if banos:
         propiedades = propiedades.filter(bathrooms=banos)
 
-    parqueaderos = request.GET.get("parking_spaces")
+    parqueaderos = params.get("parking_spaces")
     if parqueaderos:
         propiedades = propiedades.filter(parking_spaces=parqueaderos)
 
-    area_min = request.GET.get("area_min")
-    area_max = request.GET.get("area_max")
+    area_min = params.get("area_min")
+    area_max = params.get("area_max")
     if area_min:
         propiedades = propiedades.filter(area_m2__gte=area_min)
     if area_max:
         propiedades = propiedades.filter(area_m2__lte=area_max)
 
-    tipo = request.GET.get("tipo")
+    tipo = params.get("tipo")
     if tipo:
         propiedades = propiedades.filter(property_type=tipo)
 
-    if request.GET.get("garaje") == "1":
+    estrato = params.get("estrato")
+    if estrato:
+        propiedades = propiedades.filter(estrato=estrato)
+
+    # Ya traducidos a ids por ``_interpretar`` (columnas indexadas, sin JOIN)
+    barrio = params.get("barrio")
+    if barrio:
+        propiedades = propiedades.filter(barrio_id=barrio)
+    municipio = params.get("municipio")
+    if municipio:
+        propiedades = propiedades.filter(municipio_id=municipio)
+
+    if params.get("garaje") == "1":
         propiedades = propiedades.filter(parking_spaces__gt=0)
-    if request.GET.get("mascotas") == "1":
+    if params.get("mascotas") == "1":
         propiedades = propiedades.filter(pets_allowed=True)
+    return propiedades
 
-    # Ordenamiento
-    orden = request.GET.get("orden")
-    mapping = {
-        "precio_asc": "price_cop",
-        "precio_desc": "-price_cop",
-        "area_asc": "area_m2",
-        "area_desc": "-area_m2",
-        "recientes": "-created_at",
-    }
-    if orden in mapping:
-        propiedades = propiedades.order_by(mapping[orden])
-    elif used_embeddings and ids_ranked:
-        when_list = [When(id=pk, then=pos) for pos, pk in enumerate(ids_ranked)]
-        propiedades = propiedades.order_by(Case(*when_list, output_field=IntegerField()))
-
-    # Prefetch media + paginación
-    media_prefetch = Prefetch('media', queryset=MediaPropiedad.objects.all())
-    propiedades = propiedades.prefetch_related(media_prefetch)
-
-    paginator = Paginator(propiedades, 12)
-    page = request.GET.get("page")
-    page_obj = paginator.get_page(page)
-
-    # Atributo portada por propiedad en la página
-    for propiedad in page_obj:
-        portada = None
-        for media in propiedad.media.all():
-            if getattr(media, "archivo", None):
-                portada = media.archivo.url
-                break
-            elif getattr(media, "url", None):
-                portada = media.url
+
+def _ubicacion_id(modelo, valor):
+    """Id del Barrio/Municipio de ``valor`` (slug o nombre, con errores de tipeo); 0 si no existe."""
+    if str(valor).isdigit():
+        return str(valor)
+    lugar = gazetteer.resolve(valor)
+    slug = lugar.slug if lugar is not None else valor
+    return str(modelo.objects.filter(slug=slug).values_list("pk", flat=True).first() or 0)
+
+
+def _interpretar(params):
+    """Separa de ``search`` los filtros escritos en el texto (ver ``search/query_parser.py``).
+
+    Devuelve (params, detectados): una copia de ``params`` con ``search``
+    reducido al texto residual y los filtros detectados que el formulario no
+    trae (lo que el usuario eligió en el formulario tiene prioridad), y esos
+    filtros detectados para mostrarlos. Si el texto era sólo filtros,
+    ``search`` queda vacío y la búsqueda es un listado filtrado.
+
+    ``barrio`` y ``municipio`` (del formulario o del texto) se traducen de
+    slug a id con el nomenclátor (ver ``search/gazetteer.py``).
+    """
+    search = params.get("search")
+    parsed = None
+    if search and getattr(settings, "SEARCH_PARSE_QUERY", True):
+        parsed = query_parser.parse(search)
+    ubicacion = [key for key in ("barrio", "municipio") if params.get(key)]
+    if not ubicacion and (parsed is None or not parsed.filters):
+        return params, {}
+    params = params.copy()
+    detectados = {}
+    if parsed is not None and parsed.filters:
+        for key, value in parsed.filters.items():
+            if not params.get(key):
+                params[key] = value
+                detectados[key] = value
+        params["search"] = parsed.text
+    for key, modelo in (("barrio", Barrio), ("municipio", Municipio)):
+        if params.get(key):
+            if key in detectados:
+                lugar = gazetteer.resolve(detectados[key], fuzzy=False)
+                detectados[key] = lugar.nombre if lugar is not None else detectados[key]
+            params[key] = _ubicacion_id(modelo, params[key])
+    return params, detectados
+
+
+def conteo_barrios():
+    """[{slug, nombre, municipio, total}] de los barrios con propiedades (cacheado).
+
+    Va en la cache de resultados, así que las señales de ``Propiedad`` lo
+    invalidan junto con las búsquedas.
+    """
+    def calcular():
+        filas = (
+            Barrio.objects.annotate(total=Count("propiedades")).filter(total__gt=0)
+            .order_by("-total", "nombre").values("slug", "nombre", "municipio__nombre", "total")
+        )
+        return [
+            {"slug": f["slug"], "nombre": f["nombre"], "municipio": f["municipio__nombre"], "total": f["total"]}
+            for f in filas
+        ], True
+    return result_cache.get_or_compute(result_cache.make_key("", None, None, extra="barrios"), calcular)
+
+
+def _candidatos_orden():
+    """Resultados más relevantes que se reordenan cuando la búsqueda lleva ``orden``."""
+    return getattr(settings, "SEARCH_SORT_CANDIDATES", CANDIDATOS_ORDEN)
+
+
+def _ids_busqueda(params, preferencia=None):
+    """Ids de la búsqueda ``params`` (todas las páginas, ya ordenados).
+
+    ``preferencia`` personaliza el ranking por relevancia del motor vectorial.
+    Devuelve (ids, cacheable): el fallback SQL por texto no se cachea, para
+    no fijar un resultado degradado mientras el motor no está disponible.
+    """
+    propiedades = Propiedad.objects.all()
+    cacheable = True
+
+    # Texto libre
+    search = params.get("search")
+    ids_ranked = []
+    used_embeddings = False
+    if search:
+        # Con un orden explícito (precio, fecha...) se ordenan los
+        # ``_candidatos_orden()`` más relevantes; el ranking completo sin orden
+        # va por ``_pagina_por_cursor``. Los filtros se aplican como máscara
+        # dentro del motor, antes del top-k, así que los candidatos ya los
+        # cumplen. Si el modelo falla, BM25 sigue dando un ranking sin cargarlo.
+        results = None
+        for motor, extra in ((emb_buscar, {"preferencia": preferencia}), (emb_lexico, {})):
+            if motor is None:
+                continue
+            try:
+                results = motor(search, top_k=_candidatos_orden(), filters=clean_filters(params), **extra)
                 break
-        propiedad.portada = portada
+            except Exception as e:
+                logging.warning("Falló la búsqueda %s: %s", getattr(motor, "__name__", motor), e)
+        if results is not None:
+            ids_ranked = [r.get("id") for r in results if r.get("id")]
+            used_embeddings = bool(ids_ranked)
+        else:
+            # Fallback a búsqueda SQL tradicional
+            cacheable = False
+            # Los barrios ya salieron del texto como filtro (``_interpretar``)
+            propiedades = propiedades.filter(
+                Q(title__icontains=search) |
+                Q(description__icontains=search)
+            )
+
+    propiedades = _filtrar(propiedades, params)
+
+    # Ordenamiento: explícito en SQL; por relevancia, el ranking se conserva
+    # en Python (sin un ORDER BY CASE con un WHEN por id)
+    orden = params.get("orden")
+    with metrics.span("filter_sql"):
+        if orden in ORDENES:
+            if used_embeddings:
+                propiedades = propiedades.filter(id__in=ids_ranked)
+            return list(propiedades.order_by(ORDENES[orden]).values_list("id", flat=True)), cacheable
+        if used_embeddings:
+            return hydrate.filter_ranked(ids_ranked, propiedades), cacheable
+        return list(propiedades.values_list("id", flat=True)), cacheable
+
+
+def _pagina_por_cursor(params, search, filters, preferencia=None):
+    """Página de una búsqueda por relevancia recorriendo el ranking con cursores.
+
+    No tiene el tope de 100 resultados: el motor amplía su ventana de
+    candidatos sólo cuando hace falta. Devuelve (propiedades, token de la
+    página siguiente o None, número de página), o None si el motor falló.
+    """
+    posicion, pagina = cursor.decode(params.get("cursor"))
+    key = result_cache.make_key(
+        search, filters, None, index_version=emb_version() if emb_version else None,
+        extra=[posicion, preferences.fingerprint(preferencia)],
+    )
+    try:
+        hits, siguiente = result_cache.get_or_compute(key, lambda: (
+            emb_pagina(search, limit=RESULTADOS_POR_PAGINA, cursor=posicion, filters=filters,
+                       preferencia=preferencia), True,
+        ))
+    except Exception as e:
+        logging.warning("Falló la búsqueda paginada: %s", e)
+        return None
+    with metrics.span("filter_sql"):
+        propiedades = hydrate.hydrate(
+            [h["id"] for h in hits], queryset=_filtrar(Propiedad.objects.all(), params),
+        )
+    token = cursor.encode(siguiente, pagina + 1) if siguiente else None
+    return propiedades, token, pagina
+
+
+@metrics.timed_view
+def buscar_propiedades(request):
+    """
+    Búsqueda de propiedades con:
+      - Texto libre (embeddings si está disponible; fallback a icontains).
+      - Filtros numéricos/categóricos.
+      - Ordenamiento estándar o preservando ranking de similitud.
+      - Paginación; las tarjetas usan la portada desnormalizada (sin media).
+
+    Ordenada por relevancia, la búsqueda se pagina con cursores sobre el
+    ranking completo (``?cursor=``). Con texto y un ``orden`` explícito, la
+    lista ordenada de ids se guarda en la cache de resultados (ver
+    ``search/result_cache.py``) y cada página sólo trae sus propiedades.
+    Sin texto es un listado filtrado paginado por keyset (``?cursor=``, ver
+    ``search/keyset.py``), con un total aproximado cacheado.
+    El ranking por relevancia se mezcla con el perfil de preferencias del
+    usuario (favoritos y vistas), que entra en la clave de cache.
+
+    Los filtros escritos en el texto ("2 habitaciones menos de 500
+    millones") se pasan a los filtros del formulario y sólo se codifica el
+    texto que sobra (ver ``_interpretar``).
+
+    Cada etapa se mide con ``metrics.span`` y sale en la cabecera
+    ``Server-Timing`` (ver ``search/metrics.py``).
+    """
+    texto = request.GET.get("search")
+    with metrics.span("parse"):
+        params, detectados = _interpretar(request.GET)
+    search = params.get("search")
+    orden = params.get("orden")
+    filters = clean_filters(params)
+    preferencia = preferences.preference_vector(request) if search and orden not in ORDENES else None
+
+    por_cursor = None
+    if search and emb_pagina is not None and orden not in ORDENES:
+        por_cursor = _pagina_por_cursor(params, search, filters, preferencia)
+
+    # Consultas populares para las sugerencias (sólo la primera página cuenta)
+    if texto and not request.GET.get("cursor") and not request.GET.get("page"):
+        try:
+            suggest.log_query(texto, request)
+        except Exception as e:
+            logging.warning("No se pudo registrar la consulta: %s", e)
+
+    listado = acotado = None
+    if por_cursor is not None:
+        page_obj, next_cursor, pagina = por_cursor
+    elif not search:
+        # Listado sin texto: keyset sobre la tabla filtrada (sin COUNT ni OFFSET)
+        next_cursor, pagina = None, None
+        with metrics.span("paginate"):
+            listado = page_obj = keyset.paginate(
+                _filtrar(Propiedad.objects.all(), params), ORDENES.get(orden, "-id"), RESULTADOS_POR_PAGINA,
+                token=params.get("cursor"), with_total=_conteos_aproximados(),
+            )
+    else:
+        next_cursor, pagina = None, None
+        key = result_cache.make_key(
+            search, filters, orden, index_version=emb_version() if emb_version and search else None,
+            extra=preferences.fingerprint(preferencia),
+        )
+        ids = result_cache.get_or_compute(key, lambda: _ids_busqueda(params, preferencia))
+        # El motor devolvió tantos candidatos como se le pidieron: hay más que no se ordenaron
+        acotado = _candidatos_orden() if orden in ORDENES and len(ids) == _candidatos_orden() else None
+
+        with metrics.span("paginate"):
+            paginator = Paginator(ids, RESULTADOS_POR_PAGINA)
+            page = params.get("page")
+            page_obj = paginator.get_page(page)
+
+        # Sólo las propiedades de la página actual, en el orden de la lista
+        with metrics.span("hydrate"):
+            page_obj.object_list = hydrate.hydrate(page_obj.object_list)
 
     # IDs de favoritos del usuario
     favorite_ids = []
@@ -677,17 +897,26 @@ def buscar_propiedades(request):
             Favorite.objects.filter(user=request.user).values_list('propiedad_id', flat=True)
         )
 
-    # Querystring sin 'page' para paginación limpia
-    params = request.GET.copy()
-    params.pop('page', None)
-    querystring = params.urlencode()
-
-    return render(request, "properties/buscar.html", {
-        "propiedades": page_obj,
-        "favorite_ids": favorite_ids,
-        "querystring": querystring,
-        "search_query": search or "",  # Pasar el término de búsqueda al template
-    })
+    # Querystring sin 'page' ni 'cursor' para paginación limpia
+    qs_params = request.GET.copy()
+    qs_params.pop('page', None)
+    qs_params.pop('cursor', None)
+    querystring = qs_params.urlencode()
+
+    with metrics.span("render"):
+        return render(request, "properties/buscar.html", {
+            "propiedades": page_obj,
+            "favorite_ids": favorite_ids,
+            "querystring": querystring,
+            "search_query": texto or "",  # Pasar el término de búsqueda al template
+            "filtros_detectados": [(FILTROS_DETECTADOS.get(k, k), v) for k, v in detectados.items()],
+            "cursor_mode": por_cursor is not None,
+            "next_cursor": next_cursor,
+            "pagina": pagina,
+            "listado": listado,
+            "acotado": acotado,
+            "barrios": conteo_barrios(),
+        })
 
 
 # =========================
@@ -704,6 +933,67 @@ def toggle_favorite(request, propiedad_id):
 
     if not created:
         favorite.delete()
+        preferences.record_favorite(request, propiedad.id, added=False)
         return JsonResponse({'status': 'removed'})
     else:
+        preferences.record_favorite(request, propiedad.id, added=True)
         return JsonResponse({'status': 'added'})
+
+
+def search_ready(request):
+    """Readiness del worker: 200 cuando índice y modelo ya están precalentados."""
+    info = warmup.status()
+    return JsonResponse(info, status=200 if warmup.is_ready() else 503)
+
+
+def search_suggest(request):
+    """Sugerencias para el buscador mientras se escribe (``?q=``, ``?limit=``).
+
+    Sale del índice de prefijos en memoria (``search/suggest.py``): no hace
+    consultas a la BD por pulsación.
+    """
+    try:
+        limit = int(request.GET.get("limit", 8))
+    except ValueError:
+        limit = 8
+    query = request.GET.get("q", "")
+    with metrics.span("suggest"):
+        suggestions = suggest.suggest(query, limit)
+    response = JsonResponse({"q": query, "suggestions": suggestions})
+    response["Cache-Control"] = "public, max-age=60"
+    return response
+
+
+def search_metrics(request):
+    """Métricas del buscador de este worker en formato Prometheus.
+
+    Histogramas por etapa, hit rate de las caches y tamaño del índice. Si
+    ``SEARCH_METRICS_TOKEN`` está definido se exige ``Authorization: Bearer``.
+    """
+    token = getattr(settings, "SEARCH_METRICS_TOKEN", None)
+    if token and request.headers.get("Authorization") != f"Bearer {token}":
+        return HttpResponse(status=403)
+
+    resultados = result_cache.stats()
+    caches = [({"cache": "results"}, resultados)]
+    indice = emb_metricas() if emb_metricas is not None else {}
+    consultas = indice.get("query_cache")
+    if consultas:
+        caches.append(({"cache": "query_embeddings"}, {
+            "hits": consultas["hits"] + consultas["disk_hits"], "misses": consultas["misses"],
+            "hit_rate": consultas["hit_rate"],
+        }))
+    extra = [
+        ("cache_hits_total", "counter", "Aciertos de cache.", [(labels, c["hits"]) for labels, c in caches]),
+        ("cache_misses_total", "counter", "Fallos de cache.", [(labels, c["misses"]) for labels, c in caches]),
+        ("cache_hit_ratio", "gauge", "Aciertos / consultas a la cache.", [(labels, c["hit_rate"]) for labels, c in caches]),
+        ("index_loaded", "gauge", "1 si este worker tiene el índice en memoria.", [({}, bool(indice.get("loaded")))]),
+        ("index_rows", "gauge", "Filas de la base del índice cargado.", [({}, indice.get("rows"))]),
+        ("index_delta_rows", "gauge", "Filas en el delta incremental.", [({}, indice.get("delta_rows"))]),
+        ("index_tombstones", "gauge", "Propiedades borradas pendientes de compactar.", [({}, indice.get("tombstones"))]),
+        ("index_bytes", "gauge", "Bytes de la matriz de embeddings cargada.", [({}, indice.get("bytes"))]),
+        ("index_info", "gauge", "Versión y precisión del índice cargado.", [
+            ({"version": indice.get("version") or "", "precision": indice.get("precision") or ""}, 1),
+        ] if indice.get("loaded") else []),
+    ]
+    return HttpResponse(metrics.render_prometheus(extra), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -144,30 +144,15 @@ def edit_profile(request):
 
 @login_required
 def favorites_list(request):
-    from django.db.models import Prefetch
-    from properties.models import MediaPropiedad, Propiedad
+    from properties.search import hydrate
     
-    # Obtener IDs de favoritos primero
+    # IDs de favoritos, el más reciente primero
     favorite_ids = list(
-        Favorite.objects.filter(user=request.user).values_list('propiedad_id', flat=True)
+        Favorite.objects.filter(user=request.user).order_by('-created_at', '-id').values_list('propiedad_id', flat=True)
     )
     
-    # Obtener las propiedades favoritas con sus medias
-    propiedades = Propiedad.objects.filter(id__in=favorite_ids)
-    media_prefetch = Prefetch('media', queryset=MediaPropiedad.objects.all())
-    propiedades = propiedades.prefetch_related(media_prefetch)
-    
-    # Agregar atributo portada a cada propiedad (igual que en home)
-    for propiedad in propiedades:
-        portada = None
-        for media in propiedad.media.all():  # type: ignore
-            if media.archivo:
-                portada = media.archivo.url
-                break
-            elif media.url:
-                portada = media.url
-                break
-        propiedad.portada = portada  # type: ignore
+    # Propiedades favoritas en ese orden (la portada ya viene en cada una)
+    propiedades = hydrate.hydrate(favorite_ids)
     
     return render(request, 'users/favorites.html', {
         'propiedades': propiedades,